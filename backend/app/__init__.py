@@ -97,7 +97,11 @@ def create_app(config_name='default'):
         return User.query.get(int(user_id))
     
     # 注册命令
-    from .commands import init_db_command
+    from .commands import (init_db_command, migrate_storage_command, migrate_layout_command,
+                           rotate_master_key_command)
     app.cli.add_command(init_db_command)
+    app.cli.add_command(migrate_storage_command)
+    app.cli.add_command(migrate_layout_command)
+    app.cli.add_command(rotate_master_key_command)
     
     return app 
\ No newline at end of file
@@ -1,9 +1,14 @@
 import click
+import time
+from flask import current_app
 from flask.cli import with_appcontext
+from sqlalchemy import or_
 from app import db
 from app.models.user import User
-from app.models.file import File
+from app.models.file import File, STORAGE_CHUNKED
+from app.models.blob import Blob
 from app.services.file_service import FileService
+from app.utils.migration import Checkpoint, Throttle, Progress
 from werkzeug.security import generate_password_hash
 import os
 
@@ -27,6 +32,146 @@ def init_db_command():
     
     click.echo('数据库初始化完成')
 
+def migration_options(f):
+    """后台迁移命令的公共参数"""
+    options = [
+        click.option('--batch-size', default=100, show_default=True, help='每批从数据库读取的文件数'),
+        click.option('--rate', default=20.0, show_default=True, help='读取限速（MB/秒），0 表示不限速'),
+        click.option('--pause', default=0.0, show_default=True, help='每个文件处理完后暂停的秒数'),
+        click.option('--limit', default=0, show_default=True, help='本次最多处理的文件数，0 表示不限制'),
+        click.option('--checkpoint', 'checkpoint_path', default=None, help='检查点文件路径'),
+        click.option('--restart', is_flag=True, help='忽略已有检查点，从头开始（会重试失败的文件）'),
+    ]
+    for option in reversed(options):
+        f = option(f)
+    return f
+
+def run_file_migration(name, condition, migrate, batch_size, rate, pause, limit,
+                       checkpoint_path, restart, model=File):
+    """按 ID 顺序分批执行在线迁移，限速、记录检查点并定期输出吞吐量
+
+    Args:
+        name: 迁移名称，用作默认检查点文件名
+        condition: 待迁移记录的查询条件
+        migrate: 迁移单条记录的函数 (record, throttle) -> (状态, 字节数)
+        model: 迁移的模型，默认为 File
+    """
+    checkpoint = Checkpoint(
+        checkpoint_path or os.path.join(current_app.config['TEMP_FOLDER'], f'{name}.json'),
+        restart=restart
+    )
+    throttle = Throttle(rate * 1024 * 1024)
+    progress = Progress(click.echo)
+    
+    label = '文件' if model is File else model.__name__.lower()
+    click.echo(f'从{label} ID {checkpoint.last_id} 之后开始迁移')
+    while not limit or progress.items < limit:
+        batch = model.query.filter(
+            model.id > checkpoint.last_id,
+            condition
+        ).order_by(model.id).limit(batch_size).all()
+        if not batch:
+            break
+            
+        for record in batch:
+            try:
+                status, size = migrate(record, throttle)
+                if status == 'skipped':
+                    click.echo(f'{label} {record.id} 在迁移期间被修改，已跳过')
+            except Exception as e:
+                click.echo(f"{label} {record.id} {getattr(record, 'filename', '')} 迁移失败: {str(e)}")
+                status, size = 'failed', 0
+                
+            checkpoint.record(record.id, status, size)
+            checkpoint.save()
+            progress.add(size)
+            
+            if pause:
+                time.sleep(pause)
+            if limit and progress.items >= limit:
+                break
+                
+    progress.report()
+    state = checkpoint.state
+    click.echo(f"迁移完成：成功 {state['done']}，跳过 {state['skipped']}，失败 {len(state['failed'])}")
+    if state['failed']:
+        click.echo(f"失败的{label} ID: {state['failed']}，可使用 --restart 重试")
+
+@click.command('migrate-storage')
+@migration_options
+@with_appcontext
+def migrate_storage_command(**options):
+    """把旧 CBC 格式的文件在线迁移为分块格式
+
+    可以在服务运行期间执行，中断后再次执行会从检查点继续。
+    迁移期间两种格式都可以正常读取。
+    """
+    file_service = FileService()
+    run_file_migration(
+        'migrate-storage',
+        or_(File.storage_format != STORAGE_CHUNKED, File.storage_format.is_(None)),
+        file_service.convert_to_chunked,
+        **options
+    )
+
+@click.command('migrate-layout')
+@migration_options
+@with_appcontext
+def migrate_layout_command(**options):
+    """把存储迁移到按哈希分级的目录布局（当前配置的存储后端）
+
+    1. 早期平铺在 blobs/ 下的 blob 移入存储后端的 ab/cd/<id>（本地存储仅改名）
+    2. 按用户目录存放的旧文件重新加密写入去重存储，然后删除原文件
+
+    blobs/ 下已分级存放的对象与 S3 存储使用相同的键，切换后端时可以直接整目录同步。
+
+    可以在服务运行期间执行，中断后再次执行会从检查点继续。
+    """
+    file_service = FileService()
+    blob_service = file_service.blob_service
+    
+    moved = 0
+    for blob in Blob.query.filter(Blob.storage_key.is_(None)).all():
+        try:
+            blob_service.relocate_legacy(blob)
+            moved += 1
+        except Exception as e:
+            click.echo(f'blob {blob.id} 移动失败: {str(e)}')
+    click.echo(f'已移动 {moved} 个平铺存放的 blob')
+    
+    run_file_migration(
+        'migrate-layout',
+        File.blob_id.is_(None),
+        file_service.move_to_blob_store,
+        **options
+    )
+
+@click.command('rotate-master-key')
+@migration_options
+@with_appcontext
+def rotate_master_key_command(**options):
+    """用当前主密钥（ACTIVE_MASTER_KEY_ID）重新包装所有 blob 的数据密钥
+
+    只修改数据库中的包装密钥，不读写文件内容，耗时与 blob 数量成正比。
+    早期直接用 AES_KEY 加密的 blob 会把 AES_KEY 作为数据密钥包装起来。
+    执行完成且没有失败后，可以从 MASTER_KEYS 中移除旧主密钥。
+    """
+    blob_service = FileService().blob_service
+    active_key_id = blob_service.keyring.active_key_id
+    
+    def rewrap(blob, throttle):
+        return blob_service.rewrap_key(blob), 0
+        
+    run_file_migration(
+        f'rotate-master-key-{active_key_id}',
+        or_(Blob.key_id != active_key_id, Blob.key_id.is_(None)),
+        rewrap,
+        model=Blob,
+        **options
+    )
+    remaining = Blob.query.filter(or_(Blob.key_id != active_key_id, Blob.key_id.is_(None))).count()
+    click.echo(f'仍使用旧主密钥的 blob: {remaining}')
+
 @click.command('reencrypt-files')
 @with_appcontext
 def reencrypt_files_command():
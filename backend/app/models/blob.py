@@ -0,0 +1,27 @@
+from app import db
+from datetime import datetime
+from app.models.file import STORAGE_CHUNKED
+
+class Blob(db.Model):
+    """按明文内容寻址的加密数据块，多个文件记录可以引用同一个 blob"""
+    __tablename__ = 'blobs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    content_hash = db.Column(db.String(64), unique=True, nullable=False)  # 明文 sha256
+    size = db.Column(db.BigInteger, nullable=False)  # 明文大小
+    # 存储后端中的不透明存储键，按固定两级哈希目录分布：ab/cd/<id>
+    storage_key = db.Column(db.String(64), unique=True)
+    # 早期以明文哈希平铺存放时的完整路径，迁移到 storage_key 后清空
+    legacy_path = db.Column('storage_path', db.String(255))
+    storage_format = db.Column(db.String(20), default=STORAGE_CHUNKED)
+    compression = db.Column(db.String(20), default='none', server_default='none')  # 加密前的压缩算法
+    # 信封加密：用主密钥包装后的数据密钥；为空表示早期直接用全局 AES_KEY 加密
+    wrapped_key = db.Column(db.String(128))
+    key_id = db.Column(db.String(64), index=True)  # 包装数据密钥的主密钥 ID
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # files 关系会由 File 模型的 backref 自动创建
+    
+    def __repr__(self):
+        return f'<Blob {self.content_hash[:12]} refs={self.ref_count}>'
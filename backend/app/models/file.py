@@ -1,16 +1,30 @@
 from app import db
 from datetime import datetime
 
+# 密文存储格式
+STORAGE_CBC = 'cbc'          # 旧格式：整文件 AES-CBC，固定 IV
+STORAGE_CHUNKED = 'chunked'  # 分块 AES-GCM 格式，可随机访问
+
+# 后台预览生成状态（为空表示该类型不预先生成）
+PREVIEW_PENDING = 'pending'
+PREVIEW_PROCESSING = 'processing'
+PREVIEW_READY = 'ready'
+PREVIEW_FAILED = 'failed'
+
 class File(db.Model):
     __tablename__ = 'files'
     
     id = db.Column(db.Integer, primary_key=True)
     filename = db.Column(db.String(255), nullable=False)
-    file_path = db.Column(db.String(255), nullable=False)
+    file_path = db.Column(db.String(255), nullable=False)  # 旧文件的本地路径；去重存储的文件记录 blob 的存储键
     file_type = db.Column(db.String(100))
-    file_size = db.Column(db.Integer)
+    file_size = db.Column(db.BigInteger)  # 明文大小
+    content_hash = db.Column(db.String(64), index=True)  # 明文 sha256
+    storage_format = db.Column(db.String(20), default=STORAGE_CBC, server_default=STORAGE_CBC)
+    blob_id = db.Column(db.Integer, db.ForeignKey('blobs.id'), index=True)  # 去重存储
     owner_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     is_public = db.Column(db.Boolean, default=False)
+    preview_status = db.Column(db.String(20))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, onupdate=datetime.utcnow)
     
@@ -21,4 +35,11 @@ class File(db.Model):
     
     # shares 关系会由 FileShare 模型的 backref 自动创建
 
-    permissions = db.relationship('FilePermission', backref='file', lazy='dynamic') 
\ No newline at end of file
+    permissions = db.relationship('FilePermission', backref='file', lazy='dynamic')
+    
+    blob = db.relationship('Blob', backref=db.backref('files', lazy='dynamic'))
+    
+    @property
+    def stored_format(self):
+        """实际密文的存储格式"""
+        return self.blob.storage_format if self.blob else self.storage_format 
\ No newline at end of file
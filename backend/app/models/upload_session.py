@@ -0,0 +1,29 @@
+from app import db
+from datetime import datetime
+
+class UploadSession(db.Model):
+    """分片上传会话：客户端可以并行、乱序上传分片，中断后继续"""
+    __tablename__ = 'upload_sessions'
+    
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    filename = db.Column(db.String(255), nullable=False)
+    total_size = db.Column(db.BigInteger, nullable=False)
+    chunk_size = db.Column(db.Integer, nullable=False)
+    content_hash = db.Column(db.String(64))  # 客户端声明的明文 sha256，提交时校验
+    status = db.Column(db.String(20), default='active')  # active / committing / committed
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    
+    @property
+    def total_chunks(self):
+        return max(1, -(-self.total_size // self.chunk_size))
+    
+    def expected_chunk_size(self, index):
+        """第 index 个分片应有的字节数"""
+        if index < self.total_chunks - 1:
+            return self.chunk_size
+        return self.total_size - self.chunk_size * (self.total_chunks - 1)
+    
+    def __repr__(self):
+        return f'<UploadSession {self.id} {self.filename} user={self.user_id}>'
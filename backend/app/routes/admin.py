@@ -3,11 +3,14 @@ from flask_login import current_user
 from app import db
 from app.models.user import User
 from app.models.file import File
+from app.services.file_service import FileService, content_flights
 from app.utils.auth import login_required  # 使用自定义的装饰器
+from app.utils.plaintext_cache import get_plaintext_cache
+from app.utils.preview_cache import get_preview_cache
 from functools import wraps
-import os
 
 bp = Blueprint('admin', __name__, url_prefix='/api/admin')
+file_service = FileService()
 
 def admin_required(f):
     """检查是否是管理员的装饰器"""
@@ -67,15 +70,18 @@ def delete_user(user_id):
         
     user = User.query.get_or_404(user_id)
     
-    # 删除用户的文件
+    # 记录用户文件占用的存储，删除记录后再释放
     files = File.query.filter_by(owner_id=user_id).all()
-    for file in files:
-        if os.path.exists(file.file_path):
-            os.remove(file.file_path)
+    storage_refs = [file_service.storage_ref(file) for file in files]
+    file_ids = [file.id for file in files]
     
     db.session.delete(user)
     db.session.commit()
     
+    file_service.discard_previews(*file_ids)
+    for storage_ref in storage_refs:
+        file_service.release_storage(storage_ref)
+    
     return jsonify({'message': '用户删除成功'})
 
 @bp.route('/stats', methods=['GET'])
@@ -92,4 +98,27 @@ def get_stats():
         'total_files': total_files,
         'total_size': total_size,
         'storage_usage': f'{total_size / (1024*1024*1024):.2f} GB'
-    }) 
\ No newline at end of file
+    })
+
+@bp.route('/cache', methods=['GET'])
+@login_required
+@admin_required
+def get_cache_stats():
+    """获取明文缓存、预览缓存和并发合并统计（计数只统计当前进程）"""
+    cache = get_plaintext_cache()
+    previews = get_preview_cache()
+    preview_stats = dict(previews.stats(), enabled=True) if previews else {'enabled': False}
+    if not cache:
+        return jsonify({'enabled': False, 'content_flights': content_flights.stats(), 'previews': preview_stats})
+    return jsonify(dict(cache.stats(), enabled=True, content_flights=content_flights.stats(),
+                        previews=preview_stats))
+
+@bp.route('/cache', methods=['DELETE'])
+@login_required
+@admin_required
+def clear_cache():
+    """清空明文缓存和预览缓存"""
+    for cache in (get_plaintext_cache(), get_preview_cache()):
+        if cache:
+            cache.clear()
+    return jsonify({'message': '缓存已清空'})
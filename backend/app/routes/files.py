@@ -1,17 +1,24 @@
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, request, jsonify, Response, stream_with_context, current_app
 from flask_login import current_user
 from app import db
 from app.models.file import File
 from app.models.permission import FilePermission
 from app.services.file_service import FileService
 from app.services.permission_service import PermissionService
-from app.services.preview_service import PreviewService
+from app.services.preview_service import PreviewService, IMAGE_EXTENSIONS, snap_image_width
 from app.services.log_service import LogService
 from app.services.share_service import ShareService
+from app.services.upload_service import UploadService
+from app.services.spreadsheet_service import SpreadsheetService, SPREADSHEET_EXTENSIONS, VersionConflict
+from app.services.text_service import TextService, is_text_file
+from app.services.document_service import DocumentService, DOCUMENT_EXTENSIONS
 from app.utils.auth import login_required  # 使用自定义的装饰器
 from app.models.operation_log import OperationLog
 from flask_jwt_extended import jwt_required
-import os
+from config import Config
+from urllib.parse import quote
+import mimetypes
+import re
 
 bp = Blueprint('files', __name__, url_prefix='/api/files')
 file_service = FileService()
@@ -19,6 +26,19 @@ permission_service = PermissionService()
 preview_service = PreviewService()
 log_service = LogService()
 share_service = ShareService()
+upload_service = UploadService()
+spreadsheet_service = SpreadsheetService()
+text_service = TextService()
+document_service = DocumentService()
+
+def _content_disposition(filename, as_attachment=True):
+    """生成支持中文文件名的 Content-Disposition 头"""
+    disposition = 'attachment' if as_attachment else 'inline'
+    try:
+        filename.encode('ascii')
+        return f'{disposition}; filename="{filename}"'
+    except UnicodeEncodeError:
+        return f"{disposition}; filename*=UTF-8''{quote(filename)}"
 
 @bp.route('/upload', methods=['POST'])
 @login_required
@@ -36,6 +56,160 @@ def upload_file():
         log_service.log_action('upload', 'file', saved_file.id, 
             details={'filename': saved_file.filename})
             
+        return jsonify({
+            'message': '文件上传成功',
+            'file': {
+                'id': saved_file.id,
+                'filename': saved_file.filename,
+                'file_type': saved_file.file_type,
+                'file_size': saved_file.file_size,
+                'preview_status': saved_file.preview_status
+            }
+        })
+    except Exception as e:
+        log_service.log_action('upload', 'file', None, 
+            status='failed', details={'error': str(e)})
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/upload/instant', methods=['POST'])
+@login_required
+def instant_upload():
+    """秒传：先提交文件哈希和大小，服务器已有相同内容时无需传输文件
+
+    请求: {filename, hash, size}；需要持有性证明时再附带 {token, proof}
+    返回: exists=false 时客户端走 /upload 正常上传；
+          返回 challenge 时客户端计算 [offset, offset+length) 的 sha256 作为 proof 再次提交
+    """
+    data = request.get_json() or {}
+    filename = data.get('filename') or ''
+    content_hash = str(data.get('hash') or '').lower()
+    size = data.get('size')
+    
+    if not filename:
+        return jsonify({'error': '没有文件名'}), 400
+    if not re.fullmatch(r'[0-9a-f]{64}', content_hash) or not isinstance(size, int) or size < 0:
+        return jsonify({'error': '文件哈希或大小无效'}), 400
+        
+    try:
+        user_id = request.current_user.id
+        blob = file_service.blob_service.find(content_hash, size)
+        if not blob:
+            return jsonify({'exists': False})
+            
+        if current_app.config['INSTANT_UPLOAD_REQUIRE_PROOF']:
+            if not data.get('proof'):
+                return jsonify({
+                    'exists': True,
+                    'challenge': file_service.make_upload_challenge(user_id, blob)
+                })
+            if not file_service.verify_upload_proof(user_id, blob, data.get('token', ''), data['proof']):
+                return jsonify({'error': '文件校验失败'}), 403
+                
+        saved_file = file_service.save_instant_file(filename, user_id, content_hash)
+        if not saved_file:
+            return jsonify({'exists': False})
+            
+        log_service.log_action('upload', 'file', saved_file.id,
+            details={'filename': saved_file.filename, 'instant': True})
+            
+        return jsonify({
+            'exists': True,
+            'message': '文件秒传成功',
+            'file': {
+                'id': saved_file.id,
+                'filename': saved_file.filename,
+                'file_type': saved_file.file_type,
+                'file_size': saved_file.file_size
+            }
+        })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 409
+    except Exception as e:
+        log_service.log_action('upload', 'file', None, 
+            status='failed', details={'error': str(e)})
+        return jsonify({'error': str(e)}), 500
+
+def _upload_session_info(session):
+    """上传会话的状态信息"""
+    received = upload_service.received_chunks(session)
+    return {
+        'session_id': session.id,
+        'filename': session.filename,
+        'total_size': session.total_size,
+        'chunk_size': session.chunk_size,
+        'total_chunks': session.total_chunks,
+        'received': received,
+        'missing': upload_service.missing_chunks(session),
+        'expires_at': session.expires_at.isoformat()
+    }
+
+@bp.route('/uploads', methods=['POST'])
+@login_required
+def create_upload_session():
+    """创建分片上传会话
+
+    请求: {filename, size, hash(可选，明文 sha256，提交时校验)}
+    """
+    data = request.get_json() or {}
+    filename = data.get('filename') or ''
+    size = data.get('size')
+    content_hash = data.get('hash')
+    
+    if not filename:
+        return jsonify({'error': '没有文件名'}), 400
+    if not isinstance(size, int) or size < 0:
+        return jsonify({'error': '文件大小无效'}), 400
+    if content_hash and not re.fullmatch(r'[0-9a-fA-F]{64}', content_hash):
+        return jsonify({'error': '文件哈希无效'}), 400
+        
+    try:
+        session = upload_service.create_session(
+            request.current_user.id, filename, size, content_hash
+        )
+        return jsonify(_upload_session_info(session)), 201
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/uploads/<session_id>', methods=['GET'])
+@login_required
+def get_upload_session(session_id):
+    """查询上传会话，返回已接收和缺失的分片"""
+    session = upload_service.get_session(session_id, request.current_user.id)
+    if not session:
+        return jsonify({'error': '上传会话不存在或已过期'}), 404
+    return jsonify(_upload_session_info(session))
+
+@bp.route('/uploads/<session_id>/chunks/<int:index>', methods=['PUT'])
+@login_required
+def put_upload_chunk(session_id, index):
+    """上传一个分片，请求体为分片的原始字节；分片可以并行、乱序、重复上传"""
+    session = upload_service.get_session(session_id, request.current_user.id)
+    if not session:
+        return jsonify({'error': '上传会话不存在或已过期'}), 404
+        
+    try:
+        upload_service.put_chunk(session, index, request.stream)
+        return jsonify({'message': '分片上传成功', 'index': index})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/uploads/<session_id>/commit', methods=['POST'])
+@login_required
+def commit_upload_session(session_id):
+    """所有分片上传完成后提交，合并加密保存并创建文件记录"""
+    session = upload_service.get_session(session_id, request.current_user.id)
+    if not session:
+        return jsonify({'error': '上传会话不存在或已过期'}), 404
+        
+    try:
+        saved_file = upload_service.commit(session)
+        log_service.log_action('upload', 'file', saved_file.id, 
+            details={'filename': saved_file.filename, 'chunked': True})
+            
         return jsonify({
             'message': '文件上传成功',
             'file': {
@@ -45,16 +219,334 @@ def upload_file():
                 'file_size': saved_file.file_size
             }
         })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 409
     except Exception as e:
         log_service.log_action('upload', 'file', None, 
             status='failed', details={'error': str(e)})
         return jsonify({'error': str(e)}), 500
 
+@bp.route('/uploads/<session_id>', methods=['DELETE'])
+@login_required
+def abort_upload_session(session_id):
+    """取消上传会话"""
+    session = upload_service.get_session(session_id, request.current_user.id)
+    if not session:
+        return jsonify({'error': '上传会话不存在或已过期'}), 404
+    upload_service.abort(session)
+    return jsonify({'message': '上传已取消'})
+
+def _check_read_access(file_id):
+    """检查分享码或登录用户的读权限，无权限时返回错误响应"""
+    share_code = request.args.get('shareCode')
+    
+    if share_code:
+        # 通过分享码访问
+        share = share_service.get_share_by_code(share_code)
+        if not share or share.file_id != file_id:
+            return jsonify({'error': '分享不存在或已过期'}), 404
+            
+        if share.is_expired:
+            return jsonify({'error': '分享已过期'}), 403
+    else:
+        # 直接访问需要验证权限
+        if not permission_service.can_read(current_user.id, file_id):
+            return jsonify({'error': '无权访问此文件'}), 403
+    return None
+
+def _file_etag(file):
+    """文件当前版本的 ETag"""
+    return file_service.content_version(file)
+
+def _not_modified(etag):
+    """客户端缓存的版本仍然有效时返回 304 响应，否则返回 None"""
+    if etag not in request.if_none_match:
+        return None
+    response = Response(status=304)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, max-age=3600'
+    return response
+
+def _send_image(data, mimetype, etag):
+    """发送渲染出的二进制图片，客户端可以用 ETag 协商缓存"""
+    response = Response(data, mimetype=mimetype)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, max-age=3600'
+    return response
+
+def _send_plaintext(file, as_attachment):
+    """流式发送解密后的文件内容，支持 Range / If-Range 断点续传"""
+    if not file_service.content_exists(file):
+        return jsonify({'error': '文件不存在'}), 404
+        
+    size = file_service.get_plain_size(file)
+    modified = file.updated_at or file.created_at
+    etag = _file_etag(file)
+    
+    # 只支持单个区间；If-Range 不匹配时按完整内容返回
+    byte_range = request.range
+    if byte_range and len(byte_range.ranges) != 1:
+        byte_range = None
+    if byte_range and request.headers.get('If-Range'):
+        if_range = request.if_range
+        if if_range.etag:
+            matched = if_range.etag == etag
+        else:
+            matched = bool(if_range.date and modified and
+                           modified.replace(microsecond=0) <= if_range.date.replace(tzinfo=None))
+        if not matched:
+            byte_range = None
+    
+    status = 200
+    start, end = 0, size
+    if byte_range:
+        bounds = byte_range.range_for_length(size)
+        if bounds is None:
+            response = Response(status=416)
+            response.headers['Content-Range'] = f'bytes */{size}'
+            return response
+        start, end = bounds
+        status = 206
+    
+    # 边解密边发送，只解密请求范围涉及的数据块
+    response = Response(
+        stream_with_context(file_service.iter_decrypted(file, start, end)),
+        status=status,
+        mimetype=mimetypes.guess_type(file.filename)[0] or 'application/octet-stream'
+    )
+    response.headers['Content-Disposition'] = _content_disposition(file.filename, as_attachment)
+    response.headers['Content-Length'] = str(end - start)
+    response.headers['Accept-Ranges'] = 'bytes'
+    if status == 206:
+        response.headers['Content-Range'] = f'bytes {start}-{end - 1}/{size}'
+    response.set_etag(etag)
+    if modified:
+        response.last_modified = modified
+    return response
+
 @bp.route('/download/<int:file_id>', methods=['GET'])
 def download_file(file_id):
     """下载文件"""
+    try:
+        error = _check_read_access(file_id)
+        if error:
+            return error
+        
+        file = File.query.get_or_404(file_id)
+        return _send_plaintext(file, as_attachment=True)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/<int:file_id>/stream', methods=['GET'])
+def stream_file(file_id):
+    """在线播放/查看文件原始内容，支持音视频拖动进度"""
+    try:
+        error = _check_read_access(file_id)
+        if error:
+            return error
+        
+        file = File.query.get_or_404(file_id)
+        return _send_plaintext(file, as_attachment=False)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/<int:file_id>/pdf', methods=['GET'])
+def get_pdf_info(file_id):
+    """获取 PDF 的页数和每页尺寸，前端据此按需加载可见页面"""
+    try:
+        error = _check_read_access(file_id)
+        if error:
+            return error
+        
+        file = File.query.get_or_404(file_id)
+        if not file.filename.lower().endswith('.pdf'):
+            return jsonify({'error': '不是 PDF 文件'}), 400
+        return jsonify(dict(preview_service.get_pdf_info(file), id=file.id, version=_file_etag(file)))
+    except Exception as e:
+        print(f"Error in get_pdf_info: {str(e)}")  # 调试日志
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/<int:file_id>/pdf/pages/<int:page>', methods=['GET'])
+def render_pdf_page(file_id, page):
+    """渲染 PDF 的单页为二进制图片，参数：scale（默认 1.0）、format（png / jpeg / webp）"""
+    try:
+        error = _check_read_access(file_id)
+        if error:
+            return error
+        
+        file = File.query.get_or_404(file_id)
+        if not file.filename.lower().endswith('.pdf'):
+            return jsonify({'error': '不是 PDF 文件'}), 400
+        
+        try:
+            scale = float(request.args.get('scale', 1.0))
+        except ValueError:
+            return jsonify({'error': 'scale 参数无效'}), 400
+        image_format = request.args.get('format', 'png').lower()
+        etag = f'{_file_etag(file)}-p{page}-{scale:g}-{image_format}'
+        not_modified = _not_modified(etag)
+        if not_modified:
+            return not_modified
+        
+        try:
+            data, mimetype = preview_service.render_pdf_page(file, page, scale, image_format)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        except IndexError as e:
+            return jsonify({'error': str(e)}), 404
+        return _send_image(data, mimetype, etag)
+    except Exception as e:
+        print(f"Error in render_pdf_page: {str(e)}")  # 调试日志
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/<int:file_id>/image', methods=['GET'])
+def render_image(file_id):
+    """获取缩小后的二进制图片预览，参数：width（默认 1024，向上取整到标准宽度）、format（jpeg / webp）
+
+    未指定 format 时，浏览器支持 WebP 则返回 WebP，否则返回 JPEG。
+    """
+    try:
+        error = _check_read_access(file_id)
+        if error:
+            return error
+        
+        file = File.query.get_or_404(file_id)
+        if not file.filename.lower().endswith(IMAGE_EXTENSIONS):
+            return jsonify({'error': '不是图片文件'}), 400
+        
+        try:
+            width = int(request.args.get('width', Config.IMAGE_PREVIEW_DEFAULT_WIDTH))
+        except ValueError:
+            return jsonify({'error': 'width 参数无效'}), 400
+        if width <= 0:
+            return jsonify({'error': 'width 参数无效'}), 400
+        image_format = request.args.get('format')
+        if not image_format:
+            image_format = 'webp' if 'image/webp' in request.headers.get('Accept', '') else 'jpeg'
+        image_format = image_format.lower()
+        etag = f'{_file_etag(file)}-w{snap_image_width(width)}-{image_format}'
+        not_modified = _not_modified(etag)
+        if not_modified:
+            return not_modified
+        
+        try:
+            data, mimetype = preview_service.render_image(file, width, image_format)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        response = _send_image(data, mimetype, etag)
+        response.vary.add('Accept')
+        return response
+    except Exception as e:
+        print(f"Error in render_image: {str(e)}")  # 调试日志
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/<int:file_id>/excel/sheets', methods=['GET'])
+def get_excel_sheets(file_id):
+    """获取表格的工作表列表（名称、数据行数、表头），前端据此按行窗口加载数据"""
+    try:
+        error = _check_read_access(file_id)
+        if error:
+            return error
+        
+        file = File.query.get_or_404(file_id)
+        if not file.filename.lower().endswith(SPREADSHEET_EXTENSIONS):
+            return jsonify({'error': '仅支持 xlsx 格式的表格'}), 400
+        etag = f'{_file_etag(file)}-sheets'
+        not_modified = _not_modified(etag)
+        if not_modified:
+            return not_modified
+        
+        sheets = [{'name': sheet['name'], 'rows': sheet['rows'], 'columns': sheet['columns']}
+                  for sheet in spreadsheet_service.get_sheets(file)]
+        response = jsonify({'id': file.id, 'version': _file_etag(file), 'sheets': sheets})
+        response.set_etag(etag)
+        return response
+    except Exception as e:
+        print(f"Error in get_excel_sheets: {str(e)}")  # 调试日志
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/<int:file_id>/excel/rows', methods=['GET'])
+def get_excel_rows(file_id):
+    """按行窗口读取工作表，参数：sheet（默认第一个）、offset（默认 0）、limit（默认 100）
+
+    返回的 rows 为二维数组，表头只在 columns 中返回一次。
+    """
+    try:
+        error = _check_read_access(file_id)
+        if error:
+            return error
+        
+        file = File.query.get_or_404(file_id)
+        if not file.filename.lower().endswith(SPREADSHEET_EXTENSIONS):
+            return jsonify({'error': '仅支持 xlsx 格式的表格'}), 400
+        
+        try:
+            offset = int(request.args.get('offset', 0))
+            limit = int(request.args.get('limit', Config.EXCEL_WINDOW_DEFAULT))
+        except ValueError:
+            return jsonify({'error': 'offset 或 limit 参数无效'}), 400
+        try:
+            sheet = spreadsheet_service.find_sheet(file, request.args.get('sheet'))
+        except KeyError as e:
+            return jsonify({'error': e.args[0]}), 404
+        etag = f'{_file_etag(file)}-s{sheet["index"]}-{offset}-{limit}'
+        not_modified = _not_modified(etag)
+        if not_modified:
+            return not_modified
+        
+        try:
+            window = spreadsheet_service.get_rows(file, sheet, offset, limit)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        response = jsonify(window)
+        response.set_etag(etag)
+        return response
+    except Exception as e:
+        print(f"Error in get_excel_rows: {str(e)}")  # 调试日志
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/<int:file_id>/excel/stats', methods=['GET'])
+def get_excel_column_stats(file_id):
+    """获取工作表每一列的统计信息，参数：sheet（默认第一个）"""
+    try:
+        error = _check_read_access(file_id)
+        if error:
+            return error
+        
+        file = File.query.get_or_404(file_id)
+        if not file.filename.lower().endswith(SPREADSHEET_EXTENSIONS):
+            return jsonify({'error': '仅支持 xlsx 格式的表格'}), 400
+        
+        try:
+            sheet = spreadsheet_service.find_sheet(file, request.args.get('sheet'))
+        except KeyError as e:
+            return jsonify({'error': e.args[0]}), 404
+        etag = f'{_file_etag(file)}-stats{sheet["index"]}'
+        not_modified = _not_modified(etag)
+        if not_modified:
+            return not_modified
+        
+        try:
+            stats = spreadsheet_service.get_column_stats(file, sheet)
+        except RuntimeError as e:
+            return jsonify({'error': str(e)}), 501
+        response = jsonify(stats)
+        response.set_etag(etag)
+        return response
+    except Exception as e:
+        print(f"Error in get_excel_column_stats: {str(e)}")  # 调试日志
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/<int:file_id>/excel/cells', methods=['PATCH'])
+def patch_excel_cells(file_id):
+    """按单元格修改表格，请求体：{"changes": [{"sheet", "row", "col", "value"}]}
+
+    行列号与 excel/rows 一致（row 为 -1 时修改表头）。可以用 If-Match 带上读取时的 ETag，
+    文件已被其他人修改时返回 412。stale_formulas 为结果受修改影响、需要在 Excel 中重新计算的公式数。
+    """
     try:
         share_code = request.args.get('shareCode')
+        user_id = None
         
         if share_code:
             # 通过分享码访问
@@ -64,18 +556,177 @@ def download_file(file_id):
                 
             if share.is_expired:
                 return jsonify({'error': '分享已过期'}), 403
+                
+            if not share.can_write:
+                return jsonify({'error': '无编辑权限'}), 403
         else:
             # 直接访问需要验证权限
-            if not permission_service.can_read(current_user.id, file_id):
-                return jsonify({'error': '无权访问此文件'}), 403
+            if not permission_service.can_write(current_user.id, file_id):
+                return jsonify({'error': '无权编辑此文件'}), 403
+            user_id = current_user.id
+        
+        file = File.query.get_or_404(file_id)
+        if not file.filename.lower().endswith(SPREADSHEET_EXTENSIONS):
+            return jsonify({'error': '仅支持 xlsx 格式的表格'}), 400
+        
+        body = request.get_json(silent=True) or {}
+        expected_version = next(iter(request.if_match), None)
+        try:
+            result = spreadsheet_service.patch_cells(
+                file, body.get('changes'), user_id=user_id, expected_version=expected_version
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        except KeyError as e:
+            return jsonify({'error': e.args[0]}), 404
+        except VersionConflict as e:
+            return jsonify({'error': str(e)}), 412
+        
+        response = jsonify({'message': '更新成功', **result, 'version': _file_etag(file)})
+        response.set_etag(_file_etag(file))
+        return response
+    except Exception as e:
+        print(f"Error in patch_excel_cells: {str(e)}")  # 调试日志
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/<int:file_id>/text', methods=['GET'])
+def get_text_lines(file_id):
+    """按行窗口读取文本文件，参数：offset（默认 0）、limit（默认 200）；或 tail（读取最后 tail 行）
+
+    首次访问时扫描一遍文件建立行索引，之后读取任意窗口只解密窗口附近的数据。
+    """
+    try:
+        error = _check_read_access(file_id)
+        if error:
+            return error
+        
+        file = File.query.get_or_404(file_id)
+        if not is_text_file(file):
+            return jsonify({'error': '仅支持文本文件'}), 400
+        
+        try:
+            offset = int(request.args.get('offset', 0))
+            limit = int(request.args.get('limit', Config.TEXT_WINDOW_DEFAULT))
+            tail = request.args.get('tail', type=int)
+        except ValueError:
+            return jsonify({'error': 'offset 或 limit 参数无效'}), 400
+        if tail is not None:
+            etag = f'{_file_etag(file)}-tail{tail}'
+        else:
+            etag = f'{_file_etag(file)}-l{offset}-{limit}'
+        not_modified = _not_modified(etag)
+        if not_modified:
+            return not_modified
+        
+        try:
+            window = text_service.get_lines(file, offset, limit, tail=tail)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        response = jsonify(window)
+        response.set_etag(etag)
+        return response
+    except Exception as e:
+        print(f"Error in get_text_lines: {str(e)}")  # 调试日志
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/<int:file_id>/word/blocks', methods=['GET'])
+def get_word_blocks(file_id):
+    """按块读取 Word 文档，参数：offset（默认 0）、limit（默认 50）
+
+    块为按正文顺序排列的段落和表格，格式与 /content 返回的 content 相同。
+    """
+    try:
+        error = _check_read_access(file_id)
+        if error:
+            return error
+        
+        file = File.query.get_or_404(file_id)
+        if not file.filename.lower().endswith(DOCUMENT_EXTENSIONS):
+            return jsonify({'error': '仅支持 docx 格式的文档'}), 400
+        
+        try:
+            offset = int(request.args.get('offset', 0))
+            limit = int(request.args.get('limit', Config.DOCX_WINDOW_DEFAULT))
+        except ValueError:
+            return jsonify({'error': 'offset 或 limit 参数无效'}), 400
+        etag = f'{_file_etag(file)}-b{offset}-{limit}'
+        not_modified = _not_modified(etag)
+        if not_modified:
+            return not_modified
+        
+        try:
+            window = document_service.get_blocks(file, offset, limit)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        response = jsonify(window)
+        response.set_etag(etag)
+        return response
+    except Exception as e:
+        print(f"Error in get_word_blocks: {str(e)}")  # 调试日志
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/<int:file_id>/image.dzi', methods=['GET'])
+def get_deepzoom_descriptor(file_id):
+    """获取大图的 DeepZoom 描述文件（DZI），瓦片地址为 image_files/<层级>/<列>_<行>.<格式>"""
+    try:
+        error = _check_read_access(file_id)
+        if error:
+            return error
         
         file = File.query.get_or_404(file_id)
-        return send_file(
-            file_service.get_decrypted_file_path(file),
-            as_attachment=True,
-            download_name=file.filename
+        if not file.filename.lower().endswith(IMAGE_EXTENSIONS):
+            return jsonify({'error': '不是图片文件'}), 400
+        etag = f'{_file_etag(file)}-dzi'
+        not_modified = _not_modified(etag)
+        if not_modified:
+            return not_modified
+        
+        try:
+            info = preview_service.get_deepzoom_info(file)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        xml = (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            f'<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" Format="{info["format"]}" '
+            f'Overlap="{info["overlap"]}" TileSize="{info["tile_size"]}">'
+            f'<Size Width="{info["width"]}" Height="{info["height"]}"/>'
+            '</Image>'
         )
+        response = Response(xml, mimetype='application/xml')
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, max-age=3600'
+        return response
     except Exception as e:
+        print(f"Error in get_deepzoom_descriptor: {str(e)}")  # 调试日志
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/<int:file_id>/image_files/<int:level>/<int:col>_<int:row>.<image_format>', methods=['GET'])
+def get_deepzoom_tile(file_id, level, col, row, image_format):
+    """获取 DeepZoom 金字塔中的一个瓦片"""
+    try:
+        error = _check_read_access(file_id)
+        if error:
+            return error
+        
+        file = File.query.get_or_404(file_id)
+        if not file.filename.lower().endswith(IMAGE_EXTENSIONS):
+            return jsonify({'error': '不是图片文件'}), 400
+        if image_format != Config.DEEPZOOM_FORMAT:
+            return jsonify({'error': f'不支持的瓦片格式: {image_format}'}), 404
+        etag = f'{_file_etag(file)}-dz{level}-{col}-{row}'
+        not_modified = _not_modified(etag)
+        if not_modified:
+            return not_modified
+        
+        try:
+            data, mimetype = preview_service.get_deepzoom_tile(file, level, col, row)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        except IndexError as e:
+            return jsonify({'error': str(e)}), 404
+        return _send_image(data, mimetype, etag)
+    except Exception as e:
+        print(f"Error in get_deepzoom_tile: {str(e)}")  # 调试日志
         return jsonify({'error': str(e)}), 500
 
 @bp.route('/list', methods=['GET'])
@@ -96,7 +747,8 @@ def list_files():
                 'file_type': file.file_type,
                 'file_size': file.file_size,
                 'created_at': file.created_at.isoformat() if file.created_at else None,
-                'is_public': file.is_public
+                'is_public': file.is_public,
+                'preview_status': file.preview_status
             } for file in owned_files]
         })
     except Exception as e:
@@ -113,9 +765,7 @@ def delete_file(file_id):
         return jsonify({'error': '没有权限删除此文件'}), 403
         
     try:
-        # 删除物理文件
-        if os.path.exists(file.file_path):
-            os.remove(file.file_path)
+        storage_ref = file_service.storage_ref(file)
 
         file_service.log_operation(
             user_id=file.owner_id,
@@ -128,6 +778,10 @@ def delete_file(file_id):
         # 删除数据库记录
         db.session.delete(file)
         db.session.commit()
+        
+        file_service.discard_previews(file_id)
+        # 释放存储（去重存储中最后一个引用时才删除密文）
+        file_service.release_storage(storage_ref)
         print('delete success')
             
         return jsonify({'message': '文件删除成功'})
@@ -191,6 +845,32 @@ def update_file(file_id):
             status='failed', details={'error': str(e)})
         return jsonify({'error': str(e)}), 500
 
+@bp.route('/<int:file_id>/rename', methods=['PUT'])
+@login_required
+def rename_file(file_id):
+    """重命名文件"""
+    data = request.get_json() or {}
+    filename = data.get('filename') or ''
+    if not filename.strip():
+        return jsonify({'error': '没有文件名'}), 400
+        
+    try:
+        file = File.query.get_or_404(file_id)
+        
+        # 检查权限
+        if file.owner_id != request.current_user.id:
+            return jsonify({'error': '没有权限修改此文件'}), 403
+            
+        file_service.rename_file(file, filename)
+        log_service.log_action('rename', 'file', file_id, 
+            details={'filename': file.filename})
+            
+        return jsonify({'message': '重命名成功', 'file': file_service.to_dict(file)})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 409
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @bp.route('/<int:file_id>', methods=['GET'])
 @login_required
 def get_file(file_id):
@@ -211,7 +891,8 @@ def get_file(file_id):
                 'created_at': file.created_at.isoformat() if file.updated_at else None,
                 'updated_at': file.updated_at.isoformat() if file.updated_at else None,
                 'is_public': file.is_public,
-                'owner_id': file.owner_id
+                'owner_id': file.owner_id,
+                'preview_status': file.preview_status
             }
         })
     except Exception as e:
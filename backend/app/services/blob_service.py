@@ -0,0 +1,227 @@
+import os
+import time
+import uuid
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models.blob import Blob
+from app.models.file import File, STORAGE_CHUNKED
+from app.storage import get_storage
+from app.utils.chunked_cipher import ChunkedCipher
+from app.utils.compression import resolve_codec
+from app.utils.keyring import KeyRing
+from app.utils.plaintext_cache import get_plaintext_cache, blob_cache_prefix
+from config import Config
+
+class BlobService:
+    """内容寻址的去重存储：相同明文只加密保存一份，按引用计数回收
+
+    引用计数的增减和 blob 的创建、删除都是数据库上的原子操作，
+    不依赖本机文件锁，多个 API 节点可以共享同一个存储后端。
+    """
+
+    STORE_RETRIES = 5
+
+    def __init__(self):
+        self.chunked = ChunkedCipher(Config.AES_KEY)
+        self.keyring = KeyRing.from_config(Config)
+
+    @property
+    def storage(self):
+        """当前配置的存储后端（路由模块中长期存在的服务实例也随配置切换）"""
+        return get_storage()
+
+    def new_storage_key(self):
+        """生成新的不透明存储键，前两级目录取自随机 ID，保证目录规模均匀且固定"""
+        blob_id = uuid.uuid4().hex
+        return f'{blob_id[:2]}/{blob_id[2:4]}/{blob_id}'
+
+    def find(self, content_hash, size=None):
+        """按明文哈希（和大小）查找已有的 blob"""
+        query = Blob.query.filter_by(content_hash=content_hash)
+        if size is not None:
+            query = query.filter_by(size=size)
+        return query.first()
+
+    def open(self, blob):
+        """打开 blob 的密文，返回可随机读取的只读文件对象"""
+        if blob.storage_key:
+            return self.storage.open_read(blob.storage_key)
+        # 早期平铺存放在本地的 blob，迁移前仍从原路径读取
+        return open(blob.legacy_path, 'rb')
+
+    def exists(self, blob):
+        if blob.storage_key:
+            return self.storage.exists(blob.storage_key)
+        return bool(blob.legacy_path) and os.path.exists(blob.legacy_path)
+
+    def data_key(self, blob):
+        """解开 blob 的数据密钥；早期未包装的 blob 直接使用全局 AES_KEY"""
+        if blob.wrapped_key:
+            return self.keyring.unwrap(blob.wrapped_key, blob.key_id)
+        return self.chunked.key
+
+    def cipher_for(self, blob):
+        """返回用 blob 自己的数据密钥初始化的分块加密器"""
+        if not blob.wrapped_key:
+            return self.chunked
+        return ChunkedCipher(self.data_key(blob))
+
+    def iter_decrypted(self, blob, start=0, end=None):
+        """逐块解密 blob 中 [start, end) 范围的明文"""
+        cipher = self.cipher_for(blob)
+        with self.open(blob) as f:
+            yield from cipher.decrypt_stream(f, start, end)
+
+    def acquire(self, content_hash):
+        """为已有 blob 增加一个引用，调用方负责在不再使用时 release
+
+        引用计数已降为 0 的 blob 正在被删除，不能再复用，此时返回 None。
+        """
+        blob = self.find(content_hash)
+        if not blob:
+            return None
+
+        # 原子自增，避免并发上传时丢失引用
+        updated = Blob.query.filter(Blob.id == blob.id, Blob.ref_count > 0).update(
+            {'ref_count': Blob.ref_count + 1}, synchronize_session=False
+        )
+        db.session.commit()
+        if not updated:
+            return None
+        db.session.refresh(blob)
+        return blob
+
+    def store(self, src, codec=None):
+        """加密保存明文流并返回持有一个引用的 blob
+
+        边加密边计算哈希直接写入新的存储键，内容已存在时删除刚写入的对象、只增加引用计数。
+        codec 为加密前使用的压缩算法，None 表示不压缩。
+        """
+        storage_key = self.new_storage_key()
+        codec = resolve_codec(codec)
+        data_key, wrapped_key, key_id = self.keyring.generate_data_key()
+        try:
+            with self.storage.open_write(storage_key) as f:
+                size, content_hash = ChunkedCipher(data_key).encrypt_stream(
+                    src, f, Config.STORAGE_CHUNK_SIZE, codec
+                )
+        except Exception as e:
+            print(f"Error in store blob: {str(e)}")
+            raise
+
+        try:
+            for attempt in range(self.STORE_RETRIES):
+                blob = self.acquire(content_hash)
+                if blob:
+                    self.storage.delete(storage_key)
+                    return blob
+
+                blob = Blob(
+                    content_hash=content_hash,
+                    size=size,
+                    storage_key=storage_key,
+                    storage_format=STORAGE_CHUNKED,
+                    compression=codec,
+                    wrapped_key=wrapped_key,
+                    key_id=key_id,
+                    ref_count=1
+                )
+                db.session.add(blob)
+                try:
+                    db.session.commit()
+                    return blob
+                except IntegrityError:
+                    # 其他请求同时保存了相同内容，或旧 blob 尚未删除完毕，稍后重新引用
+                    db.session.rollback()
+                    time.sleep(0.05 * (attempt + 1))
+            raise RuntimeError(f'保存内容失败，请稍后重试: {content_hash}')
+        except Exception as e:
+            print(f"Error in store blob: {str(e)}")
+            db.session.rollback()
+            self.storage.delete(storage_key)
+            raise
+
+    def rewrap_key(self, blob):
+        """用当前主密钥重新包装 blob 的数据密钥，只修改数据库，不读写密文
+
+        早期直接用全局 AES_KEY 加密的 blob 把 AES_KEY 作为数据密钥包装起来。
+
+        Returns:
+            done / skipped（期间已被其他进程修改）
+        """
+        wrapped_key, key_id = self.keyring.wrap(self.data_key(blob))
+        updated = Blob.query.filter(
+            Blob.id == blob.id,
+            Blob.wrapped_key == blob.wrapped_key if blob.wrapped_key else Blob.wrapped_key.is_(None)
+        ).update({'wrapped_key': wrapped_key, 'key_id': key_id}, synchronize_session=False)
+        db.session.commit()
+        return 'done' if updated else 'skipped'
+
+    def relocate_legacy(self, blob):
+        """把早期平铺存放在本地的 blob 迁入存储后端，返回存储键"""
+        db.session.refresh(blob)
+        if blob.storage_key:
+            return blob.storage_key
+
+        legacy_path = blob.legacy_path
+        storage_key = self.new_storage_key()
+        self.storage.put_file(legacy_path, storage_key)
+        try:
+            updated = Blob.query.filter_by(id=blob.id, storage_key=None).update(
+                {'storage_key': storage_key, 'legacy_path': None}, synchronize_session=False
+            )
+            if updated:
+                File.query.filter_by(blob_id=blob.id).update(
+                    {'file_path': storage_key}, synchronize_session=False
+                )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            self.storage.delete(storage_key)
+            raise
+
+        if not updated:
+            # 其他进程已经迁移了这个 blob
+            self.storage.delete(storage_key)
+            db.session.refresh(blob)
+            return blob.storage_key
+
+        db.session.refresh(blob)
+        if os.path.exists(legacy_path):
+            os.remove(legacy_path)
+        return storage_key
+
+    def release(self, blob_id):
+        """释放一个引用，最后一个引用释放时删除 blob 及其密文"""
+        try:
+            Blob.query.filter_by(id=blob_id).update(
+                {'ref_count': Blob.ref_count - 1}, synchronize_session=False
+            )
+            db.session.commit()
+
+            blob = db.session.get(Blob, blob_id)
+            if not blob:
+                return
+            db.session.refresh(blob)
+            if blob.ref_count > 0:
+                return
+
+            storage_key, legacy_path = blob.storage_key, blob.legacy_path
+            content_hash = blob.content_hash
+            # acquire 不会复用引用计数为 0 的 blob，按条件删除防止重复释放时误删
+            deleted = Blob.query.filter(Blob.id == blob_id, Blob.ref_count <= 0).delete()
+            db.session.commit()
+        except Exception as e:
+            print(f"Error in release blob: {str(e)}")
+            db.session.rollback()
+            raise
+
+        if not deleted:
+            return
+        cache = get_plaintext_cache()
+        if cache:
+            cache.discard(blob_cache_prefix(content_hash))
+        if storage_key:
+            self.storage.delete(storage_key)
+        elif legacy_path and os.path.exists(legacy_path):
+            os.remove(legacy_path)
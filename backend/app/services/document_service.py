@@ -0,0 +1,113 @@
+import json
+import docx
+from app.models.file import File
+from app.services.file_service import FileService
+from app.services.preview_engine import preview_handler
+from app.utils.docx_blocks import iter_blocks
+from app.utils.preview_cache import get_preview_cache, preview_key
+from config import Config
+
+# 支持按块读取的 Word 扩展名（python-docx 不支持旧的 .doc 格式）
+DOCUMENT_EXTENSIONS = ('.docx',)
+
+
+class DocumentService:
+    """Word 文档的按块读取
+
+    文档按段落和表格在正文中的顺序转换为块，每 DOCX_PAGE_BLOCKS 块一页加密写入预览缓存。
+    同一版本的文档只解析一次，之后读取任意范围的块只需读取对应的几页。
+    """
+
+    def __init__(self):
+        self.file_service = FileService()
+        self.engine = self.file_service.preview_engine
+
+    def get_info(self, file: File):
+        """获取文档的块数：{'total_blocks'}"""
+        return self.file_service.cached_preview(
+            file, 'docx-index',
+            lambda: self.file_service.rebuild_preview(file, 'docx', lambda: self._build_index(file))[0]
+        )
+
+    def get_blocks(self, file: File, offset=0, limit=None):
+        """读取 [offset, offset + limit) 范围内的块
+
+        Returns:
+            {'offset', 'limit', 'total_blocks', 'blocks'}
+        """
+        limit = Config.DOCX_WINDOW_DEFAULT if limit is None else limit
+        if offset < 0:
+            raise ValueError('offset 不能为负数')
+        if not 1 <= limit <= Config.DOCX_WINDOW_MAX:
+            raise ValueError(f'limit 应在 1 到 {Config.DOCX_WINDOW_MAX} 之间')
+
+        total = self.get_info(file)['total_blocks']
+        end = min(offset + limit, total)
+        blocks = []
+        if offset < end:
+            page_blocks = Config.DOCX_PAGE_BLOCKS
+            first_page, last_page = offset // page_blocks, (end - 1) // page_blocks
+            for page in range(first_page, last_page + 1):
+                blocks.extend(self._page(file, page))
+            start = offset - first_page * page_blocks
+            blocks = blocks[start:start + end - offset]
+
+        return {
+            'offset': offset,
+            'limit': limit,
+            'total_blocks': total,
+            'blocks': blocks
+        }
+
+    def _page_key(self, file, page):
+        version = self.file_service.content_version(file)
+        return preview_key(file.id, version, 'docx-page', [page])
+
+    def _page(self, file, page):
+        key = self._page_key(file, page)
+        cache = get_preview_cache()
+        data = cache.load(key) if cache else None
+        if data is None:
+            # 缓存未启用或分页已被淘汰：重新解析文档，同一版本的并发请求只解析一次
+            data = self.file_service.rebuild_preview(file, 'docx', lambda: self._build_index(file, want=page), key)[1]
+        return json.loads(data) if data else []
+
+    def _store_page(self, cache, file, number, page, want):
+        """把一页块写入预览缓存，是 want 页时返回编码后的数据"""
+        if not cache and want != number:
+            return None
+        data = json.dumps(page, ensure_ascii=False).encode('utf-8')
+        if cache:
+            cache.store(self._page_key(file, number), data, evict=False)
+        return data if want == number else None
+
+    def _build_index(self, file: File, want=None):
+        """在沙箱进程中解析文档，把所有块分页写入预览缓存
+
+        Returns:
+            (文档信息, 第 want 页 JSON 编码的块)
+        """
+        cache = get_preview_cache()
+        page_blocks = Config.DOCX_PAGE_BLOCKS
+        wanted = None
+        total = 0
+        page = []
+
+        for block in self.engine.run(file, 'docx-blocks'):
+            page.append(block)
+            total += 1
+            if len(page) == page_blocks:
+                wanted = self._store_page(cache, file, (total - 1) // page_blocks, page, want) or wanted
+                page = []
+        if page:
+            wanted = self._store_page(cache, file, (total - 1) // page_blocks, page, want) or wanted
+
+        if cache:
+            cache.evict()
+        return {'total_blocks': total}, wanted
+
+
+@preview_handler('word', 'docx-blocks')
+def _read_blocks(file_path):
+    """按正文顺序读取文档的所有块（在沙箱进程中执行）"""
+    return list(iter_blocks(docx.Document(file_path)))
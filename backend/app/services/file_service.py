@@ -1,8 +1,22 @@
 import os
+import functools
 from werkzeug.utils import secure_filename
 from app import db
-from app.models.file import File
+from app.models.file import File, STORAGE_CHUNKED
 from app.utils.crypto import AESCipher
+from app.utils.chunked_cipher import ChunkedCipher, is_chunked
+from app.utils.locks import dir_lock
+from app.services.blob_service import BlobService
+from app.utils.streams import IterReader
+from app.utils.migration import ThrottledReader
+from app.utils.singleflight import SingleFlight
+from app.utils.plaintext_cache import (get_plaintext_cache, cache_key, blob_cache_prefix,
+                                       path_cache_prefix)
+from app.utils.preview_cache import get_preview_cache, preview_key, preview_prefix
+from app.utils.encoding import read_text
+from app.utils.docx_blocks import iter_blocks
+from app.services.preview_queue import preview_queue
+from app.services.preview_engine import PreviewEngine, preview_handler
 from config import Config
 import magic
 import shutil
@@ -19,11 +33,23 @@ import docx  # 需要安装 python-docx
 from pdf2image import convert_from_path  # 需要安装 pdf2image
 import fitz  # 需要安装 PyMuPDF
 import io
+import hashlib
+import hmac
+import secrets
+from itsdangerous import URLSafeTimedSerializer, BadSignature
 from PIL import Image
 
+# 进程内共享：同一版本文件的并发内容解析只执行一次
+content_flights = SingleFlight()
+# 进程内共享：同一版本文件的整体重建（瓦片金字塔、表格和文档分页）只执行一次
+rebuild_flights = SingleFlight()
+
 class FileService:
     def __init__(self):
         self.aes = AESCipher(Config.AES_KEY, Config.AES_IV)
+        self.chunked = ChunkedCipher(Config.AES_KEY)
+        self.blob_service = BlobService()
+        self.preview_engine = PreviewEngine(self)
         
     def secure_filename_with_chinese(self, filename):
         """安全的文件名处理，支持中文"""
@@ -64,6 +90,200 @@ class FileService:
             print(f"Error logging operation: {str(e)}")
             db.session.rollback()
         
+    def storage_ref(self, file):
+        """返回文件占用的存储引用：(blob_id, 旧文件路径)
+
+        删除或替换文件记录并提交后，再交给 release_storage 释放。
+        """
+        if file.blob_id:
+            return file.blob_id, None
+        return None, file.file_path
+        
+    def release_storage(self, ref):
+        """释放 storage_ref 返回的存储引用"""
+        blob_id, legacy_path = ref
+        if blob_id:
+            self.blob_service.release(blob_id)
+            return
+        cache = get_plaintext_cache()
+        if cache and legacy_path:
+            cache.discard(path_cache_prefix(legacy_path))
+        if legacy_path and os.path.exists(legacy_path):
+            with dir_lock(os.path.dirname(legacy_path)):
+                if os.path.exists(legacy_path):
+                    os.remove(legacy_path)
+        
+    def replace_content(self, file, src):
+        """用新的明文流替换文件内容
+
+        内容写入（或复用）去重存储中的 blob，提交成功后再释放旧的存储。
+        """
+        blob = self.blob_service.store(src, self.compression_for(file.filename))
+        old_ref = self.storage_ref(file)
+        try:
+            file.blob = blob
+            file.file_path = blob.storage_key
+            file.storage_format = blob.storage_format
+            file.file_size = blob.size
+            file.content_hash = blob.content_hash
+            file.updated_at = datetime.utcnow()
+            preview_queue.prepare(file)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            self.blob_service.release(blob.id)
+            raise
+            
+        self.discard_previews(file.id)
+        self.release_storage(old_ref)
+        preview_queue.submit(file)
+        return file
+        
+    def discard_previews(self, *file_ids):
+        """删除文件的所有预览缓存（内容更新或文件删除后调用），多个文件只扫描一次缓存目录
+
+        预览数据解密后可能放在明文缓存中（例如表格的 Arrow 文件），一并删除。
+        """
+        if not file_ids:
+            return
+        prefixes = tuple(preview_prefix(file_id) for file_id in file_ids)
+        for cache in (get_preview_cache(), get_plaintext_cache()):
+            if cache:
+                cache.discard(prefixes)
+        
+    def convert_to_chunked(self, file, throttle=None):
+        """把旧 CBC 格式的文件在线转换为分块格式
+
+        转换期间文件仍可正常读写；如果转换过程中文件被用户改写，
+        放弃本次结果（用户写入的新内容已经是分块格式）。
+
+        Args:
+            file: 文件记录
+            throttle: 可选的 Throttle，用于限制读取速度
+
+        Returns:
+            (状态, 明文字节数)，状态为 done / skipped
+        """
+        file_path = file.file_path
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"Original file not found: {file_path}")
+            
+        # 只有记录未被用户改写时才更新，避免覆盖并发写入的结果
+        unchanged = File.query.filter(
+            File.id == file.id,
+            File.updated_at == file.updated_at if file.updated_at else File.updated_at.is_(None)
+        )
+        
+        before = os.stat(file_path)
+        with open(file_path, 'rb') as f:
+            reader = self._open_chunked(f, file) if is_chunked(f) else None
+            if reader:
+                # 磁盘上已是新格式（例如上次在替换后、提交前中断），只需补齐记录
+                unchanged.update({
+                    'storage_format': STORAGE_CHUNKED,
+                    'file_size': reader.size
+                }, synchronize_session=False)
+                db.session.commit()
+                return 'done', reader.size
+                
+        temp_path = f'{file_path}.{os.getpid()}.migrate.tmp'
+        try:
+            with open(file_path, 'rb') as src, open(temp_path, 'wb') as dst:
+                writer = self.chunked.writer(dst, Config.STORAGE_CHUNK_SIZE)
+                for chunk in self.aes.decrypt_stream(src, Config.STREAM_CHUNK_SIZE):
+                    writer.write(chunk)
+                    if throttle:
+                        throttle.consume(len(chunk))
+                size, content_hash = writer.close()
+                
+            if file.content_hash and file.content_hash != content_hash:
+                raise ValueError(f'明文哈希校验失败: {file.filename}')
+                
+            with dir_lock(os.path.dirname(file_path)):
+                after = os.stat(file_path)
+                if (after.st_ino, after.st_mtime_ns) != (before.st_ino, before.st_mtime_ns):
+                    return 'skipped', 0
+                os.replace(temp_path, file_path)
+                
+            unchanged.update({
+                'storage_format': STORAGE_CHUNKED,
+                'file_size': size,
+                'content_hash': content_hash
+            }, synchronize_session=False)
+            db.session.commit()
+            return 'done', size
+        except Exception:
+            db.session.rollback()
+            raise
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        
+    def move_to_blob_store(self, file, throttle=None):
+        """把旧的按用户目录存放的文件迁入去重存储（分级目录、分块格式）
+
+        与 convert_to_chunked 一样可以在线执行：只有记录在迁移期间未被改写时才切换，
+        否则丢弃本次结果。
+
+        Returns:
+            (状态, 明文字节数)，状态为 done / skipped
+        """
+        legacy_path = file.file_path
+        reader = IterReader(self.iter_decrypted(file))
+        if throttle:
+            reader = ThrottledReader(reader, throttle)
+        blob = self.blob_service.store(reader, self.compression_for(file.filename))
+        
+        try:
+            if file.content_hash and file.content_hash != blob.content_hash:
+                raise ValueError(f'明文哈希校验失败: {file.filename}')
+                
+            updated = File.query.filter(
+                File.id == file.id,
+                File.blob_id.is_(None),
+                File.updated_at == file.updated_at if file.updated_at else File.updated_at.is_(None)
+            ).update({
+                'blob_id': blob.id,
+                'file_path': blob.storage_key,
+                'storage_format': blob.storage_format,
+                'file_size': blob.size,
+                'content_hash': blob.content_hash
+            }, synchronize_session=False)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            self.blob_service.release(blob.id)
+            raise
+            
+        if not updated:
+            self.blob_service.release(blob.id)
+            return 'skipped', 0
+            
+        self.release_storage((None, legacy_path))
+        return 'done', blob.size
+        
+    def rename_file(self, file, new_filename):
+        """重命名文件：只修改数据库记录，不涉及存储"""
+        filename = self.secure_filename_with_chinese(new_filename)
+        if filename == file.filename:
+            return file
+        self.check_duplicate_name(filename, file.owner_id)
+        
+        old_filename = file.filename
+        extension = os.path.splitext(filename.lower())[1]
+        if extension != os.path.splitext(old_filename.lower())[1]:
+            file.file_type = self.get_friendly_file_type(extension)
+        file.filename = filename
+        db.session.commit()
+        
+        self.log_operation(
+            user_id=file.owner_id,
+            file_id=file.id,
+            operation_type='rename',
+            operation_detail=f'重命名文件：{old_filename} -> {filename}'
+        )
+        return file
+        
     def save_file(self, file, user_id):
         """保存上传的文件"""
         try:
@@ -74,64 +294,123 @@ class FileService:
             # 根据文件扩展名设置用户友好的文件类型
             file_type = self.get_friendly_file_type(file_extension)
             
-            # 创建用户的存储目录
-            user_dir = os.path.join(Config.UPLOAD_FOLDER, str(user_id))
-            if not os.path.exists(user_dir):
-                os.makedirs(user_dir)
+            self.check_duplicate_name(filename, user_id)
             
-            # 检查文件名是否已存在（在数据库中）
-            existing_file = File.query.filter_by(
-                owner_id=user_id,
-                filename=filename
-            ).first()
+            # 分块流式加密写入去重存储，相同内容只保存一份
+            blob = self.blob_service.store(file, self.compression_for(filename))
             
-            if existing_file:
-                raise ValueError(f'已存在同名文件：{filename}')
-            
-            # 设置文件保存路径
-            file_path = os.path.join(user_dir, filename)
-            
-            try:
-                # 直接加密并保存文件对象
-                encrypted_data = self.aes.encrypt_file(file)
-                with open(file_path, 'wb') as f:
-                    f.write(encrypted_data)
-            except Exception as e:
-                print(f"Error encrypting and saving file: {str(e)}")
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-                raise
+            return self.create_file_record(filename, file_type, blob, user_id)
+        except ValueError as e:
+            # 文件名重复错误
+            print(f"Duplicate filename error: {str(e)}")
+            raise
+        except Exception as e:
+            print(f"Error in save_file: {str(e)}")
+            db.session.rollback()
+            raise
+        
+    def compression_for(self, filename):
+        """按文件类型选择加密前的压缩算法：图片、音视频、压缩包等已压缩的格式不再压缩"""
+        if not Config.COMPRESSION_ENABLED:
+            return None
+        extension = os.path.splitext(filename.lower())[1]
+        if extension in Config.COMPRESSION_SKIP_EXTENSIONS:
+            return None
+        return Config.COMPRESSION_CODEC
+        
+    def check_duplicate_name(self, filename, user_id):
+        """检查文件名是否已存在（在数据库中）"""
+        existing_file = File.query.filter_by(
+            owner_id=user_id,
+            filename=filename
+        ).first()
+        
+        if existing_file:
+            raise ValueError(f'已存在同名文件：{filename}')
             
-            # 创建文件记录
+    def create_file_record(self, filename, file_type, blob, user_id):
+        """为已持有引用的 blob 创建文件记录，失败时释放引用"""
+        try:
             db_file = File(
                 filename=filename,
-                file_path=file_path,
+                file_path=blob.storage_key,
                 file_type=file_type,
-                file_size=os.path.getsize(file_path),
+                file_size=blob.size,
+                content_hash=blob.content_hash,
+                storage_format=blob.storage_format,
+                blob=blob,
                 owner_id=int(user_id)
             )
+            preview_queue.prepare(db_file)
             
             db.session.add(db_file)
             db.session.commit()
-            
-            # 记录上传操作
-            self.log_operation(
-                user_id=user_id,
-                file_id=db_file.id,
-                operation_type='upload',
-                operation_detail=f'上传文件：{filename}'
-            )
-            
-            return db_file
-        except ValueError as e:
-            # 文件名重复错误
-            print(f"Duplicate filename error: {str(e)}")
-            raise
-        except Exception as e:
-            print(f"Error in save_file: {str(e)}")
+        except Exception:
             db.session.rollback()
+            self.blob_service.release(blob.id)
             raise
         
+        # 后台预先生成预览
+        preview_queue.submit(db_file)
+        
+        # 记录上传操作
+        self.log_operation(
+            user_id=user_id,
+            file_id=db_file.id,
+            operation_type='upload',
+            operation_detail=f'上传文件：{filename}'
+        )
+        
+        return db_file
+        
+    def _challenge_serializer(self):
+        return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt='instant-upload')
+        
+    def make_upload_challenge(self, user_id, blob):
+        """生成秒传的持有性证明挑战：要求客户端计算文件中随机区间的 sha256"""
+        length = min(Config.INSTANT_UPLOAD_PROOF_SIZE, blob.size)
+        offset = secrets.randbelow(blob.size - length + 1)
+        token = self._challenge_serializer().dumps({
+            'user_id': int(user_id),
+            'hash': blob.content_hash,
+            'offset': offset,
+            'length': length
+        })
+        return {'offset': offset, 'length': length, 'token': token}
+        
+    def verify_upload_proof(self, user_id, blob, token, proof):
+        """校验秒传挑战的应答，只解密挑战区间涉及的数据块"""
+        try:
+            challenge = self._challenge_serializer().loads(
+                token, max_age=Config.INSTANT_UPLOAD_CHALLENGE_TTL
+            )
+        except BadSignature:
+            return False
+            
+        if challenge['user_id'] != int(user_id) or challenge['hash'] != blob.content_hash:
+            return False
+            
+        digest = hashlib.sha256()
+        start = challenge['offset']
+        for chunk in self.blob_service.iter_decrypted(blob, start, start + challenge['length']):
+            digest.update(chunk)
+        return hmac.compare_digest(digest.hexdigest(), str(proof).lower())
+        
+    def save_instant_file(self, filename, user_id, content_hash):
+        """秒传：引用已有内容直接创建文件记录，不传输文件数据
+
+        Returns:
+            新的文件记录；内容在此期间被删除时返回 None，客户端需要正常上传
+        """
+        filename = self.secure_filename_with_chinese(filename)
+        file_type = self.get_friendly_file_type(os.path.splitext(filename.lower())[1])
+        self.check_duplicate_name(filename, user_id)
+        
+        blob = self.blob_service.acquire(content_hash)
+        if not blob:
+            return None
+        return self.create_file_record(filename, file_type, blob, user_id)
+        
     def get_friendly_file_type(self, extension):
         """获取用户友好的文件类型显示"""
         type_map = {
@@ -154,40 +433,195 @@ class FileService:
         
         return type_map.get(extension.lower(), '其他文件')
         
+    def _open_chunked(self, f, file):
+        """识别密文格式，分块格式返回解密器，旧 CBC 格式返回 None
+
+        后台迁移期间数据库记录可能短暂落后于磁盘，记录为旧格式时以文件头为准。
+        """
+        cipher = self.blob_service.cipher_for(file.blob) if file.blob else self.chunked
+        if file.stored_format == STORAGE_CHUNKED:
+            return cipher.reader(f)
+        if not is_chunked(f):
+            return None
+        try:
+            return cipher.reader(f)
+        except ValueError:
+            # 旧格式密文恰好以相同的 magic 开头
+            return None
+        
+    def open_stored(self, file):
+        """打开文件的密文：去重存储中的文件经由存储后端读取，旧文件读取本地路径"""
+        if file.blob:
+            return self.blob_service.open(file.blob)
+        if not os.path.exists(file.file_path):
+            raise FileNotFoundError(f"Original file not found: {file.file_path}")
+        return open(file.file_path, 'rb')
+        
+    def content_exists(self, file):
+        """文件的密文是否存在"""
+        if file.blob:
+            return self.blob_service.exists(file.blob)
+        return os.path.exists(file.file_path)
+        
+    def get_plain_size(self, file):
+        """获取文件的明文大小（只读取文件头尾，不解密全文）"""
+        with self.open_stored(file) as f:
+            reader = self._open_chunked(f, file)
+            if reader:
+                return reader.size
+            return self.aes.plaintext_size(f)
+        
+    def content_version(self, file):
+        """文件当前内容的版本：优先使用明文哈希，旧文件使用修改时间"""
+        modified = file.updated_at or file.created_at
+        return file.content_hash or f'{file.id}-{int(modified.timestamp()) if modified else 0}'
+        
+    def cached_preview(self, file, handler, render, params=None, as_json=True):
+        """读取或生成文件当前版本的预览结果
+
+        Args:
+            handler: 处理器名，与 params 一起区分同一文件的不同渲染结果
+            render: 未命中时调用，生成结果（as_json 为 False 时必须返回 bytes）
+        """
+        cache = get_preview_cache()
+        if not cache:
+            return render()
+        key = preview_key(file.id, self.content_version(file), handler, params)
+        if as_json:
+            return cache.get_or_render_json(key, render)
+        return cache.get_or_render(key, render)
+        
+    def rebuild_preview(self, file, handler, build, key=None):
+        """重新生成分片保存的预览（瓦片、分页），build() 把所有分片写入预览缓存
+
+        缓存中的分片被淘汰后，同时到达的请求（例如查看器一次请求的几十个瓦片）
+        合并为一次重建，其余请求等待重建完成后从缓存读取 key 对应的分片。
+
+        Args:
+            build: 返回 (描述信息, 本次调用需要的分片数据)
+            key: 本次调用需要的分片在预览缓存中的键
+
+        Returns:
+            (描述信息, key 对应的分片数据)
+        """
+        cache = get_preview_cache()
+        if not cache:
+            # 没有缓存可以共享分片，各自重建
+            return build()
+        executed = []
+
+        def run():
+            executed.append(True)
+            return build()
+
+        info, data = rebuild_flights.do((handler, file.id, self.content_version(file)), run)
+        if executed or key is None:
+            return info, data
+        data = cache.load(key)
+        if data is None:
+            # 分片刚写入就被淘汰
+            return build()
+        return info, data
+        
+    def cache_key(self, file):
+        """明文缓存键：去重存储的文件以内容哈希为版本，旧文件以密文路径和修改时间为版本"""
+        if file.blob:
+            return cache_key(blob_cache_prefix(file.blob.content_hash), filename=file.filename)
+        version = os.stat(file.file_path).st_mtime_ns
+        return cache_key(path_cache_prefix(file.file_path), version, file.filename)
+        
+    def iter_decrypted(self, file, start=0, end=None):
+        """逐块读取 [start, end) 范围内的文件明文，用于流式下载
+
+        明文缓存命中时直接读取缓存，否则逐块解密，不在磁盘上落地明文。
+        """
+        cache = get_plaintext_cache()
+        cached = None
+        if cache:
+            produce = None
+            if (file.file_size is not None and file.file_size <= Config.PLAINTEXT_CACHE_STREAM_FILL_SIZE
+                    and cache.accepts(file.file_size)):
+                produce = functools.partial(self._decrypt_range, file)
+            try:
+                cached = cache.open(self.cache_key(file), produce, size=file.file_size)
+            except OSError as e:
+                # 缓存目录空间不足时直接解密
+                print(f"Error in fill plaintext cache: {str(e)}")  # 调试日志
+        if cached:
+            with cached:
+                cached.seek(start)
+                remaining = float('inf') if end is None else end - start
+                while remaining > 0:
+                    chunk = cached.read(min(remaining, Config.STREAM_CHUNK_SIZE))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    yield chunk
+            return
+        yield from self._decrypt_range(file, start, end)
+        
+    def _decrypt_range(self, file, start=0, end=None):
+        """逐块解密 [start, end) 范围内的密文"""
+        with self.open_stored(file) as f:
+            reader = self._open_chunked(f, file)
+            if reader:
+                yield from reader.iter_range(start, end)
+            elif start == 0 and end is None:
+                yield from self.aes.decrypt_stream(f, Config.STREAM_CHUNK_SIZE)
+            else:
+                size = self.aes.plaintext_size(f)
+                end = size if end is None else min(end, size)
+                yield from self.aes.decrypt_range(f, start, end, Config.STREAM_CHUNK_SIZE)
+        
     def get_decrypted_file_path(self, file):
-        """获取解密后的临时文件路径"""
+        """获取解密后的文件路径
+
+        启用明文缓存时返回缓存中的文件，重复读取不再解密；否则解密到临时目录。
+        调用方使用完毕后都需要调用 remove_decrypted_file 清理。
+        """
         try:
             print(f"Decrypting file: {file.filename}")  # 调试日志
             
             # 检查原始文件是否存在
-            if not os.path.exists(file.file_path):
+            if not self.content_exists(file):
                 raise FileNotFoundError(f"Original file not found: {file.file_path}")
             
+            cache = get_plaintext_cache()
+            if cache:
+                size = file.file_size if file.file_size is not None else self.get_plain_size(file)
+                # 大文件不放入缓存，避免挤占 tmpfs；写入失败（例如空间不足）时改为解密到临时目录
+                if cache.accepts(size):
+                    try:
+                        return cache.get_or_create(self.cache_key(file), lambda: self._decrypt_range(file), size)
+                    except OSError as e:
+                        print(f"Error in fill plaintext cache: {str(e)}")  # 调试日志
+            
             # 创建临时文件
-            temp_dir = tempfile.mkdtemp()
+            temp_dir = tempfile.mkdtemp(dir=Config.TEMP_FOLDER)
             temp_path = os.path.join(temp_dir, file.filename)
             
-            print(f"Reading encrypted file from: {file.file_path}")  # 调试日志
-            
-            # 读取加密文件
-            with open(file.file_path, 'rb') as f:
-                encrypted_data = f.read()
-            
-            print(f"Decrypting data of size: {len(encrypted_data)}")  # 调试日志
-            
-            # 解密文件
-            decrypted_data = self.aes.decrypt_file(encrypted_data)
-            
             print(f"Writing decrypted file to: {temp_path}")  # 调试日志
             
-            # 保存解密后的临时文件
-            with open(temp_path, 'wb') as f:
-                f.write(decrypted_data)
+            # 分块解密写入临时文件
+            try:
+                with open(temp_path, 'wb') as f:
+                    for chunk in self.iter_decrypted(file):
+                        f.write(chunk)
+            except Exception:
+                shutil.rmtree(temp_dir, ignore_errors=True)
+                raise
             
             return temp_path
         except Exception as e:
             print(f"Error in get_decrypted_file_path: {str(e)}")  # 调试日志
             raise
+            
+    def remove_decrypted_file(self, temp_path):
+        """删除 get_decrypted_file_path 创建的临时文件及其目录（缓存中的文件由缓存自行淘汰）"""
+        cache = get_plaintext_cache()
+        if cache and cache.contains_path(temp_path):
+            return
+        shutil.rmtree(os.path.dirname(temp_path), ignore_errors=True)
         
     def delete_file(self, file):
         """删除文件"""
@@ -211,15 +645,18 @@ class FileService:
                     operation_detail=f'删除文件：{file_info["filename"]}'
                 )
 
-                # 删除物理文件
-                if os.path.exists(file.file_path):
-                    os.remove(file.file_path)
+                storage_ref = self.storage_ref(file)
                 
                 # 删除数据库记录
                 db.session.delete(file)
                 
                 # 提交删除操作
                 db.session.commit()
+                
+                self.discard_previews(file_info['id'])
+                
+                # 释放存储（去重存储中最后一个引用时才删除密文）
+                self.release_storage(storage_ref)
             except Exception as e:
                 db.session.rollback()
                 print(f"Error in delete_file transaction: {str(e)}")
@@ -253,217 +690,39 @@ class FileService:
             'updated_at': file.updated_at.isoformat() if file.updated_at else None,
             'is_public': file.is_public,
             'owner_id': file.owner_id,
-            'can_preview': self.can_preview(file.filename)  # 添加预览支持标志
+            'can_preview': self.can_preview(file.filename),  # 添加预览支持标志
+            'preview_status': file.preview_status
         }
         
     def update_file(self, original_file, new_file):
         """更新文件内容"""
         try:
-            # 保存新文件
-            new_file.save(original_file.file_path)
-            
-            # 更新文件信息
-            original_file.file_size = os.path.getsize(original_file.file_path)
-            original_file.updated_at = datetime.utcnow()
-            
-            db.session.commit()
-            return original_file
+            return self.replace_content(original_file, new_file)
         except Exception as e:
             db.session.rollback()
             raise e
 
     def get_file_content(self, file):
-        """获取文件内容"""
-        try:
-            decrypted_path = self.get_decrypted_file_path(file)
-            try:
-                # Excel 文件处理
-                if file.filename.lower().endswith(('.xlsx', '.xls')):
-                    return self._handle_excel_file(decrypted_path)
-                    
-                # Word 文件处理
-                elif file.filename.lower().endswith(('.docx', '.doc')):
-                    return self._handle_word_file(decrypted_path)
-                    
-                # PDF 文件处理
-                elif file.filename.lower().endswith('.pdf'):
-                    return self._handle_pdf_file(decrypted_path)
-                    
-                # 文本文件处理
-                elif file.filename.lower().endswith('.txt'):
-                    return self._handle_txt_file(decrypted_path)
-                    
-                # 图片文件处理
-                elif file.filename.lower().endswith(('.jpg', '.jpeg', '.png')):
-                    return self._handle_image_file(decrypted_path)
-                    
-                # ... 其他文件类型的处理保持不变 ...
-                
-            finally:
-                if os.path.exists(decrypted_path):
-                    os.remove(decrypted_path)
-                    
-        except Exception as e:
-            print(f"Error in get_file_content: {str(e)}")
-            raise
-            
-    def _handle_word_file(self, file_path):
-        """处理 Word 文件"""
-        try:
-            doc = docx.Document(file_path)
-            content = []
-            
-            # 先处理所有段落
-            for paragraph in doc.paragraphs:
-                if paragraph.text.strip():  # 只处理非空段落
-                    content.append({
-                        'type': 'paragraph',
-                        'text': paragraph.text,
-                        'style': paragraph.style.name if paragraph.style else 'Normal'
-                    })
-            
-            # 再处理所有表格
-            for table in doc.tables:
-                table_data = []
-                for row in table.rows:
-                    row_data = []
-                    for cell in row.cells:
-                        # 获取单元格中的所有段落的文本
-                        cell_text = '\n'.join(p.text.strip() for p in cell.paragraphs if p.text.strip())
-                        row_data.append(cell_text)
-                    if any(row_data):  # 只添加非空行
-                        table_data.append(row_data)
-                
-                if table_data:  # 只添加非空表格
-                    content.append({
-                        'type': 'table',
-                        'data': table_data
-                    })
-            
-            return {
-                'content': content,
-                'file_type': 'Word'
-            }
-            
-        except Exception as e:
-            print(f"Error processing Word file: {str(e)}")
-            raise
-            
-    def _handle_pdf_file(self, file_path):
-        """处理 PDF 文件"""
-        try:
-            # 使用 PyMuPDF 打开 PDF
-            pdf_document = fitz.open(file_path)
-            content = []
-            
-            for page_num in range(len(pdf_document)):
-                page = pdf_document[page_num]
-                
-                # 将页面渲染为图片
-                zoom = 2  # 设置缩放比例以提高图片质量
-                mat = fitz.Matrix(zoom, zoom)
-                pix = page.get_pixmap(matrix=mat)
-                
-                # 将图片转换为 base64
-                img_data = pix.tobytes("png")  # 直接输出为 PNG 格式
-                img_base64 = base64.b64encode(img_data).decode()
-                
-                content.append({
-                    'page': page_num + 1,
-                    'image': img_base64,
-                    'width': pix.width,
-                    'height': pix.height
-                })
-                
-            pdf_document.close()
-            
-            return {
-                'content': content,
-                'file_type': 'PDF',
-                'total_pages': len(content)
-            }
-            
-        except Exception as e:
-            print(f"Error processing PDF file: {str(e)}")
-            raise
-
-    def _handle_txt_file(self, file_path):
-        """处理 txt 文件"""
-        try:
-            # 使用 PyMuPDF 打开 PDF
-            with open(file_path, 'r') as f:
-                content = f.read()
-            
-            return {
-                'content': content,
-                'file_type': 'text/plain',
-                'total_pages': len(content)
-            }
-            
-        except Exception as e:
-            print(f"Error processing PDF file: {str(e)}")
-            raise
+        """获取文件内容
 
-    def _handle_image_file(self, file_path):
-        """处理图片文件"""
+        解析结果按文件版本缓存；同一版本文件的并发请求合并为一次解析，
+        共享同一个结果（调用方不要修改它）。
+        """
+        return content_flights.do(
+            ('content', self.cache_key(file)),
+            lambda: self.cached_preview(file, 'content', lambda: self._get_file_content(file))
+        )
+        
+    def _get_file_content(self, file):
+        """用文件类型对应的内容处理器解析文件，不支持的类型返回 None"""
         try:
-            # 打开图片
-            with Image.open(file_path) as image:
-                # 创建一个字节缓冲区
-                buffer = io.BytesIO()
-                
-                # 保存图片到缓冲区，格式为PNG
-                image.save(buffer, format='PNG')
-                
-                # 获取字节数据并转换为base64
-                image_base64 = base64.b64encode(buffer.getvalue()).decode()
-                
-                return {
-                    'content': image_base64,
-                    'file_type': 'image/png',  # 统一使用PNG格式
-                    'total_pages': 1,
-                    'width': image.width,
-                    'height': image.height
-                }
-                
+            if not self.preview_engine.supports(file, 'content'):
+                return None
+            return self.preview_engine.run(file, 'content')
         except Exception as e:
-            print(f"Error processing image file: {str(e)}")
+            print(f"Error in get_file_content: {str(e)}")
             raise
-
-    def _handle_excel_file(self, file_path):
-        """处理 Excel 文件"""
-        try:
-            # 读取 Excel 文件
-            df_dict = pd.read_excel(file_path, sheet_name=None)
-            content = {}
-            
-            # 处理每个工作表
-            for sheet_name, df in df_dict.items():
-                # 将 DataFrame 转换为字典列表
-                records = df.to_dict('records')
-                
-                # 如果有数据，添加表头作为第一行
-                if not df.empty:
-                    headers = df.columns.tolist()
-                    content[sheet_name] = [
-                        {str(col): str(col) for col in headers}  # 表头行
-                    ] + [
-                        {str(col): str(row[col]) if pd.notna(row[col]) else '' 
-                         for col in headers}
-                        for row in records
-                    ]
-                else:
-                    content[sheet_name] = []
-            
-            return {
-                'content': content,
-                'file_type': 'Excel'
-            }
             
-        except Exception as e:
-            print(f"Error processing Excel file: {str(e)}")
-            raise
-
     def update_file_content(self, file, content):
         """更新文件内容"""
         temp_path = None
@@ -532,21 +791,11 @@ class FileService:
             
             # 加密并保存文件
             try:
-                encrypted_data = self.aes.encrypt_file(file_data)
-                print(f"Encrypted data size: {len(encrypted_data)}")  # 调试日志
-                
-                with open(file.file_path, 'wb') as f:
-                    f.write(encrypted_data)
-                
-                # 更新文件信息
-                file.file_size = os.path.getsize(file.file_path)
-                file.updated_at = datetime.utcnow()
-                
                 # 更新 Excel 文件的类型
                 if file.filename.lower().endswith(('.xlsx', '.xls')):
                     file.file_type = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
                 
-                db.session.commit()
+                self.replace_content(file, io.BytesIO(file_data))
                 print(f"File updated successfully: {file.filename}")  # 调试日志
                 
                 # 记录编辑操作
@@ -571,4 +820,144 @@ class FileService:
         finally:
             # 清理临时文件
             if temp_path and os.path.exists(temp_path):
-                os.remove(temp_path) 
\ No newline at end of file
+                os.remove(temp_path)
+
+
+@preview_handler('word', 'content')
+def _handle_word_file(file_path):
+    """处理 Word 文件"""
+    try:
+        doc = docx.Document(file_path)
+        # 段落和表格按文档中的顺序排列
+        content = list(iter_blocks(doc))
+
+        return {
+            'content': content,
+            'file_type': 'Word'
+        }
+
+    except Exception as e:
+        print(f"Error processing Word file: {str(e)}")
+        raise
+
+
+@preview_handler('pdf', 'content')
+def _handle_pdf_file(file_path):
+    """处理 PDF 文件"""
+    try:
+        # 使用 PyMuPDF 打开 PDF
+        pdf_document = fitz.open(file_path)
+        content = []
+
+        for page_num in range(len(pdf_document)):
+            page = pdf_document[page_num]
+
+            # 将页面渲染为图片
+            zoom = 2  # 设置缩放比例以提高图片质量
+            mat = fitz.Matrix(zoom, zoom)
+            pix = page.get_pixmap(matrix=mat)
+
+            # 将图片转换为 base64
+            img_data = pix.tobytes("png")  # 直接输出为 PNG 格式
+            img_base64 = base64.b64encode(img_data).decode()
+
+            content.append({
+                'page': page_num + 1,
+                'image': img_base64,
+                'width': pix.width,
+                'height': pix.height
+            })
+
+        pdf_document.close()
+
+        return {
+            'content': content,
+            'file_type': 'PDF',
+            'total_pages': len(content)
+        }
+
+    except Exception as e:
+        print(f"Error processing PDF file: {str(e)}")
+        raise
+
+
+@preview_handler('text', 'content')
+def _handle_txt_file(file_path):
+    """处理 txt 文件"""
+    try:
+        # 按文件开头的样本识别编码，不依赖系统默认编码
+        content = read_text(file_path, Config.TEXT_SAMPLE_SIZE)
+
+        return {
+            'content': content,
+            'file_type': 'text/plain',
+            'total_pages': len(content)
+        }
+
+    except Exception as e:
+        print(f"Error processing PDF file: {str(e)}")
+        raise
+
+
+@preview_handler('image', 'content')
+def _handle_image_file(file_path):
+    """处理图片文件"""
+    try:
+        # 打开图片
+        with Image.open(file_path) as image:
+            # 创建一个字节缓冲区
+            buffer = io.BytesIO()
+
+            # 保存图片到缓冲区，格式为PNG
+            image.save(buffer, format='PNG')
+
+            # 获取字节数据并转换为base64
+            image_base64 = base64.b64encode(buffer.getvalue()).decode()
+
+            return {
+                'content': image_base64,
+                'file_type': 'image/png',  # 统一使用PNG格式
+                'total_pages': 1,
+                'width': image.width,
+                'height': image.height
+            }
+
+    except Exception as e:
+        print(f"Error processing image file: {str(e)}")
+        raise
+
+
+@preview_handler('spreadsheet', 'content')
+def _handle_excel_file(file_path):
+    """处理 Excel 文件"""
+    try:
+        # 读取 Excel 文件
+        df_dict = pd.read_excel(file_path, sheet_name=None)
+        content = {}
+
+        # 处理每个工作表
+        for sheet_name, df in df_dict.items():
+            # 将 DataFrame 转换为字典列表
+            records = df.to_dict('records')
+
+            # 如果有数据，添加表头作为第一行
+            if not df.empty:
+                headers = df.columns.tolist()
+                content[sheet_name] = [
+                    {str(col): str(col) for col in headers}  # 表头行
+                ] + [
+                    {str(col): str(row[col]) if pd.notna(row[col]) else '' 
+                     for col in headers}
+                    for row in records
+                ]
+            else:
+                content[sheet_name] = []
+
+        return {
+            'content': content,
+            'file_type': 'Excel'
+        }
+
+    except Exception as e:
+        print(f"Error processing Excel file: {str(e)}")
+        raise
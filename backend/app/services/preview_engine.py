@@ -0,0 +1,152 @@
+import os
+import threading
+from flask import current_app, has_app_context
+from app.utils.sandbox import SandboxPool
+from config import Config
+
+# 按扩展名识别文件类型，识别不出时再按上传时检测到的 MIME 类型
+FILE_TYPES = {
+    '.pdf': 'pdf',
+    '.jpg': 'image',
+    '.jpeg': 'image',
+    '.png': 'image',
+    '.gif': 'image',
+    '.webp': 'image',
+    '.bmp': 'image',
+    '.xlsx': 'spreadsheet',
+    '.xlsm': 'spreadsheet',
+    '.xls': 'spreadsheet',
+    '.docx': 'word',
+    '.doc': 'word',
+    '.txt': 'text',
+    '.log': 'text',
+    '.csv': 'text',
+    '.tsv': 'text',
+    '.md': 'text',
+    '.json': 'text',
+    '.xml': 'text',
+    '.yaml': 'text',
+    '.yml': 'text',
+    '.ini': 'text',
+    '.conf': 'text',
+}
+
+MIME_TYPES = {
+    'application/pdf': 'pdf',
+    'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet': 'spreadsheet',
+    'application/vnd.openxmlformats-officedocument.wordprocessingml.document': 'word',
+}
+
+# 每种文件类型使用的进程池，池的大小、执行时限见 PREVIEW_WORKERS / PREVIEW_TIMEOUTS
+POOL_KINDS = {
+    'pdf': 'pdf',
+    'image': 'image',
+    'spreadsheet': 'office',
+    'word': 'office',
+    'text': 'text',
+}
+
+# (文件类型, 处理器名) -> 处理器
+_handlers = {}
+
+
+def detect_type(filename, mimetype=None):
+    """识别文件类型：pdf / image / spreadsheet / word / text，不支持预览时返回 None"""
+    file_type = FILE_TYPES.get(os.path.splitext(filename.lower())[1])
+    if file_type or not mimetype:
+        return file_type
+    if mimetype.startswith('image/'):
+        return 'image'
+    if mimetype.startswith('text/'):
+        return 'text'
+    return MIME_TYPES.get(mimetype)
+
+
+def preview_handler(file_type, name):
+    """注册某种文件类型的预览处理器
+
+    处理器在沙箱进程中执行，必须是模块级函数；第一个参数为解密后的明文文件路径，
+    其余参数和返回值都需要能被 pickle。处理器只读取文件，不访问数据库和缓存。
+    """
+    def register(fn):
+        _handlers[(file_type, name)] = fn
+        return fn
+    return register
+
+
+_pools = {}
+_pools_pid = None
+_pools_lock = threading.Lock()
+
+
+def _setting(name):
+    """读取沙箱配置：优先使用当前应用的配置（例如 TestingConfig），应用上下文之外使用 Config"""
+    if has_app_context() and name in current_app.config:
+        return current_app.config[name]
+    return getattr(Config, name)
+
+
+def get_sandbox(kind):
+    """获取某类文件的沙箱进程池（每个 worker 进程各自创建，配置不同时使用不同的池）"""
+    global _pools_pid
+    settings = (
+        _setting('PREVIEW_WORKERS').get(kind, 1),
+        _setting('PREVIEW_TIMEOUTS').get(kind, 60),
+        _setting('PREVIEW_MEMORY_LIMIT'),
+        _setting('PREVIEW_SANDBOX_MAX_TASKS')
+    )
+    pid = os.getpid()
+    with _pools_lock:
+        if _pools_pid != pid:
+            # fork 出的子进程不能复用父进程的沙箱进程
+            _pools.clear()
+            _pools_pid = pid
+        pool = _pools.get((kind, settings))
+        if pool is None:
+            workers, timeout, memory_limit, max_tasks = settings
+            pool = _pools[(kind, settings)] = SandboxPool(
+                workers, timeout, memory_limit=memory_limit, max_tasks=max_tasks
+            )
+        return pool
+
+
+def run_sandboxed(kind, fn, *args):
+    """在指定类别的沙箱进程中执行 fn(*args)；PREVIEW_SANDBOX_ENABLED 为 False 时在当前进程执行"""
+    if not _setting('PREVIEW_SANDBOX_ENABLED'):
+        return fn(*args)
+    return get_sandbox(kind).run(fn, *args)
+
+
+class PreviewEngine:
+    """按文件类型分派预览处理器
+
+    解析和渲染（PyMuPDF、Pillow、openpyxl、pandas、python-docx 等原生解析器）
+    都在沙箱进程中执行，每类文件的并发数、执行时限和内存上限分别限制，
+    单个异常文件不会拖住或耗尽 API 进程。结果缓存由调用方负责。
+    """
+
+    def __init__(self, file_service):
+        self.file_service = file_service
+
+    def file_type(self, file):
+        return detect_type(file.filename, file.file_type)
+
+    def supports(self, file, name):
+        return (self.file_type(file), name) in _handlers
+
+    def run(self, file, name, *args):
+        """用文件类型对应的处理器处理文件当前版本的明文
+
+        Raises:
+            LookupError: 该类型的文件没有此处理器
+            SandboxTimeout / SandboxCrashed: 处理超时或沙箱进程异常退出
+        """
+        file_type = self.file_type(file)
+        handler = _handlers.get((file_type, name))
+        if handler is None:
+            raise LookupError(f'不支持的文件类型: {file.filename}')
+        file_path = self.file_service.get_decrypted_file_path(file)
+        try:
+            return run_sandboxed(POOL_KINDS[file_type], handler, file_path, *args)
+        finally:
+            self.file_service.remove_decrypted_file(file_path)
@@ -0,0 +1,79 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from app import db
+from app.models.file import File, PREVIEW_PENDING, PREVIEW_PROCESSING, PREVIEW_READY, PREVIEW_FAILED
+from app.services.preview_engine import detect_type
+from config import Config
+
+
+def _set_status(file_id, content_hash, status):
+    """只在文件内容仍是任务对应的版本时更新状态，避免旧任务覆盖新版本的状态"""
+    db.session.execute(
+        db.update(File)
+        .where(File.id == file_id, File.content_hash == content_hash)
+        .values(preview_status=status)
+    )
+    db.session.commit()
+
+
+def _pregenerate(app, file_id, content_hash):
+    """在后台线程中生成预览，解析和渲染由预览引擎交给对应类别的沙箱进程"""
+    from app.services.preview_service import PreviewService
+    with app.app_context():
+        file = db.session.get(File, file_id)
+        if not file or file.content_hash != content_hash:
+            # 文件已删除或内容已更新，由新的任务处理
+            return False
+        _set_status(file_id, content_hash, PREVIEW_PROCESSING)
+        try:
+            PreviewService().pregenerate(file)
+        except Exception as e:
+            print(f"Error pregenerating preview for file {file_id}: {str(e)}")
+            db.session.rollback()
+            _set_status(file_id, content_hash, PREVIEW_FAILED)
+            return False
+        _set_status(file_id, content_hash, PREVIEW_READY)
+        return True
+
+
+class PreviewQueue:
+    """预览预生成队列
+
+    上传和编辑文件后，在提交文件记录的事务中调用 prepare 标记状态，提交后调用 submit。
+    任务在后台线程中执行，耗时和有风险的解析都在预览沙箱中进行，
+    同时处理的文件数由 PREVIEW_PREGENERATE_WORKERS 限制。
+    """
+
+    def __init__(self):
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def enabled(self):
+        return bool(current_app.config.get('PREVIEW_PREGENERATE_ENABLED'))
+
+    def prepare(self, file):
+        """需要预先生成预览时把文件标记为等待处理，否则清除上一版本内容留下的状态"""
+        if self.enabled() and detect_type(file.filename, file.file_type):
+            file.preview_status = PREVIEW_PENDING
+        else:
+            file.preview_status = None
+
+    def submit(self, file):
+        """把标记为等待处理的文件交给后台线程"""
+        if file.preview_status != PREVIEW_PENDING or not self.enabled():
+            return
+        app = current_app._get_current_object()
+        self._pool().submit(_pregenerate, app, file.id, file.content_hash)
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=Config.PREVIEW_PREGENERATE_WORKERS,
+                    thread_name_prefix='preview'
+                )
+            return self._executor
+
+
+preview_queue = PreviewQueue()
@@ -1,106 +1,488 @@
-from PIL import Image
-import PyPDF2
+from PIL import Image, ImageOps
 from docx import Document
 import pandas as pd
 import io
+import os
+import math
 import base64
+import shutil
+import tempfile
+import fitz  # PyMuPDF
 from app.models.file import File
 from app.services.file_service import FileService
+from app.services.preview_engine import preview_handler
+from app.services.spreadsheet_service import SpreadsheetService, SPREADSHEET_EXTENSIONS
+from app.services.text_service import TextService, is_text_file
+from app.services.document_service import DocumentService, DOCUMENT_EXTENSIONS
+from app.utils.encoding import read_text
+from app.utils.preview_cache import get_preview_cache, preview_key
+from config import Config
+
+# Pillow 的解压缩炸弹保护：超过此像素数时警告，超过两倍时拒绝打开
+Image.MAX_IMAGE_PIXELS = Config.IMAGE_MAX_PIXELS
+
+# 单页渲染支持的输出格式
+IMAGE_FORMATS = {
+    'png': 'image/png',
+    'jpeg': 'image/jpeg',
+    'webp': 'image/webp'
+}
+
+# 支持生成缩略图的图片扩展名
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp')
+
+
+def snap_image_width(width):
+    """把请求的宽度向上取整到标准宽度，超过最大标准宽度时使用最大值"""
+    for standard in Config.IMAGE_PREVIEW_WIDTHS:
+        if width <= standard:
+            return standard
+    return Config.IMAGE_PREVIEW_WIDTHS[-1]
+
+
+def _to_output_mode(img, image_format):
+    """转换为输出格式支持的颜色模式：WebP 保留透明通道，JPEG 铺白色背景"""
+    if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
+        img = img.convert('RGBA')
+        if image_format == 'jpeg':
+            background = Image.new('RGB', img.size, (255, 255, 255))
+            background.paste(img, mask=img.getchannel('A'))
+            img = background
+    elif img.mode != 'RGB':
+        img = img.convert('RGB')
+    return img
+
+
+def _encode_image(img, image_format):
+    buffer = io.BytesIO()
+    img.save(buffer, format=image_format.upper(), quality=Config.PREVIEW_IMAGE_QUALITY)
+    return buffer.getvalue()
+
+
+def _tile_path(tile_dir, level, col, row):
+    return os.path.join(tile_dir, f'{level}_{col}_{row}')
+
+
+def _check_tile(info, level, col, row):
+    """层级或瓦片位置超出金字塔范围时抛出 IndexError"""
+    if not 0 <= level <= info['max_level']:
+        raise IndexError(f'层级超出范围: {level}')
+    level_info = info['levels'][level]
+    if not (0 <= col < level_info['cols'] and 0 <= row < level_info['rows']):
+        raise IndexError(f'瓦片超出范围: {col}_{row}')
+
+
+def _tile_block(info, level, col, row, block_size):
+    """瓦片所在的 block_size x block_size 瓦片块（按块大小对齐，不超出层级范围）中的所有瓦片"""
+    level_info = info['levels'][level]
+    first_col, first_row = col - col % block_size, row - row % block_size
+    return [(level, c, r)
+            for r in range(first_row, min(first_row + block_size, level_info['rows']))
+            for c in range(first_col, min(first_col + block_size, level_info['cols']))]
+
 
 class PreviewService:
     def __init__(self):
         self.file_service = FileService()
-        
+        self.engine = self.file_service.preview_engine
+    
     def get_preview(self, file: File):
-        """获取文件预览数据"""
+        """获取文件预览数据（按文件版本缓存）"""
         if not file:
             return None
-            
-        # 获取解密后的文件路径
-        file_path = self.file_service.get_decrypted_file_path(file)
         
         try:
-            if file.file_type.startswith('image/'):
-                return self._preview_image(file_path)
-            elif file.file_type == 'application/pdf':
-                return self._preview_pdf(file_path)
-            elif file.file_type == 'text/plain':
-                return self._preview_text(file_path)
-            elif file.file_type == 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet':
-                return self._preview_excel(file_path)
-            elif file.file_type == 'application/vnd.openxmlformats-officedocument.wordprocessingml.document':
-                return self._preview_word(file_path)
-            else:
-                return {'error': '不支持的文件类型'}
+            return self.file_service.cached_preview(file, 'preview', lambda: self._render_preview(file))
         except Exception as e:
             return {'error': f'预览失败: {str(e)}'}
-            
-    def _preview_image(self, file_path):
-        """预览图片"""
-        with Image.open(file_path) as img:
-            # 调整图片大小
-            max_size = (800, 800)
-            img.thumbnail(max_size, Image.LANCZOS)
-            
-            # 转换为base64
-            buffer = io.BytesIO()
-            img.save(buffer, format=img.format)
-            img_str = base64.b64encode(buffer.getvalue()).decode()
-            
-            return {
-                'type': 'image',
-                'data': img_str,
-                'width': img.width,
-                'height': img.height
-            }
-            
-    def _preview_pdf(self, file_path):
-        """预览PDF"""
-        with open(file_path, 'rb') as file:
-            pdf = PyPDF2.PdfReader(file)
-            pages = []
-            
-            for page in range(len(pdf.pages)):
-                text = pdf.pages[page].extract_text()
-                pages.append(text)
-                
-            return {
-                'type': 'pdf',
-                'pages': pages,
-                'total_pages': len(pages)
-            }
-            
-    def _preview_text(self, file_path):
-        """预览文本文件"""
-        with open(file_path, 'r', encoding='utf-8') as file:
-            content = file.read()
-            return {
-                'type': 'text',
-                'content': content
-            }
-            
-    def _preview_excel(self, file_path):
-        """预览Excel文件"""
-        df = pd.read_excel(file_path)
-        data = df.to_dict('records')
-        columns = df.columns.tolist()
+    
+    def _render_preview(self, file: File):
+        if not self.engine.supports(file, 'preview'):
+            return {'error': '不支持的文件类型'}
+        return self.engine.run(file, 'preview')
+    
+    def get_pdf_info(self, file: File):
+        """获取 PDF 的页数和每页尺寸（单位：点），不渲染任何页面"""
+        return self.file_service.cached_preview(file, 'pdf-info', lambda: self.engine.run(file, 'pdf-info'))
+    
+    def render_pdf_page(self, file: File, page, scale=1.0, image_format='png'):
+        """渲染 PDF 的一页为图片（按文件版本和参数缓存）
         
-        return {
-            'type': 'excel',
-            'data': data,
-            'columns': columns
-        }
+        Args:
+            page: 页码，从 1 开始
+            scale: 缩放比例，1.0 对应 72 DPI；输出像素数超过上限时自动降低
+            image_format: png / jpeg / webp
+        
+        Returns:
+            (图片数据, MIME 类型)
+        """
+        if image_format not in IMAGE_FORMATS:
+            raise ValueError(f'不支持的图片格式: {image_format}')
+        if not Config.PDF_RENDER_MIN_SCALE <= scale <= Config.PDF_RENDER_MAX_SCALE:
+            raise ValueError(f'缩放比例应在 {Config.PDF_RENDER_MIN_SCALE} 到 {Config.PDF_RENDER_MAX_SCALE} 之间')
+        
+        data = self.file_service.cached_preview(
+            file, 'pdf-page',
+            lambda: self.engine.run(file, 'pdf-page', page, scale, image_format),
+            params={'page': page, 'scale': scale, 'format': image_format},
+            as_json=False
+        )
+        return data, IMAGE_FORMATS[image_format]
+    
+    def render_image(self, file: File, width, image_format='webp'):
+        """生成缩小到指定宽度的图片预览（按文件版本和尺寸缓存）
         
-    def _preview_word(self, file_path):
-        """预览Word文件"""
-        doc = Document(file_path)
-        content = []
+        Args:
+            width: 目标宽度，向上取整到标准宽度；不会放大原图
+            image_format: jpeg / webp
         
-        for paragraph in doc.paragraphs:
-            if paragraph.text.strip():
-                content.append(paragraph.text)
-                
+        Returns:
+            (图片数据, MIME 类型)
+        """
+        if image_format not in ('jpeg', 'webp'):
+            raise ValueError(f'不支持的图片格式: {image_format}')
+        width = snap_image_width(width)
+        data = self.file_service.cached_preview(
+            file, 'image',
+            lambda: self.engine.run(file, 'image', width, image_format),
+            params={'width': width, 'format': image_format},
+            as_json=False
+        )
+        return data, IMAGE_FORMATS[image_format]
+    
+    def get_deepzoom_info(self, file: File):
+        """获取 DeepZoom 瓦片金字塔的描述信息
+        
+        首次调用时生成整个金字塔并把所有瓦片写入预览缓存，之后每次请求只读取可见的瓦片；
+        缓存未启用时只读取图片尺寸，不生成瓦片。
+        """
+        if not get_preview_cache():
+            return self._build_pyramid(file, tiles=[])[0]
+        return self.file_service.cached_preview(
+            file, 'dzi',
+            lambda: self.file_service.rebuild_preview(file, 'dzi', lambda: self._build_pyramid(file))[0]
+        )
+    
+    def get_deepzoom_tile(self, file: File, level, col, row):
+        """读取一个瓦片，返回 (图片数据, MIME 类型)；层级或位置超出范围时抛出 IndexError"""
+        tile = (level, col, row)
+        cache = get_preview_cache()
+        if not cache:
+            # 缓存未启用：只生成这一个瓦片
+            info, data = self._build_pyramid(file, want=tile, tiles=[tile])
+            return data, IMAGE_FORMATS[info['format']]
+
+        info = self.get_deepzoom_info(file)
+        _check_tile(info, level, col, row)
+        key = self._tile_key(file, level, col, row)
+        data = cache.load(key)
+        if data is None:
+            # 瓦片已被淘汰：只重新生成所在的瓦片块，同一块的并发请求只生成一次
+            tiles = _tile_block(info, level, col, row, Config.DEEPZOOM_REBUILD_BLOCK)
+            block = (level, col // Config.DEEPZOOM_REBUILD_BLOCK, row // Config.DEEPZOOM_REBUILD_BLOCK)
+            data = self.file_service.rebuild_preview(
+                file, ('dzi', block), lambda: self._build_pyramid(file, want=tile, tiles=tiles), key
+            )[1]
+        return data, IMAGE_FORMATS[info['format']]
+    
+    def _tile_key(self, file, level, col, row):
+        version = self.file_service.content_version(file)
+        return preview_key(file.id, version, 'dzi-tile', [level, col, row])
+    
+    def _build_pyramid(self, file: File, want=None, tiles=None):
+        """在沙箱进程中生成 DeepZoom 瓦片，写入预览缓存
+        
+        tiles 为 None 时生成整个金字塔，否则只生成列表中的瓦片；
+        want 为 (level, col, row) 时同时返回该瓦片的数据。
+        
+        Returns:
+            (描述信息, want 对应的瓦片数据)
+        """
+        cache = get_preview_cache()
+        wanted = None
+        tile_dir = tempfile.mkdtemp(dir=Config.TEMP_FOLDER)
+        try:
+            info = self.engine.run(
+                file, 'dzi', tile_dir,
+                Config.DEEPZOOM_TILE_SIZE, Config.DEEPZOOM_OVERLAP, Config.DEEPZOOM_FORMAT, tiles
+            )
+            if tiles is None:
+                tiles = [(level_info['level'], col, row) for level_info in info['levels']
+                         for row in range(level_info['rows']) for col in range(level_info['cols'])]
+            for level, col, row in tiles:
+                with open(_tile_path(tile_dir, level, col, row), 'rb') as f:
+                    data = f.read()
+                if cache:
+                    cache.store(self._tile_key(file, level, col, row), data, evict=False)
+                if want == (level, col, row):
+                    wanted = data
+        finally:
+            shutil.rmtree(tile_dir, ignore_errors=True)
+        if cache:
+            cache.evict()
+        return info, wanted
+    
+    def pregenerate(self, file: File):
+        """预先生成常用的预览并写入缓存：PDF 前几页和提取的文本、图片缩略图、表格和文档分页、文本行索引"""
+        name = file.filename.lower()
+        if is_text_file(file):
+            # 大文本文件不缓存全文，只建立行索引
+            TextService().get_index(file)
+            return
+        if name.endswith('.pdf'):
+            # 不生成 /content：它把每页都渲染为 2 倍大小的 PNG，长文档会超时并挤占缓存
+            total_pages = self.get_pdf_info(file)['total_pages']
+            for page in range(1, min(total_pages, Config.PREVIEW_PREGENERATE_PDF_PAGES) + 1):
+                self.render_pdf_page(file, page)
+            self.file_service.cached_preview(file, 'preview', lambda: self._render_preview(file))
+            return
+        if name.endswith(IMAGE_EXTENSIONS):
+            for width in Config.PREVIEW_PREGENERATE_IMAGE_WIDTHS:
+                self.render_image(file, width, 'webp')
+            if max(self.engine.run(file, 'image-size')) >= Config.DEEPZOOM_PREGENERATE_MIN_SIZE:
+                self.get_deepzoom_info(file)
+            return
+        if name.endswith(SPREADSHEET_EXTENSIONS):
+            SpreadsheetService().get_sheets(file)
+        elif name.endswith(DOCUMENT_EXTENSIONS):
+            DocumentService().get_info(file)
+        # 表格和文档的 /content 最后生成，失败时不影响已生成的分页
+        try:
+            self.file_service.get_file_content(file)
+        except Exception as e:
+            print(f"Error pregenerating content for file {file.id}: {str(e)}")
+
+
+# 以下处理器在沙箱进程中执行，第一个参数为解密后的文件路径
+
+@preview_handler('pdf', 'pdf-info')
+def _read_pdf_info(file_path):
+    with fitz.open(file_path) as pdf:
+        pages = [{
+            'page': index + 1,
+            'width': round(page.rect.width, 2),
+            'height': round(page.rect.height, 2),
+            'rotation': page.rotation
+        } for index, page in enumerate(pdf)]
+    return {'total_pages': len(pages), 'pages': pages}
+
+
+@preview_handler('pdf', 'pdf-page')
+def _render_pdf_page(file_path, page, scale, image_format):
+    with fitz.open(file_path) as pdf:
+        if not 1 <= page <= pdf.page_count:
+            raise IndexError(f'页码超出范围: {page}')
+        pdf_page = pdf[page - 1]
+
+        # 限制输出像素数，避免超大页面耗尽内存
+        area = pdf_page.rect.width * pdf_page.rect.height
+        if area * scale * scale > Config.PDF_RENDER_MAX_PIXELS:
+            scale = (Config.PDF_RENDER_MAX_PIXELS / area) ** 0.5
+        pix = pdf_page.get_pixmap(matrix=fitz.Matrix(scale, scale), alpha=False)
+
+        if image_format == 'png':
+            return pix.tobytes('png')
+        img = Image.frombytes('RGB', (pix.width, pix.height), pix.samples)
+        return _encode_image(img, image_format)
+
+
+@preview_handler('image', 'image')
+def _render_image(file_path, width, image_format):
+    with Image.open(file_path) as img:
+        # JPEG 在解码时直接按 1/2、1/4、1/8 缩小，不必解码全尺寸照片
+        img.draft('RGB', (width, width))
+        img = ImageOps.exif_transpose(img)
+        # 限制超长图片的高度
+        img.thumbnail((width, width * 4), Image.LANCZOS)
+        return _encode_image(_to_output_mode(img, image_format), image_format)
+
+
+@preview_handler('image', 'image-size')
+def _image_size(file_path):
+    """只读取图片头部获取宽高"""
+    with Image.open(file_path) as img:
+        return img.size
+
+
+def _pyramid_levels(width, height, tile_size):
+    """各层级的尺寸和行列数：最高层级为原图尺寸，每降一级宽高减半（向上取整），第 0 级为 1x1"""
+    max_level = math.ceil(math.log2(max(width, height))) if max(width, height) > 1 else 0
+    levels = [None] * (max_level + 1)
+    for level in range(max_level, -1, -1):
+        levels[level] = {'level': level, 'width': width, 'height': height,
+                         'cols': math.ceil(width / tile_size), 'rows': math.ceil(height / tile_size)}
+        width, height = math.ceil(width / 2), math.ceil(height / 2)
+    return levels
+
+
+def _tile_box(level_info, col, row, tile_size, overlap):
+    """瓦片在所在层级图像中的范围，边缘瓦片只向内重叠"""
+    return (
+        max(col * tile_size - overlap, 0),
+        max(row * tile_size - overlap, 0),
+        min((col + 1) * tile_size + overlap, level_info['width']),
+        min((row + 1) * tile_size + overlap, level_info['height'])
+    )
+
+
+def _oriented_size(img):
+    """按 EXIF 方向旋转后的宽高（只读取文件头）"""
+    if img.getexif().get(0x0112) in (5, 6, 7, 8):
+        return img.height, img.width
+    return img.size
+
+
+@preview_handler('image', 'dzi')
+def _build_pyramid(file_path, tile_dir, tile_size, overlap, image_format, tiles=None):
+    """生成 DeepZoom 瓦片金字塔，瓦片写入 tile_dir，返回描述信息
+
+    tiles 为 None 时逐级缩小生成所有瓦片；为 (level, col, row) 列表时只生成其中的瓦片：
+    每个层级只把覆盖这些瓦片的区域缩放到该层级，不生成其他层级（见 _build_tiles）。
+    """
+    with Image.open(file_path) as img:
+        if img.width * img.height > Config.IMAGE_MAX_PIXELS:
+            raise ValueError(f'图片过大: {img.width}x{img.height}')
+        width, height = _oriented_size(img)
+        levels = _pyramid_levels(width, height, tile_size)
+        if tiles is not None:
+            for tile in tiles:
+                _check_tile({'max_level': len(levels) - 1, 'levels': levels}, *tile)
+            _build_tiles(img, levels, tiles, tile_dir, tile_size, overlap, image_format)
+        else:
+            image = _to_output_mode(ImageOps.exif_transpose(img), image_format)
+
+    if tiles is None:
+        for level in range(len(levels) - 1, -1, -1):
+            level_info = levels[level]
+            if image.size != (level_info['width'], level_info['height']):
+                # 从上一级缩小，内存中同时只保留相邻两级的图像
+                image = image.resize((level_info['width'], level_info['height']), Image.LANCZOS)
+            for row in range(level_info['rows']):
+                for col in range(level_info['cols']):
+                    box = _tile_box(level_info, col, row, tile_size, overlap)
+                    with open(_tile_path(tile_dir, level, col, row), 'wb') as f:
+                        f.write(_encode_image(image.crop(box), image_format))
+
+    return {
+        'width': width,
+        'height': height,
+        'tile_size': tile_size,
+        'overlap': overlap,
+        'format': image_format,
+        'max_level': len(levels) - 1,
+        'levels': levels
+    }
+
+
+def _build_tiles(img, levels, tiles, tile_dir, tile_size, overlap, image_format):
+    """只生成指定的瓦片
+
+    层级的缩小倍数为 2 的幂：JPEG 用 draft 在解码时按 1/2~1/8 缩小，
+    其余格式解码原图后只裁剪覆盖所需瓦片的区域，再缩放（reducing_gap 先用 reduce 整数倍缩小）。
+    """
+    if not tiles:
+        return
+    max_level = len(levels) - 1
+    width = levels[max_level]['width']
+    # 按所需的最高层级（缩小倍数最小）请求草稿解码，其他层级从同一次解码的结果缩放
+    factor = 2 ** (max_level - max(level for level, _, _ in tiles))
+    img.draft('RGB', (math.ceil(img.width / factor), math.ceil(img.height / factor)))
+    image = ImageOps.exif_transpose(img)
+    decoded_scale = image.width / width
+
+    by_level = {}
+    for level, col, row in tiles:
+        by_level.setdefault(level, []).append((col, row))
+    for level, positions in by_level.items():
+        level_info = levels[level]
+        boxes = {position: _tile_box(level_info, *position, tile_size, overlap) for position in positions}
+        left = min(box[0] for box in boxes.values())
+        top = min(box[1] for box in boxes.values())
+        right = max(box[2] for box in boxes.values())
+        bottom = max(box[3] for box in boxes.values())
+        # 区域在解码图像中的范围
+        scale = width / level_info['width'] * decoded_scale
+        source = (
+            math.floor(left * scale), math.floor(top * scale),
+            min(math.ceil(right * scale), image.width), min(math.ceil(bottom * scale), image.height)
+        )
+        region = _to_output_mode(image.crop(source), image_format)
+        if region.size != (right - left, bottom - top):
+            region = region.resize((right - left, bottom - top), Image.LANCZOS, reducing_gap=2.0)
+        for (col, row), box in boxes.items():
+            tile = region.crop((box[0] - left, box[1] - top, box[2] - left, box[3] - top))
+            with open(_tile_path(tile_dir, level, col, row), 'wb') as f:
+                f.write(_encode_image(tile, image_format))
+
+
+@preview_handler('image', 'preview')
+def _preview_image(file_path):
+    """预览图片"""
+    with Image.open(file_path) as img:
+        # 调整图片大小
+        max_size = (800, 800)
+        img.thumbnail(max_size, Image.LANCZOS)
+
+        # 转换为base64
+        buffer = io.BytesIO()
+        img.save(buffer, format=img.format)
+        img_str = base64.b64encode(buffer.getvalue()).decode()
+
         return {
-            'type': 'word',
-            'content': content
-        } 
\ No newline at end of file
+            'type': 'image',
+            'data': img_str,
+            'width': img.width,
+            'height': img.height
+        }
+
+
+@preview_handler('pdf', 'preview')
+def _preview_pdf(file_path):
+    """预览PDF：每页的文本（与渲染共用 PyMuPDF）"""
+    with fitz.open(file_path) as pdf:
+        pages = [page.get_text() for page in pdf]
+
+    return {
+        'type': 'pdf',
+        'pages': pages,
+        'total_pages': len(pages)
+    }
+
+
+@preview_handler('text', 'preview')
+def _preview_text(file_path):
+    """预览文本文件"""
+    return {
+        'type': 'text',
+        'content': read_text(file_path, Config.TEXT_SAMPLE_SIZE)
+    }
+
+
+@preview_handler('spreadsheet', 'preview')
+def _preview_excel(file_path):
+    """预览Excel文件"""
+    df = pd.read_excel(file_path)
+    data = df.to_dict('records')
+    columns = df.columns.tolist()
+
+    return {
+        'type': 'excel',
+        'data': data,
+        'columns': columns
+    }
+
+
+@preview_handler('word', 'preview')
+def _preview_word(file_path):
+    """预览Word文件"""
+    doc = Document(file_path)
+    content = []
+
+    for paragraph in doc.paragraphs:
+        if paragraph.text.strip():
+            content.append(paragraph.text)
+
+    return {
+        'type': 'word',
+        'content': content
+    }
@@ -0,0 +1,637 @@
+import datetime
+import json
+import math
+import os
+import shutil
+import tempfile
+import zipfile
+import openpyxl
+from openpyxl.formula.tokenizer import Token, Tokenizer, TokenizerError
+from openpyxl.reader.excel import ExcelReader
+from openpyxl.utils.cell import coordinate_to_tuple, range_boundaries
+from openpyxl.worksheet.formula import ArrayFormula
+from openpyxl.xml.constants import SHEET_MAIN_NS
+from openpyxl.xml.functions import SubElement, fromstring, iterparse, tostring
+from app import db
+from app.models.file import File
+from app.services.file_service import FileService
+from app.services.preview_engine import preview_handler
+from app.utils.locks import file_lock
+from app.utils.plaintext_cache import get_plaintext_cache
+from app.utils.preview_cache import get_preview_cache, preview_key
+from config import Config
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:  # pyarrow 为可选依赖，未安装时按 JSON 分页缓存，不支持列统计
+    pa = None
+    pc = None
+
+# 支持按行窗口读取的表格扩展名（openpyxl 不支持旧的 .xls 格式）
+SPREADSHEET_EXTENSIONS = ('.xlsx', '.xlsm')
+
+# Excel 工作表的最大行数和列数
+MAX_ROWS = 1048576
+MAX_COLUMNS = 16384
+
+# 结果不只取决于引用的单元格的函数，修改任何单元格后都视为需要重新计算
+_VOLATILE_FUNCTIONS = {'INDIRECT', 'OFFSET', 'NOW', 'TODAY', 'RAND', 'RANDBETWEEN', 'RANDARRAY', 'CELL', 'INFO'}
+
+_ROW_TAG = f'{{{SHEET_MAIN_NS}}}row'
+_CELL_TAG = f'{{{SHEET_MAIN_NS}}}c'
+_FORMULA_TAG = f'{{{SHEET_MAIN_NS}}}f'
+_VALUE_TAG = f'{{{SHEET_MAIN_NS}}}v'
+
+
+class VersionConflict(Exception):
+    """文件在客户端读取之后已被修改"""
+
+
+def _json_value(value):
+    """把单元格的值转换为 JSON 可以表示的值，日期时间使用 ISO 格式"""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    return str(value)
+
+
+def _cell_change(change):
+    """校验一条单元格修改，返回 (工作表名, 行, 列, 值)，格式不正确时抛出 ValueError"""
+    if not isinstance(change, dict):
+        raise ValueError('每条修改应为包含 sheet、row、col、value 的对象')
+    sheet, row, col = change.get('sheet'), change.get('row'), change.get('col')
+    value = change.get('value')
+    if sheet is not None and not isinstance(sheet, str):
+        raise ValueError('sheet 应为工作表名称')
+    # bool 是 int 的子类，需要单独排除
+    # 第一行为表头，数据行从第二行开始
+    if not isinstance(row, int) or isinstance(row, bool) or not -1 <= row <= MAX_ROWS - 2:
+        raise ValueError(f'row 应为 -1 到 {MAX_ROWS - 2} 之间的整数（-1 表示表头）')
+    if not isinstance(col, int) or isinstance(col, bool) or not 0 <= col < MAX_COLUMNS:
+        raise ValueError(f'col 应为 0 到 {MAX_COLUMNS - 1} 之间的整数')
+    if value is not None and not isinstance(value, (bool, int, float, str)):
+        raise ValueError('value 只能是字符串、数字、布尔值或 null')
+    return sheet, row, col, value
+
+
+def _trim(row):
+    """去掉行尾的空单元格"""
+    end = len(row)
+    while end and row[end - 1] is None:
+        end -= 1
+    return row[:end]
+
+
+def _string_array(values):
+    return pa.array([None if value is None else str(_json_value(value)) for value in values], pa.string())
+
+
+def _column_chunk(values):
+    """把一列的一批值转换为 Arrow 数组，类型混合的列转换为字符串"""
+    try:
+        return pa.array(values)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError):
+        return _string_array(values)
+
+
+def _batch_columns(batch):
+    """把一批行按列转换为 Arrow 数组，列数为这批行中最长一行的长度"""
+    width = max(len(row) for row in batch)
+    return [_column_chunk([row[i] if i < len(row) else None for row in batch]) for i in range(width)]
+
+
+def _concat_column(chunks):
+    """合并同一列的各批数组：类型一致时保持原类型，整数和浮点数混合时转为浮点数，其余转为字符串"""
+    types = {chunk.type for chunk in chunks if chunk.type != pa.null()}
+    if not types:
+        target = pa.null()
+    elif len(types) == 1:
+        target = types.pop()
+    elif all(pa.types.is_integer(t) or pa.types.is_floating(t) for t in types):
+        target = pa.float64()
+    else:
+        target = pa.string()
+    return pa.chunked_array([
+        _string_array(chunk.to_pylist()) if target == pa.string() and chunk.type != pa.string()
+        else chunk.cast(target, safe=False)
+        for chunk in chunks
+    ], target)
+
+
+class SpreadsheetService:
+    """大表格的按需读取
+
+    第一次访问时用 openpyxl 只读模式流式解析一遍工作簿，结果加密写入预览缓存：
+    安装了 pyarrow 时每个工作表保存为一个 Arrow IPC 文件（按列存储），
+    读取时解密到明文缓存并内存映射；否则按固定行数分页保存为 JSON。
+    第一行作为表头单独返回。
+    """
+
+    def __init__(self):
+        self.file_service = FileService()
+        self.engine = self.file_service.preview_engine
+
+    def get_sheets(self, file: File):
+        """获取工作表列表：名称、数据行数（不含表头）和表头"""
+        return self.file_service.cached_preview(
+            file, 'xlsx-sheets',
+            lambda: self.file_service.rebuild_preview(file, 'xlsx', lambda: self._build_index(file))[0]
+        )
+
+    def find_sheet(self, file: File, name=None):
+        """按名称查找工作表，未指定名称时返回第一个；不存在时抛出 KeyError"""
+        sheets = self.get_sheets(file)
+        if name is None and sheets:
+            return sheets[0]
+        for sheet in sheets:
+            if sheet['name'] == name:
+                return sheet
+        raise KeyError(f'工作表不存在: {name}')
+
+    def get_rows(self, file: File, sheet=None, offset=0, limit=None):
+        """读取工作表中 [offset, offset + limit) 范围内的数据行
+
+        Returns:
+            {'sheet', 'columns', 'offset', 'limit', 'total_rows', 'rows'}，rows 为二维数组
+        """
+        limit = Config.EXCEL_WINDOW_DEFAULT if limit is None else limit
+        if offset < 0:
+            raise ValueError('offset 不能为负数')
+        if not 1 <= limit <= Config.EXCEL_WINDOW_MAX:
+            raise ValueError(f'limit 应在 1 到 {Config.EXCEL_WINDOW_MAX} 之间')
+
+        info = sheet if isinstance(sheet, dict) else self.find_sheet(file, sheet)
+        end = min(offset + limit, info['rows'])
+        rows = []
+        if offset < end and pa is not None:
+            window = self._table(file, info['index']).slice(offset, end - offset)
+            columns = [column.to_pylist() for column in window.columns]
+            rows = [_trim([_json_value(value) for value in row]) for row in zip(*columns)]
+        elif offset < end:
+            page_rows = Config.EXCEL_PAGE_ROWS
+            first_page, last_page = offset // page_rows, (end - 1) // page_rows
+            for page in range(first_page, last_page + 1):
+                rows.extend(self._page(file, info['index'], page))
+            start = offset - first_page * page_rows
+            rows = rows[start:start + end - offset]
+
+        return {
+            'sheet': info['name'],
+            'columns': info['columns'],
+            'offset': offset,
+            'limit': limit,
+            'total_rows': info['rows'],
+            'rows': rows
+        }
+
+    def get_column_stats(self, file: File, sheet=None):
+        """统计工作表每一列：类型、非空数、空值数；数值和日期列的最小值、最大值，数值列的和与平均值，文本列的不同值个数
+
+        未安装 pyarrow 时抛出 RuntimeError。
+        """
+        if pa is None:
+            raise RuntimeError('列统计需要安装 pyarrow')
+        info = sheet if isinstance(sheet, dict) else self.find_sheet(file, sheet)
+        return self.file_service.cached_preview(
+            file, 'xlsx-stats', lambda: self._column_stats(file, info), params=[info['index']]
+        )
+
+    def patch_cells(self, file: File, changes, user_id=None, expected_version=None):
+        """按单元格修改工作簿并保存为新版本
+
+        在原工作簿上修改，保留格式、公式和未修改的单元格，保存后只重新加密一次。
+        行列号与 get_rows 一致：row 为从 0 开始的数据行（-1 为表头），col 从 0 开始；
+        以 = 开头的字符串按公式写入。同一文件的修改在进程之间串行执行。
+
+        Args:
+            changes: [{'sheet', 'row', 'col', 'value'}]，sheet 为空时修改第一个工作表
+            expected_version: 客户端读取时的文件版本（或以版本开头的 ETag），文件已被修改时抛出 VersionConflict
+
+        openpyxl 保存时不保留公式的缓存结果，保存后写回结果不受这次修改影响的公式的缓存结果；
+        受影响的（以及新写入的）公式结果留空，由 Excel 打开时重新计算。
+
+        Returns:
+            {'updated': 修改的单元格数, 'stale_formulas': 缓存结果被清空、需要重新计算的公式数}
+        """
+        if not isinstance(changes, list) or not changes:
+            raise ValueError('changes 应为非空数组')
+        if len(changes) > Config.EXCEL_PATCH_MAX_CHANGES:
+            raise ValueError(f'单次最多修改 {Config.EXCEL_PATCH_MAX_CHANGES} 个单元格')
+        changes = [_cell_change(change) for change in changes]
+
+        lock_path = os.path.join(Config.TEMP_FOLDER, f'.excel-patch-{file.id}.lock')
+        with file_lock(lock_path):
+            # 等待锁期间文件可能已被其他请求修改
+            db.session.refresh(file)
+            version = self.file_service.content_version(file)
+            # 也接受 excel/rows 等接口返回的以版本开头的 ETag
+            if expected_version is not None and expected_version != version \
+                    and not expected_version.startswith(f'{version}-'):
+                raise VersionConflict('文件已被修改，请刷新后重试')
+
+            # 在沙箱进程中修改并保存到临时文件
+            out_dir = tempfile.mkdtemp(dir=Config.TEMP_FOLDER)
+            try:
+                out_path = os.path.join(out_dir, 'workbook')
+                keep_vba = file.filename.lower().endswith('.xlsm')
+                stale = self.engine.run(file, 'xlsx-patch', changes, out_path, keep_vba)
+                with open(out_path, 'rb') as output:
+                    self.file_service.replace_content(file, output)
+            finally:
+                shutil.rmtree(out_dir, ignore_errors=True)
+
+        self.file_service.log_operation(
+            user_id=user_id or file.owner_id,
+            file_id=file.id,
+            operation_type='edit',
+            operation_detail=f'修改文件{file.filename}的 {len(changes)} 个单元格'
+        )
+        return {'updated': len(changes), 'stale_formulas': stale}
+
+    def _column_stats(self, file, info):
+        table = self._table(file, info['index'])
+        columns = []
+        for i, column in enumerate(table.columns):
+            stats = {
+                'name': info['columns'][i] if i < len(info['columns']) else '',
+                'type': str(column.type),
+                'count': len(column) - column.null_count,
+                'nulls': column.null_count
+            }
+            if pa.types.is_integer(column.type) or pa.types.is_floating(column.type):
+                stats.update(pc.min_max(column).as_py())
+                stats['sum'] = pc.sum(column).as_py()
+                stats['mean'] = pc.mean(column).as_py()
+            elif pa.types.is_temporal(column.type):
+                stats.update({key: _json_value(value) for key, value in pc.min_max(column).as_py().items()})
+            elif pa.types.is_string(column.type):
+                stats['distinct'] = pc.count_distinct(column).as_py()
+            columns.append(stats)
+        return {'sheet': info['name'], 'total_rows': info['rows'], 'columns': columns}
+
+    def _arrow_key(self, file, sheet_index):
+        version = self.file_service.content_version(file)
+        return preview_key(file.id, version, 'xlsx-arrow', [sheet_index])
+
+    def _arrow_bytes(self, file, sheet_index):
+        """读取工作表的 Arrow IPC 文件，未命中时重新解析工作簿（同一版本的并发请求只解析一次）"""
+        key = self._arrow_key(file, sheet_index)
+        cache = get_preview_cache()
+        data = cache.load(key) if cache else None
+        if data is None:
+            data = self.file_service.rebuild_preview(
+                file, 'xlsx', lambda: self._build_index(file, want=sheet_index), key
+            )[1]
+        return data
+
+    def _table(self, file, sheet_index):
+        """打开工作表的 Arrow 表：解密到明文缓存后内存映射，不占用进程内存"""
+        plaintext_cache = get_plaintext_cache()
+        if plaintext_cache:
+            try:
+                path = plaintext_cache.get_or_create(
+                    self._arrow_key(file, sheet_index),
+                    lambda: [self._arrow_bytes(file, sheet_index)]
+                )
+                return pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+            except OSError as e:
+                # 明文缓存空间不足时读入内存
+                print(f"Error in fill plaintext cache: {str(e)}")  # 调试日志
+        return pa.ipc.open_file(pa.BufferReader(self._arrow_bytes(file, sheet_index))).read_all()
+
+    def _page_key(self, file, sheet_index, page):
+        version = self.file_service.content_version(file)
+        return preview_key(file.id, version, 'xlsx-page', [sheet_index, page])
+
+    def _page(self, file, sheet_index, page):
+        key = self._page_key(file, sheet_index, page)
+        cache = get_preview_cache()
+        data = cache.load(key) if cache else None
+        if data is None:
+            # 缓存未启用或分页已被淘汰：重新解析整个工作簿，同一版本的并发请求只解析一次
+            data = self.file_service.rebuild_preview(
+                file, 'xlsx', lambda: self._build_index(file, want=(sheet_index, page)), key
+            )[1]
+        return json.loads(data) if data else []
+
+    def _build_index(self, file: File, want=None):
+        """在沙箱进程中流式解析工作簿，把每个工作表的数据写入预览缓存
+
+        want 指定同时返回的数据：使用 Arrow 时为工作表序号，返回该工作表的 IPC 文件；
+        使用 JSON 分页时为 (工作表序号, 页号)，返回该页 JSON 编码的数据行。
+
+        Returns:
+            (工作表列表, want 对应的数据)
+        """
+        cache = get_preview_cache()
+        page_rows = Config.EXCEL_PAGE_ROWS
+        wanted = None
+
+        out_dir = tempfile.mkdtemp(dir=Config.TEMP_FOLDER)
+        try:
+            # 由当前进程决定输出格式，读取方式与沙箱进程写入的格式一致
+            sheets = self.engine.run(file, 'xlsx-index', out_dir, page_rows, pa is not None)
+            for sheet in sheets:
+                index = sheet['index']
+                if pa is not None:
+                    parts = [(index, self._arrow_key(file, index), _arrow_path(out_dir, index))]
+                else:
+                    parts = [((index, page), self._page_key(file, index, page), _page_path(out_dir, index, page))
+                             for page in range(math.ceil(sheet['rows'] / page_rows))]
+                for part, key, path in parts:
+                    if not cache and want != part:
+                        continue
+                    with open(path, 'rb') as f:
+                        data = f.read()
+                    if cache:
+                        cache.store(key, data, evict=False)
+                    if want == part:
+                        wanted = data
+        finally:
+            shutil.rmtree(out_dir, ignore_errors=True)
+
+        if cache:
+            cache.evict()
+        return sheets, wanted
+
+
+# 以下处理器在沙箱进程中执行，第一个参数为解密后的文件路径
+
+def _arrow_path(out_dir, sheet_index):
+    return os.path.join(out_dir, f'{sheet_index}.arrow')
+
+
+def _page_path(out_dir, sheet_index, page):
+    return os.path.join(out_dir, f'{sheet_index}-{page}.json')
+
+
+def _dump_page(out_dir, sheet_index, number, page):
+    with open(_page_path(out_dir, sheet_index, number), 'w', encoding='utf-8') as f:
+        json.dump(page, f, ensure_ascii=False)
+
+
+def _write_pages(out_dir, sheet_index, rows, page_rows):
+    """把数据行按 page_rows 分页保存为 JSON 文件，返回行数"""
+    total = 0
+    page = []
+    for row in rows:
+        page.append([_json_value(value) for value in _trim(row)])
+        total += 1
+        if len(page) == page_rows:
+            _dump_page(out_dir, sheet_index, (total - 1) // page_rows, page)
+            page = []
+    if page:
+        _dump_page(out_dir, sheet_index, (total - 1) // page_rows, page)
+    return total
+
+
+def _write_arrow(out_dir, sheet_index, rows, batch_rows):
+    """把数据行按列转换为 Arrow 表并保存为 IPC 文件，返回行数
+
+    每 batch_rows 行转换一批，进程内只保留紧凑的列数组而不是逐行的 Python 对象。
+    """
+    chunks = []  # 每批的 (行数, 各列数组)
+    batch = []
+    for row in rows:
+        batch.append(_trim(row))
+        if len(batch) == batch_rows:
+            chunks.append((len(batch), _batch_columns(batch)))
+            batch = []
+    if batch:
+        chunks.append((len(batch), _batch_columns(batch)))
+
+    # 至少保留一列，全是空行的工作表也能保留行数
+    width = max([len(arrays) for _, arrays in chunks] + [1])
+
+    columns = []
+    for i in range(width):
+        column_chunks = [arrays[i] if i < len(arrays) else pa.nulls(count) for count, arrays in chunks]
+        columns.append(_concat_column(column_chunks) if column_chunks else pa.chunked_array([], pa.null()))
+    table = pa.table(columns, names=[f'c{i}' for i in range(width)])
+
+    with pa.OSFile(_arrow_path(out_dir, sheet_index), 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table, max_chunksize=batch_rows)
+    return table.num_rows
+
+
+@preview_handler('spreadsheet', 'xlsx-index')
+def _parse_workbook(file_path, out_dir, page_rows, use_arrow):
+    """流式解析工作簿，每个工作表的数据写入 out_dir，返回工作表列表
+
+    use_arrow 为 True 时每个工作表写为一个 Arrow IPC 文件，否则按 page_rows 行分页写为 JSON。
+    第一行作为表头单独返回。
+    """
+    sheets = []
+    workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        for index, worksheet in enumerate(workbook.worksheets):
+            rows = worksheet.iter_rows(values_only=True)
+            header = _trim(next(rows, ()))
+            columns = ['' if value is None else str(_json_value(value)) for value in header]
+
+            if use_arrow:
+                total = _write_arrow(out_dir, index, rows, page_rows)
+            else:
+                total = _write_pages(out_dir, index, rows, page_rows)
+
+            sheets.append({'index': index, 'name': worksheet.title, 'rows': total, 'columns': columns})
+    finally:
+        workbook.close()
+    return sheets
+
+
+def _formula_refs(formula, sheet):
+    """解析公式引用的区域，返回 [(工作表名, (min_col, min_row, max_col, max_row))]
+
+    整行、整列引用的边界中对应的一项为 None。包含易变函数或无法确定的引用
+    （名称、结构化引用、跨多个工作表或外部工作簿的引用）时返回 None。
+    """
+    try:
+        tokens = Tokenizer(formula).items
+    except TokenizerError:
+        return None
+    refs = []
+    for token in tokens:
+        if token.type == Token.FUNC and token.subtype == Token.OPEN:
+            # 新函数带有 _xlfn. 等前缀
+            if token.value[:-1].upper().rsplit('.', 1)[-1] in _VOLATILE_FUNCTIONS:
+                return None
+        elif token.type == Token.OPERAND and token.subtype == Token.RANGE:
+            target, _, area = token.value.rpartition('!')
+            if target.startswith("'") and target.endswith("'"):
+                target = target[1:-1].replace("''", "'")
+            if '[' in target or ':' in target:
+                return None
+            try:
+                bounds = range_boundaries(area.replace('$', '').upper())
+            except ValueError:
+                return None
+            # 超出工作表范围的是名称（如 ZZZ1）
+            if (bounds[2] or 0) > MAX_COLUMNS or (bounds[3] or 0) > MAX_ROWS:
+                return None
+            refs.append(((target or sheet).lower(), bounds))
+    return refs
+
+
+def _depends_on(refs, affected):
+    """引用的区域中是否包含受影响的单元格，affected 为 {小写工作表名: {(行, 列)}}"""
+    for sheet, (min_col, min_row, max_col, max_row) in refs:
+        cells = affected.get(sheet)
+        if not cells:
+            continue
+        if min_col is not None and min_row is not None and min_col == max_col and min_row == max_row:
+            if (min_row, min_col) in cells:
+                return True
+            continue
+        for row, col in cells:
+            if (min_col is None or min_col <= col <= max_col) and (min_row is None or min_row <= row <= max_row):
+                return True
+    return False
+
+
+def _stale_formulas(worksheets, results, changed):
+    """找出结果可能因修改而改变的原有公式，返回 {(工作表名, 坐标)}
+
+    从修改的单元格出发，反复标记引用了受影响单元格的公式，直到不再有新的公式受影响；
+    无法确定引用的公式总是视为受影响。
+
+    Args:
+        worksheets: {工作表名: 工作表}
+        results: _formula_results 读取的 {工作表名: {坐标: 缓存结果}}
+        changed: 修改的单元格 [(工作表名, 行, 列)]，行列从 1 开始
+    """
+    affected = {}
+    for title, row, col in changed:
+        affected.setdefault(title.lower(), set()).add((row, col))
+
+    formulas = []
+    for title, cells in results.items():
+        for coord in cells:
+            value = worksheets[title][coord].value
+            if isinstance(value, ArrayFormula):
+                value = value.text
+            if not isinstance(value, str) or not value.startswith('='):
+                # 已被修改为普通值，或为模拟运算表等无法解析的公式
+                refs = None
+            else:
+                refs = _formula_refs(value, title.lower())
+            formulas.append(((title, coord), coordinate_to_tuple(coord), refs))
+
+    stale = set()
+    # 按工作表中的顺序扫描，引用上方单元格的公式链在一遍内标记完
+    updated = True
+    while updated:
+        updated = False
+        for key, position, refs in formulas:
+            if key in stale or (refs is not None and not _depends_on(refs, affected)):
+                continue
+            stale.add(key)
+            affected.setdefault(key[0].lower(), set()).add(position)
+            updated = True
+    return stale
+
+
+def _formula_results(archive, part):
+    """读取工作表 XML 中公式单元格的缓存结果，返回 {坐标: (类型, 结果)}，没有缓存结果时结果为 None"""
+    results = {}
+    with archive.open(part) as source:
+        for _, element in iterparse(source):
+            if element.tag == _CELL_TAG:
+                coord = element.get('r')
+                if coord and element.find(_FORMULA_TAG) is not None:
+                    value = element.find(_VALUE_TAG)
+                    results[coord] = (element.get('t'), None if value is None else value.text)
+            elif element.tag == _ROW_TAG:
+                element.clear()
+    return results
+
+
+def _fill_results(data, results, skip):
+    """把缓存结果写入 openpyxl 保存的工作表 XML 中的公式单元格，跳过 skip 中的坐标"""
+    root = fromstring(data)
+    for cell in root.iter(_CELL_TAG):
+        coord = cell.get('r')
+        if coord in skip or coord not in results or cell.find(_FORMULA_TAG) is None:
+            continue
+        data_type, text = results[coord]
+        if text is None:
+            continue
+        value = cell.find(_VALUE_TAG)
+        if value is None:
+            value = SubElement(cell, _VALUE_TAG)
+        value.text = text
+        if data_type:
+            cell.set('t', data_type)
+        else:
+            cell.attrib.pop('t', None)
+    return tostring(root)
+
+
+def _restore_results(path, parts, results, skip):
+    """重写 openpyxl 保存的工作簿，写回公式的缓存结果
+
+    Args:
+        parts: {工作表名: 保存后的工作表 XML 路径}
+        results: {工作表名: {坐标: 缓存结果}}
+        skip: 不写回的 {(工作表名, 坐标)}
+    """
+    sheets = {part: title for title, part in parts.items() if results.get(title)}
+    if not sheets:
+        return
+    temp_path = f'{path}.tmp'
+    with zipfile.ZipFile(path) as source, zipfile.ZipFile(temp_path, 'w', zipfile.ZIP_DEFLATED) as target:
+        for item in source.infolist():
+            data = source.read(item)
+            title = sheets.get(item.filename)
+            if title is not None:
+                data = _fill_results(data, results[title], {coord for sheet, coord in skip if sheet == title})
+            target.writestr(item, data)
+    os.replace(temp_path, path)
+
+
+@preview_handler('spreadsheet', 'xlsx-patch')
+def _patch_workbook(file_path, changes, out_path, keep_vba):
+    """把单元格修改应用到工作簿并保存到 out_path，工作表不存在时抛出 KeyError
+
+    openpyxl 读取公式时不保留缓存的结果，保存后按 data_only 读取的程序只能读到空值。
+    修改前从原文件的 XML 中读出公式的缓存结果，保存后把未受修改影响的结果写回。
+
+    Returns:
+        缓存结果被清空、需要重新计算的公式数（包括新写入的公式）
+    """
+    reader = ExcelReader(file_path, keep_vba=keep_vba)
+    reader.read()
+    workbook = reader.wb
+    try:
+        worksheets = {worksheet.title: worksheet for worksheet in workbook.worksheets}
+        changed = []
+        skip = set()
+        new_formulas = set()
+        for sheet, row, col, value in changes:
+            worksheet = workbook.worksheets[0] if sheet is None else worksheets.get(sheet)
+            if worksheet is None:
+                raise KeyError(f'工作表不存在: {sheet}')
+            # 第一行为表头，数据行从第二行开始
+            cell = worksheet.cell(row=row + 2, column=col + 1)
+            cell.value = value
+            changed.append((worksheet.title, cell.row, cell.column))
+            skip.add((worksheet.title, cell.coordinate))
+            if isinstance(value, str) and value.startswith('='):
+                new_formulas.add((worksheet.title, cell.coordinate))
+            else:
+                new_formulas.discard((worksheet.title, cell.coordinate))
+
+        with zipfile.ZipFile(file_path) as archive:
+            results = {sheet.name: _formula_results(archive, rel.target)
+                       for sheet, rel in reader.parser.find_sheets() if sheet.name in worksheets}
+        stale = _stale_formulas(worksheets, results, changed)
+
+        workbook.save(out_path)
+        parts = {worksheet.title: worksheet.path.lstrip('/') for worksheet in workbook.worksheets}
+        _restore_results(out_path, parts, results, stale | skip)
+    finally:
+        workbook.close()
+    return len(stale - skip) + len(new_formulas)
@@ -0,0 +1,169 @@
+import bisect
+import codecs
+import itertools
+from app.models.file import File
+from app.services.file_service import FileService
+from app.services.preview_engine import detect_type
+from app.utils.encoding import detect_encoding
+from config import Config
+
+
+def is_text_file(file: File):
+    return detect_type(file.filename, file.file_type) == 'text'
+
+
+def _find(data, newline, begin, shift):
+    """查找换行符，多字节编码（UTF-16/32）只接受与字符边界对齐的位置
+
+    shift 为 data[0] 相对文本开头（BOM 之后）的偏移。
+    """
+    width = len(newline)
+    i = data.find(newline, begin)
+    while width > 1 and i >= 0 and (shift + i) % width:
+        i = data.find(newline, i + 1)
+    return i
+
+
+def _count(data, newline, begin, end, shift):
+    """统计 data[begin:end] 中的换行符数"""
+    if len(newline) == 1:
+        return data.count(newline, begin, end)
+    count = 0
+    i = _find(data, newline, begin, shift)
+    while 0 <= i and i + len(newline) <= end:
+        count += 1
+        i = _find(data, newline, i + len(newline), shift)
+    return count
+
+
+def _iter_lines(chunks, encoding, max_length):
+    """把字节块解码并按 \\n 分行，产出 (行文本, 是否被截断)
+
+    行尾的 \\r 会被去掉；超过 max_length 的行只保留前 max_length 个字符，其余部分丢弃而不缓存。
+    """
+    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    line, truncated = '', False
+    for chunk in itertools.chain(chunks, [None]):
+        text = decoder.decode(b'', final=True) if chunk is None else decoder.decode(chunk)
+        start = 0
+        while True:
+            end = text.find('\n', start)
+            if not truncated:
+                line += text[start:] if end < 0 else text[start:end]
+                if len(line) > max_length:
+                    line, truncated = line[:max_length], True
+            if end < 0:
+                break
+            yield (line[:-1] if line.endswith('\r') else line), truncated
+            line, truncated = '', False
+            start = end + 1
+    if line or truncated:
+        # 最后一行没有换行符
+        yield line, truncated
+
+
+class TextService:
+    """大文本文件的按行读取
+
+    每个文件版本只完整扫描一次，建立稀疏的行索引：约每 TEXT_INDEX_BLOCK 字节记录一个
+    (行号, 行首偏移)，索引加密写入预览缓存。读取窗口时从最近的记录点开始解密，
+    耗时与文件总大小无关。
+    """
+
+    def __init__(self):
+        self.file_service = FileService()
+
+    def get_index(self, file: File):
+        """获取文件的行索引：{'encoding', 'bom', 'size', 'lines', 'checkpoints'}"""
+        return self.file_service.cached_preview(file, 'text-index', lambda: self._build_index(file))
+
+    def get_lines(self, file: File, offset=0, limit=None, tail=None):
+        """读取 [offset, offset + limit) 范围内的行；指定 tail 时读取最后 tail 行
+
+        Returns:
+            {'encoding', 'offset', 'limit', 'total_lines', 'lines', 'truncated'}，
+            truncated 为被截断的行在 lines 中的下标
+        """
+        if tail is not None:
+            limit = tail
+        limit = Config.TEXT_WINDOW_DEFAULT if limit is None else limit
+        if not 1 <= limit <= Config.TEXT_WINDOW_MAX:
+            raise ValueError(f'limit 应在 1 到 {Config.TEXT_WINDOW_MAX} 之间')
+        if offset < 0:
+            raise ValueError('offset 不能为负数')
+
+        index = self.get_index(file)
+        if tail is not None:
+            offset = max(index['lines'] - tail, 0)
+        end = min(offset + limit, index['lines'])
+
+        lines = []
+        truncated = []
+        if offset < end:
+            # 从窗口之前最近的记录点开始解密，跳过记录点到窗口之间的行
+            checkpoints = index['checkpoints']
+            line_number, position = checkpoints[bisect.bisect_right([c[0] for c in checkpoints], offset) - 1]
+            chunks = self.file_service.iter_decrypted(file, position)
+            try:
+                for text, cut in _iter_lines(chunks, index['encoding'], Config.TEXT_MAX_LINE_LENGTH):
+                    if line_number >= offset:
+                        if cut:
+                            truncated.append(len(lines))
+                        lines.append(text)
+                        if line_number + 1 >= end:
+                            break
+                    line_number += 1
+            finally:
+                chunks.close()
+
+        return {
+            'encoding': index['encoding'],
+            'offset': offset,
+            'limit': limit,
+            'total_lines': index['lines'],
+            'lines': lines,
+            'truncated': truncated
+        }
+
+    def _build_index(self, file: File):
+        """流式扫描整个文件，统计行数并记录行首偏移"""
+        sample = b''.join(self.file_service.iter_decrypted(file, 0, Config.TEXT_SAMPLE_SIZE))
+        encoding, bom = detect_encoding(sample)
+        newline = '\n'.encode(encoding)
+        width = len(newline)
+        block = Config.TEXT_INDEX_BLOCK
+
+        checkpoints = [[0, bom]]
+        lines = 0
+        threshold = bom + block
+        size = 0
+        data = carry = b''
+        for chunk in self.file_service.iter_decrypted(file):
+            # 多字节换行符可能跨越两个块，保留上一块末尾不足一个换行符的字节
+            data = carry + chunk
+            base = size - len(carry)
+            size += len(chunk)
+            shift = base - bom
+            pos = 0
+            while True:
+                # 越过阈值后，在下一个换行符之后记录一个行首
+                i = _find(data, newline, max(threshold - base, pos), shift)
+                if i < 0:
+                    lines += _count(data, newline, pos, len(data), shift)
+                    break
+                lines += _count(data, newline, pos, i + width, shift)
+                pos = i + width
+                checkpoints.append([lines, base + pos])
+                threshold = base + pos + block
+            carry = data[len(data) - width + 1:] if width > 1 else b''
+
+        if size > bom and not data.endswith(newline):
+            # 最后一行没有换行符
+            lines += 1
+        return {
+            'encoding': encoding,
+            'bom': bom,
+            'size': size,
+            'lines': lines,
+            'checkpoints': checkpoints
+        }
@@ -0,0 +1,173 @@
+import os
+import shutil
+import uuid
+from datetime import datetime
+from app import db
+from app.models.upload_session import UploadSession
+from app.services.file_service import FileService
+from app.utils.chunked_cipher import ChunkedCipher
+from app.utils.streams import IterReader
+from config import Config
+
+class UploadService:
+    """分片上传会话：创建会话、并行上传分片、查询缺失分片、提交合并"""
+
+    def __init__(self):
+        self.file_service = FileService()
+        # 分片在临时目录中同样加密保存，不落地明文
+        self.cipher = ChunkedCipher(Config.AES_KEY)
+
+    def session_dir(self, session_id):
+        return os.path.join(Config.TEMP_FOLDER, 'upload_sessions', session_id)
+
+    def part_path(self, session_id, index):
+        return os.path.join(self.session_dir(session_id), f'{index}.part')
+
+    def create_session(self, user_id, filename, total_size, content_hash=None):
+        """创建上传会话"""
+        if total_size > Config.UPLOAD_SESSION_MAX_SIZE:
+            raise ValueError(f'文件大小超过限制：{Config.UPLOAD_SESSION_MAX_SIZE} 字节')
+
+        filename = self.file_service.secure_filename_with_chinese(filename)
+        self.file_service.check_duplicate_name(filename, user_id)
+        self.cleanup_expired()
+
+        session = UploadSession(
+            id=uuid.uuid4().hex,
+            user_id=int(user_id),
+            filename=filename,
+            total_size=total_size,
+            chunk_size=Config.UPLOAD_SESSION_CHUNK_SIZE,
+            content_hash=content_hash,
+            expires_at=datetime.utcnow() + Config.UPLOAD_SESSION_TTL
+        )
+        db.session.add(session)
+        db.session.commit()
+        os.makedirs(self.session_dir(session.id), exist_ok=True)
+        return session
+
+    def get_session(self, session_id, user_id):
+        """获取用户自己的有效会话，不存在或已过期时返回 None"""
+        session = db.session.get(UploadSession, session_id)
+        if not session or session.user_id != int(user_id):
+            return None
+        if session.expires_at < datetime.utcnow():
+            return None
+        return session
+
+    def received_chunks(self, session):
+        """已完整接收的分片序号"""
+        directory = self.session_dir(session.id)
+        if not os.path.isdir(directory):
+            return []
+        received = []
+        for name in os.listdir(directory):
+            stem, ext = os.path.splitext(name)
+            if ext == '.part' and stem.isdigit():
+                received.append(int(stem))
+        return sorted(received)
+
+    def missing_chunks(self, session):
+        received = set(self.received_chunks(session))
+        return [i for i in range(session.total_chunks) if i not in received]
+
+    def put_chunk(self, session, index, stream):
+        """保存一个分片；同一分片重复上传时覆盖，先写临时文件再原子改名"""
+        if session.status != 'active':
+            raise ValueError('上传会话已提交')
+        if not 0 <= index < session.total_chunks:
+            raise ValueError(f'分片序号无效：{index}')
+
+        expected = session.expected_chunk_size(index)
+        path = self.part_path(session.id, index)
+        temp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        try:
+            received = 0
+            with open(temp_path, 'wb') as f:
+                writer = self.cipher.writer(f, Config.STORAGE_CHUNK_SIZE)
+                while True:
+                    data = stream.read(Config.STREAM_CHUNK_SIZE)
+                    if not data:
+                        break
+                    received += len(data)
+                    if received > expected:
+                        raise ValueError(f'分片 {index} 大小超出：应为 {expected} 字节')
+                    writer.write(data)
+                writer.close()
+
+            if received != expected:
+                raise ValueError(f'分片 {index} 大小不符：应为 {expected} 字节，实际 {received} 字节')
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def _iter_parts(self, session):
+        """按顺序逐块解密会话中的所有分片"""
+        for index in range(session.total_chunks):
+            with open(self.part_path(session.id, index), 'rb') as f:
+                yield from self.cipher.decrypt_stream(f)
+
+    def commit(self, session):
+        """合并所有分片写入去重存储并创建文件记录"""
+        missing = self.missing_chunks(session)
+        if missing:
+            raise ValueError(f'还有 {len(missing)} 个分片未上传')
+
+        # 原子地把会话标记为提交中，防止重复提交
+        updated = UploadSession.query.filter_by(id=session.id, status='active').update(
+            {'status': 'committing'}, synchronize_session=False
+        )
+        db.session.commit()
+        if not updated:
+            raise ValueError('上传会话正在提交或已提交')
+
+        blob_service = self.file_service.blob_service
+        blob = None
+        try:
+            # 先检查文件名，避免为注定失败的提交写入 blob
+            self.file_service.check_duplicate_name(session.filename, session.user_id)
+            blob = blob_service.store(
+                IterReader(self._iter_parts(session)),
+                self.file_service.compression_for(session.filename)
+            )
+            if session.content_hash and blob.content_hash != session.content_hash.lower():
+                raise ValueError('文件哈希校验失败，请重新上传')
+
+            file_type = self.file_service.get_friendly_file_type(
+                os.path.splitext(session.filename.lower())[1]
+            )
+            # create_file_record 接管 blob 引用，失败时由它释放
+            stored, blob = blob, None
+            db_file = self.file_service.create_file_record(
+                session.filename, file_type, stored, session.user_id
+            )
+        except Exception:
+            db.session.rollback()
+            if blob is not None:
+                blob_service.release(blob.id)
+            UploadSession.query.filter_by(id=session.id).update(
+                {'status': 'active'}, synchronize_session=False
+            )
+            db.session.commit()
+            raise
+
+        db.session.delete(session)
+        db.session.commit()
+        shutil.rmtree(self.session_dir(session.id), ignore_errors=True)
+        return db_file
+
+    def abort(self, session):
+        """放弃上传会话并删除已上传的分片"""
+        db.session.delete(session)
+        db.session.commit()
+        shutil.rmtree(self.session_dir(session.id), ignore_errors=True)
+
+    def cleanup_expired(self):
+        """清理过期的上传会话"""
+        expired = UploadSession.query.filter(UploadSession.expires_at < datetime.utcnow()).all()
+        for session in expired:
+            shutil.rmtree(self.session_dir(session.id), ignore_errors=True)
+            db.session.delete(session)
+        if expired:
+            db.session.commit()
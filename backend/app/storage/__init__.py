@@ -0,0 +1,38 @@
+import os
+from app.storage.base import StorageBackend, StorageWriter
+from app.storage.local import LocalStorage
+from config import Config
+
+__all__ = ['StorageBackend', 'StorageWriter', 'LocalStorage', 'create_storage', 'get_storage']
+
+_backends = {}
+
+
+def create_storage(config=Config):
+    """按配置创建存储后端：local（默认）或 s3"""
+    backend = config.STORAGE_BACKEND
+    if backend == 'local':
+        return LocalStorage(os.path.join(config.UPLOAD_FOLDER, 'blobs'))
+    if backend == 's3':
+        from app.storage.s3 import S3Storage
+        if not config.S3_BUCKET:
+            raise RuntimeError('使用 S3 存储需要配置 S3_BUCKET')
+        return S3Storage(
+            config.S3_BUCKET,
+            prefix=config.S3_PREFIX,
+            part_size=config.S3_MULTIPART_PART_SIZE,
+            endpoint_url=config.S3_ENDPOINT_URL,
+            region_name=config.S3_REGION,
+            aws_access_key_id=config.S3_ACCESS_KEY_ID,
+            aws_secret_access_key=config.S3_SECRET_ACCESS_KEY
+        )
+    raise RuntimeError(f'未知的存储后端: {backend}')
+
+
+def get_storage():
+    """获取当前配置对应的存储后端，相同配置复用同一个实例（S3 客户端可在线程间共享）"""
+    key = (Config.STORAGE_BACKEND, Config.UPLOAD_FOLDER, Config.S3_BUCKET,
+           Config.S3_PREFIX, Config.S3_ENDPOINT_URL)
+    if key not in _backends:
+        _backends[key] = create_storage()
+    return _backends[key]
@@ -0,0 +1,60 @@
+class StorageBackend:
+    """密文存储后端接口
+
+    对象以不透明的存储键（如 ab/cd/<id>）寻址，写入完成前对读取方不可见。
+    """
+
+    def open_read(self, key):
+        """打开对象，返回可 seek 的二进制只读文件对象；对象不存在时抛出 FileNotFoundError"""
+        raise NotImplementedError
+
+    def open_write(self, key):
+        """返回 StorageWriter，commit 后对象才可见，abort 则丢弃已写入的数据"""
+        raise NotImplementedError
+
+    def delete(self, key):
+        """删除对象，对象不存在时忽略"""
+        raise NotImplementedError
+
+    def exists(self, key):
+        raise NotImplementedError
+
+    def size(self, key):
+        """对象的字节数（密文大小）"""
+        raise NotImplementedError
+
+    def put_file(self, path, key):
+        """把本地文件复制到存储中，不删除原文件"""
+        with open(path, 'rb') as src, self.open_write(key) as dst:
+            while True:
+                data = src.read(1024 * 1024)
+                if not data:
+                    break
+                dst.write(data)
+
+
+class StorageWriter:
+    """存储写入器，作为上下文管理器使用时正常退出即提交，出现异常则放弃"""
+
+    def write(self, data):
+        raise NotImplementedError
+
+    def commit(self):
+        raise NotImplementedError
+
+    def abort(self):
+        raise NotImplementedError
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.abort()
+            return False
+        try:
+            self.commit()
+        except Exception:
+            self.abort()
+            raise
+        return False
@@ -0,0 +1,65 @@
+import os
+import uuid
+from app.storage.base import StorageBackend, StorageWriter
+
+
+class LocalStorage(StorageBackend):
+    """本地磁盘存储，存储键即 root 下的相对路径"""
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+
+    def path(self, key):
+        path = os.path.abspath(os.path.join(self.root, key))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f'无效的存储键: {key}')
+        return path
+
+    def open_read(self, key):
+        return open(self.path(key), 'rb')
+
+    def open_write(self, key):
+        return LocalWriter(self.path(key))
+
+    def delete(self, key):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def exists(self, key):
+        return os.path.exists(self.path(key))
+
+    def size(self, key):
+        return os.path.getsize(self.path(key))
+
+    def put_file(self, path, key):
+        """同一文件系统上使用硬链接，不复制数据"""
+        target = self.path(key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        try:
+            os.link(path, target)
+        except OSError:
+            super().put_file(path, key)
+
+
+class LocalWriter(StorageWriter):
+    """先写入同目录下的临时文件，提交时原子改名"""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.temp_path = os.path.join(os.path.dirname(path), f'.{uuid.uuid4().hex}.tmp')
+        self.file = open(self.temp_path, 'wb')
+
+    def write(self, data):
+        self.file.write(data)
+
+    def commit(self):
+        self.file.close()
+        os.replace(self.temp_path, self.path)
+
+    def abort(self):
+        self.file.close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
@@ -0,0 +1,166 @@
+import io
+from app.storage.base import StorageBackend, StorageWriter
+
+MIN_PART_SIZE = 5 * 1024 * 1024  # S3 要求除最后一段外每段至少 5MB
+
+
+def _not_found(error):
+    return error.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound')
+
+
+class S3Storage(StorageBackend):
+    """S3 兼容的对象存储（AWS S3、MinIO 等）
+
+    大对象使用分段上传，读取时按需发起 Range 请求，不下载整个对象。
+    """
+
+    def __init__(self, bucket, prefix='', part_size=8 * 1024 * 1024, client=None, **client_options):
+        if client is None:
+            try:
+                import boto3
+            except ImportError:
+                raise RuntimeError('使用 S3 存储需要安装 boto3')
+            client = boto3.client('s3', **{k: v for k, v in client_options.items() if v})
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.part_size = max(part_size, MIN_PART_SIZE)
+
+    def object_key(self, key):
+        return f'{self.prefix}{key}'
+
+    def _head(self, key):
+        from botocore.exceptions import ClientError
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self.object_key(key))
+        except ClientError as e:
+            if _not_found(e):
+                raise FileNotFoundError(f'对象不存在: {key}')
+            raise
+
+    def open_read(self, key):
+        size = self._head(key)['ContentLength']
+        return S3Reader(self.client, self.bucket, self.object_key(key), size)
+
+    def open_write(self, key):
+        return S3Writer(self.client, self.bucket, self.object_key(key), self.part_size)
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self.object_key(key))
+
+    def exists(self, key):
+        try:
+            self._head(key)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def size(self, key):
+        return self._head(key)['ContentLength']
+
+
+class S3Reader(io.RawIOBase):
+    """对象的只读文件视图，每次 read 对应一次 Range 请求"""
+
+    def __init__(self, client, bucket, key, size):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.size = size
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self.position + offset
+        elif whence == io.SEEK_END:
+            position = self.size + offset
+        else:
+            raise ValueError(f'无效的 whence: {whence}')
+        if position < 0:
+            raise ValueError('seek 位置不能为负数')
+        self.position = position
+        return position
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.size - self.position
+        end = min(self.position + size, self.size)
+        if end <= self.position:
+            return b''
+
+        response = self.client.get_object(
+            Bucket=self.bucket, Key=self.key,
+            Range=f'bytes={self.position}-{end - 1}'
+        )
+        data = response['Body'].read()
+        self.position += len(data)
+        return data
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+class S3Writer(StorageWriter):
+    """缓冲到 part_size 后分段上传，小对象直接一次 PUT"""
+
+    def __init__(self, client, bucket, key, part_size):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.buffer = bytearray()
+        self.upload_id = None
+        self.parts = []
+
+    def write(self, data):
+        self.buffer += data
+        while len(self.buffer) >= self.part_size:
+            self._upload_part(bytes(self.buffer[:self.part_size]))
+            del self.buffer[:self.part_size]
+
+    def _upload_part(self, data):
+        if self.upload_id is None:
+            response = self.client.create_multipart_upload(Bucket=self.bucket, Key=self.key)
+            self.upload_id = response['UploadId']
+        number = len(self.parts) + 1
+        response = self.client.upload_part(
+            Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+            PartNumber=number, Body=data
+        )
+        self.parts.append({'PartNumber': number, 'ETag': response['ETag']})
+
+    def commit(self):
+        if self.upload_id is None:
+            self.client.put_object(Bucket=self.bucket, Key=self.key, Body=bytes(self.buffer))
+        else:
+            if self.buffer:
+                self._upload_part(bytes(self.buffer))
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                MultipartUpload={'Parts': self.parts}
+            )
+        self.buffer = bytearray()
+
+    def abort(self):
+        self.buffer = bytearray()
+        if self.upload_id is not None:
+            try:
+                self.client.abort_multipart_upload(
+                    Bucket=self.bucket, Key=self.key, UploadId=self.upload_id
+                )
+            except Exception as e:
+                print(f"Error aborting multipart upload: {str(e)}")
+            self.upload_id = None
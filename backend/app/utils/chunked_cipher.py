@@ -0,0 +1,248 @@
+from Crypto.Cipher import AES
+from Crypto.Random import get_random_bytes
+import hashlib
+import struct
+from app.utils.compression import CODEC_NONE, get_codec
+from app.utils.parallel import OrderedPipeline, imap_ordered
+
+# 分块密文格式（可随机访问）
+#
+#   头部    magic | version | codec | reserved | chunk_size | nonce_prefix
+#   数据块  每块独立 AES-GCM 加密：密文 + 16 字节认证标签
+#   索引    每块在磁盘上的长度（uint32），最高位表示该块未压缩
+#   尾部    明文总长 | 块数 | 索引认证标签 | 结束标记
+#
+# 各块相互独立，读写时交给线程池并行加解密，按顺序输出。
+#
+# 第 i 块的 nonce 为 nonce_prefix + i，头部作为附加认证数据，
+# 因此块被调换、截断或篡改都会在解密时被发现。
+#
+# codec 不为 0 时每块先压缩再加密（版本 2），各块独立压缩以保持随机访问；
+# 压缩后没有变小的块按原样保存，并在索引中标记。
+MAGIC = b'CSC1'
+END_MAGIC = b'CSCE'
+VERSION = 1
+VERSION_COMPRESSED = 2
+
+HEADER = struct.Struct('>4sBBHI8s')
+TRAILER = struct.Struct('>QI16s4s')
+INDEX_ENTRY = struct.Struct('>I')
+TAG_SIZE = 16
+INDEX_NONCE = b'\xff\xff\xff\xff'
+RAW_FLAG = 0x80000000
+
+DEFAULT_CHUNK_SIZE = 512 * 1024  # 512KB
+
+
+def is_chunked(fileobj):
+    """判断文件对象是否为分块密文格式（读取后恢复读取位置）"""
+    position = fileobj.tell()
+    try:
+        fileobj.seek(0)
+        return fileobj.read(len(MAGIC)) == MAGIC
+    finally:
+        fileobj.seek(position)
+
+
+class ChunkedCipher:
+    def __init__(self, key):
+        """初始化分块加密器
+
+        Args:
+            key: 32字节的密钥
+        """
+        if isinstance(key, str):
+            key = key.encode('utf-8')
+        if len(key) != 32:
+            raise ValueError(f"AES key must be 32 bytes long, got {len(key)} bytes")
+        self.key = key
+
+    def writer(self, dst, chunk_size=DEFAULT_CHUNK_SIZE, codec=None):
+        """创建写入 dst 的分块加密写入器，codec 为压缩算法名称，None 表示不压缩"""
+        return ChunkedWriter(self.key, dst, chunk_size, codec)
+
+    def reader(self, src):
+        """打开 src 中的分块密文，返回可随机读取的解密器"""
+        return ChunkedReader(self.key, src)
+
+    def encrypt_stream(self, src, dst, chunk_size=DEFAULT_CHUNK_SIZE, codec=None):
+        """流式加密：从 src 分块读取明文并写出分块密文
+
+        Returns:
+            (明文字节数, 明文 sha256 十六进制摘要)
+        """
+        writer = self.writer(dst, chunk_size, codec)
+        while True:
+            data = src.read(chunk_size)
+            if not data:
+                break
+            writer.write(data)
+        return writer.close()
+
+    def decrypt_stream(self, src, start=0, end=None):
+        """逐块解密 [start, end) 范围内的明文"""
+        return self.reader(src).iter_range(start, end)
+
+
+class ChunkedWriter:
+    def __init__(self, key, dst, chunk_size=DEFAULT_CHUNK_SIZE, codec=None):
+        self.key = key
+        self.dst = dst
+        self.chunk_size = chunk_size
+        self.codec = get_codec(codec or CODEC_NONE)
+        codec_id = self.codec.id if self.codec else CODEC_NONE
+        version = VERSION_COMPRESSED if self.codec else VERSION
+        self.nonce_prefix = get_random_bytes(8)
+        self.header = HEADER.pack(MAGIC, version, codec_id, 0, chunk_size, self.nonce_prefix)
+        self.lengths = []
+        self.chunk_index = 0
+        self.pipeline = OrderedPipeline()
+        self.size = 0
+        self.digest = hashlib.sha256()
+        self.buffer = bytearray()
+        self.closed = False
+        dst.write(self.header)
+
+    def write(self, data):
+        """写入明文，凑满一块即加密输出"""
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self.size += len(data)
+        self.digest.update(data)
+        self.buffer += data
+        while len(self.buffer) >= self.chunk_size:
+            self._write_chunk(bytes(self.buffer[:self.chunk_size]))
+            del self.buffer[:self.chunk_size]
+
+    def _write_chunk(self, plain):
+        index = self.chunk_index
+        self.chunk_index += 1
+        self._emit(self.pipeline.submit(self._seal, index, plain))
+
+    def _seal(self, index, plain):
+        """压缩并加密一块（在线程池中执行）"""
+        flag = 0
+        if self.codec:
+            compressed = self.codec.compress(plain)
+            if len(compressed) < len(plain):
+                plain = compressed
+            else:
+                flag = RAW_FLAG
+        cipher = AES.new(self.key, AES.MODE_GCM, nonce=self.nonce_prefix + INDEX_ENTRY.pack(index))
+        cipher.update(self.header)
+        encrypted, tag = cipher.encrypt_and_digest(plain)
+        return encrypted, tag, flag
+
+    def _emit(self, sealed):
+        """按顺序写出已加密的块"""
+        for encrypted, tag, flag in sealed:
+            self.dst.write(encrypted)
+            self.dst.write(tag)
+            self.lengths.append((len(encrypted) + TAG_SIZE) | flag)
+
+    def close(self):
+        """写出剩余数据、块索引和尾部
+
+        Returns:
+            (明文字节数, 明文 sha256 十六进制摘要)
+        """
+        if not self.closed:
+            if self.buffer:
+                self._write_chunk(bytes(self.buffer))
+                self.buffer = bytearray()
+            self._emit(self.pipeline.drain())
+
+            index = b''.join(INDEX_ENTRY.pack(length) for length in self.lengths)
+            counts = struct.pack('>QI', self.size, len(self.lengths))
+            cipher = AES.new(self.key, AES.MODE_GCM, nonce=self.nonce_prefix + INDEX_NONCE)
+            cipher.update(self.header + index + counts)
+            tag = cipher.digest()
+
+            self.dst.write(index)
+            self.dst.write(TRAILER.pack(self.size, len(self.lengths), tag, END_MAGIC))
+            self.closed = True
+
+        return self.size, self.digest.hexdigest()
+
+
+class ChunkedReader:
+    def __init__(self, key, src):
+        self.key = key
+        self.src = src
+
+        src.seek(0)
+        self.header = src.read(HEADER.size)
+        if len(self.header) != HEADER.size:
+            raise ValueError('密文文件头不完整')
+        magic, version, codec_id, _, self.chunk_size, self.nonce_prefix = HEADER.unpack(self.header)
+        if magic != MAGIC:
+            raise ValueError('不是分块密文格式')
+        if version not in (VERSION, VERSION_COMPRESSED):
+            raise ValueError(f'不支持的分块密文版本: {version}')
+        self.codec = get_codec(codec_id) if version == VERSION_COMPRESSED else None
+
+        src.seek(-TRAILER.size, 2)
+        trailer_offset = src.tell()
+        self.size, count, tag, end_magic = TRAILER.unpack(src.read(TRAILER.size))
+        if end_magic != END_MAGIC:
+            raise ValueError('密文文件尾不完整')
+
+        index_offset = trailer_offset - count * INDEX_ENTRY.size
+        src.seek(index_offset)
+        index = src.read(count * INDEX_ENTRY.size)
+
+        # 校验块索引和长度信息，防止截断或替换
+        cipher = AES.new(self.key, AES.MODE_GCM, nonce=self.nonce_prefix + INDEX_NONCE)
+        cipher.update(self.header + index + struct.pack('>QI', self.size, count))
+        cipher.verify(tag)
+
+        self.offsets = []
+        self.lengths = []
+        self.raw = []
+        offset = HEADER.size
+        for (entry,) in INDEX_ENTRY.iter_unpack(index):
+            length = entry & ~RAW_FLAG
+            self.offsets.append(offset)
+            self.lengths.append(length)
+            self.raw.append(bool(entry & RAW_FLAG))
+            offset += length
+        if offset != index_offset:
+            raise ValueError('块索引与文件长度不一致')
+
+    @property
+    def chunk_count(self):
+        return len(self.lengths)
+
+    def read_chunk(self, index):
+        """读取并解密第 index 块"""
+        return self._open(index, self._read_raw(index))
+
+    def _read_raw(self, index):
+        self.src.seek(self.offsets[index])
+        return self.src.read(self.lengths[index])
+
+    def _open(self, index, data):
+        """解密并解压一块（在线程池中执行）"""
+        cipher = AES.new(self.key, AES.MODE_GCM, nonce=self.nonce_prefix + INDEX_ENTRY.pack(index))
+        cipher.update(self.header)
+        plain = cipher.decrypt_and_verify(data[:-TAG_SIZE], data[-TAG_SIZE:])
+        if self.codec and not self.raw[index]:
+            plain = self.codec.decompress(plain, self.chunk_size)
+        return plain
+
+    def iter_range(self, start=0, end=None):
+        """逐块产出 [start, end) 范围内的明文，只解密涉及到的块"""
+        if end is None or end > self.size:
+            end = self.size
+        if start >= end:
+            return
+
+        first = start // self.chunk_size
+        last = (end - 1) // self.chunk_size
+        # 在当前线程按顺序读取密文，解密交给线程池并行执行
+        jobs = ((index, self._read_raw(index)) for index in range(first, last + 1))
+        for index, plain in zip(range(first, last + 1), imap_ordered(self._open, jobs)):
+            chunk_start = index * self.chunk_size
+            lo = max(start - chunk_start, 0)
+            hi = min(end - chunk_start, len(plain))
+            yield plain[lo:hi]
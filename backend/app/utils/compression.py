@@ -0,0 +1,78 @@
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # zstandard 为可选依赖，未安装时使用 zlib
+    zstandard = None
+
+# 分块密文头部中记录的压缩算法编号
+CODEC_NONE = 0
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+
+CODEC_NAMES = {CODEC_NONE: 'none', CODEC_ZLIB: 'zlib', CODEC_ZSTD: 'zstd'}
+CODEC_IDS = {name: codec_id for codec_id, name in CODEC_NAMES.items()}
+
+
+class ZlibCodec:
+    id = CODEC_ZLIB
+    name = 'zlib'
+
+    def __init__(self, level=6):
+        self.level = level
+
+    def compress(self, data):
+        return zlib.compress(data, self.level)
+
+    def decompress(self, data, max_size):
+        decompressor = zlib.decompressobj()
+        plain = decompressor.decompress(data, max_size)
+        if decompressor.unconsumed_tail or not decompressor.eof:
+            raise ValueError('压缩数据块解压后超出块大小')
+        return plain
+
+
+class ZstdCodec:
+    id = CODEC_ZSTD
+    name = 'zstd'
+
+    def __init__(self, level=3):
+        if zstandard is None:
+            raise ValueError('使用 zstd 压缩需要安装 zstandard')
+        self.level = level
+
+    def compress(self, data):
+        # 压缩上下文不能跨线程共享，每次调用单独创建
+        return zstandard.ZstdCompressor(level=self.level).compress(data)
+
+    def decompress(self, data, max_size):
+        return zstandard.ZstdDecompressor().decompress(data, max_output_size=max_size)
+
+
+def get_codec(codec):
+    """按编号或名称获取压缩算法实例，不压缩时返回 None
+
+    实例不保存压缩状态，可以在加解密线程池中并发使用。
+    """
+    if isinstance(codec, str):
+        if codec not in CODEC_IDS:
+            raise ValueError(f'未知的压缩算法: {codec}')
+        codec = CODEC_IDS[codec]
+    if not codec:
+        return None
+    if codec == CODEC_ZLIB:
+        return ZlibCodec()
+    if codec == CODEC_ZSTD:
+        return ZstdCodec()
+    raise ValueError(f'未知的压缩算法编号: {codec}')
+
+
+def resolve_codec(name):
+    """写入时使用的压缩算法名称：未安装 zstandard 时 zstd 退回 zlib"""
+    if not name or name == 'none':
+        return 'none'
+    if name == 'zstd' and zstandard is None:
+        return 'zlib'
+    if name not in CODEC_IDS:
+        raise ValueError(f'未知的压缩算法: {name}')
+    return name
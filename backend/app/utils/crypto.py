@@ -1,5 +1,9 @@
 from Crypto.Cipher import AES
 from Crypto.Util.Padding import pad, unpad
+import hashlib
+
+# 流式加解密时每次读取的字节数
+DEFAULT_CHUNK_SIZE = 1024 * 1024  # 1MB
 
 class AESCipher:
     def __init__(self, key, iv):
@@ -52,6 +56,148 @@ class AESCipher:
             print(f"Error in encrypt_file: {str(e)}")
             raise
 
+    def encrypt_stream(self, src, dst, chunk_size=DEFAULT_CHUNK_SIZE):
+        """流式加密：分块读取明文并直接写出密文
+
+        输出与 encrypt_file 完全一致，但内存占用只与 chunk_size 有关。
+
+        Args:
+            src: 可 read() 的明文输入（如 werkzeug 的 FileStorage）
+            dst: 可 write() 的密文输出
+            chunk_size: 每次读取的字节数
+
+        Returns:
+            (明文字节数, 明文 sha256 十六进制摘要)
+        """
+        try:
+            cipher = AES.new(self.key, AES.MODE_CBC, self.iv)
+            digest = hashlib.sha256()
+            size = 0
+            pending = b''
+            
+            while True:
+                chunk = src.read(chunk_size)
+                if not chunk:
+                    break
+                if isinstance(chunk, str):
+                    chunk = chunk.encode('utf-8')
+                    
+                size += len(chunk)
+                digest.update(chunk)
+                
+                # 只加密完整的分组，剩余部分留到下一轮
+                pending += chunk
+                aligned = len(pending) - len(pending) % AES.block_size
+                if aligned:
+                    dst.write(cipher.encrypt(pending[:aligned]))
+                    pending = pending[aligned:]
+            
+            # 最后一个分组使用 PKCS7 填充
+            dst.write(cipher.encrypt(pad(pending, AES.block_size)))
+            
+            return size, digest.hexdigest()
+            
+        except Exception as e:
+            print(f"Error in encrypt_stream: {str(e)}")
+            raise
+
+    def decrypt_stream(self, src, chunk_size=DEFAULT_CHUNK_SIZE):
+        """流式解密：分块读取密文，逐块产出明文
+
+        始终保留最后一个分组，读到结尾后再去除 PKCS7 填充。
+
+        Args:
+            src: 可 read() 的密文输入
+            chunk_size: 每次读取的字节数
+
+        Yields:
+            明文字节块
+        """
+        cipher = AES.new(self.key, AES.MODE_CBC, self.iv)
+        pending = b''
+        
+        while True:
+            chunk = src.read(chunk_size)
+            if not chunk:
+                break
+                
+            pending += chunk
+            aligned = len(pending) - len(pending) % AES.block_size
+            # 留下最后一个完整分组，它可能包含填充
+            ready = aligned - AES.block_size
+            if ready > 0:
+                yield cipher.decrypt(pending[:ready])
+                pending = pending[ready:]
+        
+        if not pending:
+            return
+            
+        last = cipher.decrypt(pending)
+        try:
+            yield unpad(last, AES.block_size)
+        except ValueError as e:
+            print(f"Error removing padding: {str(e)}")
+            # 与 decrypt_file 保持一致，解填充失败时返回原始解密数据
+            yield last
+
+    def plaintext_size(self, src):
+        """计算 CBC 密文对应的明文长度
+
+        只需解密最后一个分组读出填充长度，与文件大小无关。
+        """
+        src.seek(0, 2)
+        total = src.tell()
+        if total == 0:
+            return 0
+        if total % AES.block_size:
+            raise ValueError('密文长度不是分组大小的整数倍')
+            
+        # CBC 中每个分组只依赖前一个密文分组
+        if total > AES.block_size:
+            src.seek(total - 2 * AES.block_size)
+            iv = src.read(AES.block_size)
+        else:
+            src.seek(0)
+            iv = self.iv
+        last = AES.new(self.key, AES.MODE_CBC, iv).decrypt(src.read(AES.block_size))
+        
+        try:
+            return total - len(last) + len(unpad(last, AES.block_size))
+        except ValueError:
+            # 与 decrypt_file 保持一致，填充无效时按原始长度处理
+            return total
+
+    def decrypt_range(self, src, start, end, chunk_size=DEFAULT_CHUNK_SIZE):
+        """解密 CBC 密文中 [start, end) 范围的明文
+
+        CBC 解密第 n 个分组只需要第 n-1 个密文分组，因此可以从任意位置开始，
+        代价只与请求的范围有关。end 不应超过 plaintext_size 的结果。
+        """
+        block = AES.block_size
+        first = start // block
+        if first == 0:
+            src.seek(0)
+            iv = self.iv
+        else:
+            src.seek((first - 1) * block)
+            iv = src.read(block)
+            
+        cipher = AES.new(self.key, AES.MODE_CBC, iv)
+        step = max(chunk_size - chunk_size % block, block)
+        stop = -(-end // block) * block
+        position = first * block
+        
+        while position < stop:
+            data = src.read(min(step, stop - position))
+            if not data:
+                break
+            plain = cipher.decrypt(data)
+            lo = max(start - position, 0)
+            hi = min(end - position, len(plain))
+            if hi > lo:
+                yield plain[lo:hi]
+            position += len(data)
+
     def decrypt_file(self, encrypted_data):
         """解密文件数据"""
         try:
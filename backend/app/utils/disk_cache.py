@@ -0,0 +1,264 @@
+import hashlib
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from app.utils.locks import file_lock
+from app.utils.singleflight import SingleFlight
+
+_KEY_PATTERN = re.compile(r'^[A-Za-z0-9._-]+$')
+_SHARD_PATTERN = re.compile(r'^[0-9a-f]{2}$')
+
+
+class DiskCache:
+    """按总大小上限以最近使用时间（mtime）淘汰的磁盘文件缓存
+
+    缓存目录即索引，多个 worker 进程可以共享同一目录；命中时更新 mtime。
+    条目按键的哈希分散在 256 个子目录中（ab/<key>），单个目录不会过大。
+
+    每个进程维护缓存总大小的估计值，写入时累加，只有估计值超过上限或
+    距上次扫描超过 evict_interval 时才扫描目录淘汰，写入本身是 O(1) 的。
+    其他进程写入的数据在下一次定期扫描时计入。
+    """
+
+    def __init__(self, directory, max_size, ttl=3600, min_age=60, max_entry_ratio=1.0, evict_interval=60):
+        """
+        Args:
+            directory: 缓存目录
+            max_size: 缓存总大小上限（字节）
+            ttl: 条目在最近一次访问后保留的最长时间（秒）
+            min_age: 最近这段时间内访问过的条目不被淘汰，避免调用方正在使用的文件被删除
+            max_entry_ratio: 单个条目最多占缓存容量的比例，更大的内容不写入缓存
+            evict_interval: 定期扫描目录、淘汰过期条目并校正总大小估计值的间隔（秒）
+        """
+        self.directory = directory
+        self.max_size = max_size
+        self.ttl = ttl
+        self.min_age = min_age
+        self.max_entry_ratio = max_entry_ratio
+        self.evict_interval = evict_interval
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._fills = SingleFlight()
+        self._size = None  # 总大小估计值，None 表示尚未扫描
+        self._scanned_at = 0
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+
+    def shard(self, key):
+        return hashlib.md5(key.encode('utf-8')).hexdigest()[:2]
+
+    def path(self, key):
+        if not _KEY_PATTERN.match(key):
+            raise ValueError(f'无效的缓存键: {key}')
+        return os.path.join(self.directory, self.shard(key), key)
+
+    def lock_path(self, key):
+        """填充 key 时使用的锁文件，与条目放在同一子目录"""
+        return os.path.join(os.path.dirname(self.path(key)), f'.{key}.lock')
+
+    def contains_path(self, path):
+        """path 是否位于缓存目录中（调用方不应删除缓存中的文件）"""
+        shard_dir = os.path.dirname(os.path.abspath(path))
+        return os.path.dirname(shard_dir) == os.path.abspath(self.directory)
+
+    def capacity(self):
+        """缓存实际可用的容量：上限与目录所在文件系统大小中较小的一个（容器中的 /dev/shm 默认只有 64MB）"""
+        try:
+            return min(self.max_size, shutil.disk_usage(self.directory).total)
+        except OSError:
+            return self.max_size
+
+    def accepts(self, size):
+        """大小为 size 字节的内容是否适合写入缓存"""
+        return size is not None and size <= self.capacity() * self.max_entry_ratio
+
+    def get(self, key):
+        """命中时返回缓存文件路径并更新访问时间，未命中返回 None"""
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return path
+
+    def put(self, key, chunks, evict=True, size=None):
+        """把数据块写入缓存并返回路径，文件权限 0600，先写临时文件再原子改名
+
+        已知写入大小 size 时先淘汰旧条目腾出空间再写入，否则写完后淘汰。
+        批量写入时可以传 evict=False，写完后再调用一次 evict()。
+        """
+        path = self.path(key)
+        if evict and size is not None:
+            self._maybe_evict(size)
+        shard_dir = os.path.dirname(path)
+        os.makedirs(shard_dir, mode=0o700, exist_ok=True)
+        temp_path = os.path.join(shard_dir, f'.{uuid.uuid4().hex}.tmp')
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        written = 0
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    written += len(chunk)
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        with self._lock:
+            if self._size is not None:
+                self._size += written
+        if evict and size is None:
+            self._maybe_evict()
+        return path
+
+    def get_or_create(self, key, produce, size=None):
+        """命中时直接返回路径，否则调用 produce() 生成明文块并写入缓存
+
+        同一个键的并发填充只执行一次：进程内由 SingleFlight 合并，
+        进程之间用锁文件互斥，后到者等待后直接使用已写好的缓存。
+        size 为 produce 生成的总字节数（已知时写入前预留空间）。
+        """
+        return self.get(key) or self._fills.do(key, lambda: self._fill(key, produce, size))
+
+    def _fill(self, key, produce, size=None):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+        lock_path = self.lock_path(key)
+        try:
+            with file_lock(lock_path):
+                if os.path.exists(path):
+                    # 其他进程已经写入
+                    os.utime(path)
+                    return path
+                return self.put(key, produce(), size=size)
+        finally:
+            try:
+                os.remove(lock_path)
+            except FileNotFoundError:
+                pass
+
+    def open(self, key, produce=None, size=None):
+        """返回以只读方式打开的缓存文件
+
+        未命中时如果提供了 produce 则先填充缓存，否则返回 None。
+        """
+        path = self.get(key)
+        if not path and produce:
+            path = self._fills.do(key, lambda: self._fill(key, produce, size))
+        if not path:
+            return None
+        try:
+            return open(path, 'rb')
+        except FileNotFoundError:
+            return None
+
+    def _directories(self):
+        """缓存根目录和所有子目录（根目录中是分片之前的旧条目，按最久未使用逐步淘汰）"""
+        directories = [self.directory]
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if _SHARD_PATTERN.match(entry.name) and entry.is_dir():
+                    directories.append(entry.path)
+        return directories
+
+    def _entries(self):
+        entries = []
+        for directory in self._directories():
+            try:
+                it = os.scandir(directory)
+            except FileNotFoundError:
+                continue
+            with it:
+                for entry in it:
+                    if entry.name.startswith('.') or not entry.is_file():
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _remove(self, path, size=None):
+        try:
+            if size is None:
+                size = os.path.getsize(path)
+            os.remove(path)
+        except FileNotFoundError:
+            return
+        with self._lock:
+            self.evictions += 1
+            if self._size is not None:
+                self._size = max(0, self._size - size)
+
+    def _maybe_evict(self, reserve=0):
+        """估计总大小加上即将写入的 reserve 超过上限、剩余空间不足或到了定期扫描时间时才淘汰"""
+        with self._lock:
+            due = (self._size is None or self._size + reserve > self.max_size
+                   or time.monotonic() - self._scanned_at > self.evict_interval)
+        if not due and reserve:
+            try:
+                due = shutil.disk_usage(self.directory).free < reserve
+            except OSError:
+                pass
+        if due:
+            self.evict(reserve)
+
+    def evict(self, reserve=0):
+        """扫描目录删除过期条目，并按最近使用时间从旧到新淘汰，直到总大小不超过上限
+
+        reserve 为即将写入的字节数：同时淘汰到上限和文件系统剩余空间都能容纳这次写入为止。
+        """
+        now = time.time()
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        limit = self.max_size - reserve
+        if reserve:
+            try:
+                limit = min(limit, total + shutil.disk_usage(self.directory).free - reserve)
+            except OSError:
+                pass
+        for mtime, size, path in entries:
+            expired = now - mtime > self.ttl
+            if not expired and (total <= limit or now - mtime < self.min_age):
+                continue
+            self._remove(path, size)
+            total -= size
+        with self._lock:
+            self._size = total
+            self._scanned_at = time.monotonic()
+
+    def discard(self, prefix):
+        """删除键以 prefix（或 prefix 元组中任意一个）开头的所有条目（内容被删除时调用）"""
+        for _, size, path in self._entries():
+            if os.path.basename(path).startswith(prefix):
+                self._remove(path, size)
+
+    def clear(self):
+        for _, size, path in self._entries():
+            self._remove(path, size)
+
+    def stats(self):
+        entries = self._entries()
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'directory': self.directory,
+                'entries': len(entries),
+                'size': sum(size for _, size, _ in entries),
+                'estimated_size': self._size,
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0,
+                'evictions': self.evictions,
+                'fills': self._fills.stats()
+            }
@@ -0,0 +1,29 @@
+from docx.table import Table
+
+
+def table_data(table):
+    """表格的非空行，每个单元格为其中非空段落的文本"""
+    rows = []
+    for row in table.rows:
+        row_data = ['\n'.join(p.text.strip() for p in cell.paragraphs if p.text.strip()) for cell in row.cells]
+        if any(row_data):  # 只添加非空行
+            rows.append(row_data)
+    return rows
+
+
+def iter_blocks(document):
+    """按文档中的先后顺序产出段落和表格块，跳过空段落和空表格
+
+    段落块为 {'type': 'paragraph', 'text', 'style'}，表格块为 {'type': 'table', 'data'}。
+    """
+    for item in document.iter_inner_content():
+        if isinstance(item, Table):
+            data = table_data(item)
+            if data:
+                yield {'type': 'table', 'data': data}
+        elif item.text.strip():
+            yield {
+                'type': 'paragraph',
+                'text': item.text,
+                'style': item.style.name if item.style else 'Normal'
+            }
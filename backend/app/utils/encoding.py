@@ -0,0 +1,62 @@
+import codecs
+
+try:
+    from charset_normalizer import from_bytes
+except ImportError:  # charset_normalizer 随 requests 安装，缺失时只识别 UTF-8 和 GB18030
+    from_bytes = None
+
+# 带 BOM 的编码，UTF-32 LE 的 BOM 以 UTF-16 LE 的 BOM 开头，需要先判断
+BOMS = (
+    (codecs.BOM_UTF32_LE, 'utf-32-le'),
+    (codecs.BOM_UTF32_BE, 'utf-32-be'),
+    (codecs.BOM_UTF8, 'utf-8'),
+    (codecs.BOM_UTF16_LE, 'utf-16-le'),
+    (codecs.BOM_UTF16_BE, 'utf-16-be'),
+)
+
+# charset_normalizer 结果的最大混乱度（0 到 1），超过时认为识别不可靠
+MAX_CHAOS = 0.1
+
+
+def _decodes(sample, encoding):
+    """样本能否按编码解码（样本末尾被截断的多字节字符不算错误）"""
+    try:
+        codecs.getincrementaldecoder(encoding)().decode(sample)
+        return True
+    except (UnicodeDecodeError, LookupError):
+        return False
+
+
+def detect_encoding(sample):
+    """根据文件开头的样本识别文本编码
+
+    依次判断 BOM、UTF-8 和 GB18030（用户的文本以中文为主，短的 GBK 样本
+    charset_normalizer 常误判为 cp949 等编码），都不能解码时才使用 charset_normalizer
+    足够可靠的结果，最后使用 latin-1。
+
+    Returns:
+        (编码, BOM 字节数)，编码名不含 BOM
+    """
+    for bom, encoding in BOMS:
+        if sample.startswith(bom):
+            return encoding, len(bom)
+    if _decodes(sample, 'utf-8'):
+        return 'utf-8', 0
+    # 含 NUL 的样本多半是没有 BOM 的 UTF-16/32，交给 charset_normalizer
+    if b'\x00' not in sample and _decodes(sample, 'gb18030'):
+        return 'gb18030', 0
+    if from_bytes is not None:
+        best = from_bytes(sample).best()
+        if best is not None and best.chaos <= MAX_CHAOS and _decodes(sample, best.encoding):
+            return best.encoding, 0
+    return 'latin-1', 0
+
+
+def read_text(file_path, sample_size=64 * 1024):
+    """按识别出的编码读取整个文本文件，去掉 BOM；无法解码的字节替换为 U+FFFD"""
+    with open(file_path, 'rb') as f:
+        encoding, bom = detect_encoding(f.read(sample_size))
+    with open(file_path, 'r', encoding=encoding, errors='replace') as f:
+        content = f.read()
+    # BOM 解码为一个 U+FEFF 字符
+    return content[1:] if bom else content
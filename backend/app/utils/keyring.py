@@ -0,0 +1,65 @@
+import base64
+from Crypto.Cipher import AES
+from Crypto.Random import get_random_bytes
+
+# 信封加密：每个 blob 使用随机生成的数据密钥加密内容，
+# 数据密钥再用主密钥（AES-GCM）包装后保存在数据库中。
+# 轮换主密钥只需要重新包装数据密钥，不需要重新加密文件内容。
+DATA_KEY_SIZE = 32
+NONCE_SIZE = 12
+TAG_SIZE = 16
+
+
+def _key_bytes(key):
+    if isinstance(key, str):
+        key = key.encode('utf-8')
+    if len(key) != 32:
+        raise ValueError(f"Master key must be 32 bytes long, got {len(key)} bytes")
+    return key
+
+
+class KeyRing:
+    def __init__(self, master_keys, active_key_id):
+        """初始化主密钥环
+
+        Args:
+            master_keys: {主密钥 ID: 32 字节密钥}，包含当前主密钥和尚未轮换完的旧主密钥
+            active_key_id: 包装新数据密钥使用的主密钥 ID
+        """
+        self.master_keys = {key_id: _key_bytes(key) for key_id, key in master_keys.items()}
+        if active_key_id not in self.master_keys:
+            raise ValueError(f'未配置当前主密钥: {active_key_id}')
+        self.active_key_id = active_key_id
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config.MASTER_KEYS, config.ACTIVE_MASTER_KEY_ID)
+
+    def generate_data_key(self):
+        """生成新的数据密钥
+
+        Returns:
+            (数据密钥, 包装后的数据密钥, 主密钥 ID)
+        """
+        data_key = get_random_bytes(DATA_KEY_SIZE)
+        wrapped, key_id = self.wrap(data_key)
+        return data_key, wrapped, key_id
+
+    def wrap(self, data_key):
+        """用当前主密钥包装数据密钥，返回 (base64 字符串, 主密钥 ID)"""
+        nonce = get_random_bytes(NONCE_SIZE)
+        cipher = AES.new(self.master_keys[self.active_key_id], AES.MODE_GCM, nonce=nonce)
+        cipher.update(self.active_key_id.encode('utf-8'))
+        encrypted, tag = cipher.encrypt_and_digest(data_key)
+        wrapped = base64.b64encode(nonce + encrypted + tag).decode('ascii')
+        return wrapped, self.active_key_id
+
+    def unwrap(self, wrapped, key_id):
+        """解开包装，主密钥缺失或数据被篡改时抛出 ValueError"""
+        if key_id not in self.master_keys:
+            raise ValueError(f'缺少主密钥: {key_id}')
+        raw = base64.b64decode(wrapped)
+        nonce, encrypted, tag = raw[:NONCE_SIZE], raw[NONCE_SIZE:-TAG_SIZE], raw[-TAG_SIZE:]
+        cipher = AES.new(self.master_keys[key_id], AES.MODE_GCM, nonce=nonce)
+        cipher.update(key_id.encode('utf-8'))
+        return cipher.decrypt_and_verify(encrypted, tag)
@@ -0,0 +1,39 @@
+import fcntl
+import os
+import time
+from contextlib import contextmanager
+
+
+@contextmanager
+def dir_lock(path):
+    """目录级排他锁（flock），用于跨进程串行化“检查 + 替换/删除”这类短操作
+
+    注意 flock 不可重入：同一进程内不要嵌套获取同一目录的锁。
+    """
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+@contextmanager
+def file_lock(path, poll_interval=0.05):
+    """锁文件上的排他锁，以非阻塞方式轮询获取
+
+    等待期间调用 time.sleep，gevent 环境下会让出事件循环，不会阻塞整个 worker。
+    """
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                time.sleep(poll_interval)
+        yield
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
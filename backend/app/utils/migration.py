@@ -0,0 +1,91 @@
+import json
+import os
+import time
+
+
+class Checkpoint:
+    """后台迁移任务的进度检查点，保存在 JSON 文件中，中断后可以继续"""
+
+    def __init__(self, path, restart=False):
+        self.path = path
+        self.state = {'last_id': 0, 'done': 0, 'skipped': 0, 'failed': [], 'bytes': 0}
+        if not restart and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.state.update(json.load(f))
+
+    @property
+    def last_id(self):
+        return self.state['last_id']
+
+    def record(self, item_id, status, size=0):
+        """记录一个条目的处理结果：done / skipped / failed"""
+        self.state['last_id'] = max(self.state['last_id'], item_id)
+        if status == 'failed':
+            self.state['failed'].append(item_id)
+        else:
+            self.state[status] += 1
+        self.state['bytes'] += size
+
+    def save(self):
+        """原子写入检查点文件"""
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        temp_path = f'{self.path}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f)
+        os.replace(temp_path, self.path)
+
+
+class Throttle:
+    """按字节数限速（令牌桶），rate 为每秒字节数，0 表示不限速"""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.allowance = rate
+        self.last = time.monotonic()
+
+    def consume(self, size):
+        if not self.rate:
+            return
+        now = time.monotonic()
+        self.allowance = min(self.rate, self.allowance + (now - self.last) * self.rate)
+        self.last = now
+        self.allowance -= size
+        if self.allowance < 0:
+            time.sleep(-self.allowance / self.rate)
+
+
+class ThrottledReader:
+    """包装可 read() 的对象，读取时按 Throttle 限速"""
+
+    def __init__(self, src, throttle):
+        self.src = src
+        self.throttle = throttle
+
+    def read(self, size=-1):
+        data = self.src.read(size)
+        self.throttle.consume(len(data))
+        return data
+
+
+class Progress:
+    """定期输出处理进度和吞吐量"""
+
+    def __init__(self, echo, interval=10):
+        self.echo = echo
+        self.interval = interval
+        self.started = time.monotonic()
+        self.last_report = self.started
+        self.items = 0
+        self.bytes = 0
+
+    def add(self, size=0):
+        self.items += 1
+        self.bytes += size
+        if time.monotonic() - self.last_report >= self.interval:
+            self.report()
+
+    def report(self):
+        self.last_report = time.monotonic()
+        elapsed = max(self.last_report - self.started, 1e-6)
+        self.echo(f'已处理 {self.items} 个，{self.bytes / 1024 / 1024:.1f} MB，'
+                  f'{self.items / elapsed:.1f} 个/秒，{self.bytes / 1024 / 1024 / elapsed:.1f} MB/秒')
@@ -0,0 +1,116 @@
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from config import Config
+
+# AES-GCM（pycryptodome）和 zlib / zstd 在 C 代码中执行时会释放 GIL，
+# 因此用线程池就能让多个数据块同时在多个核心上加解密。
+_executor = None
+_executor_key = None
+_lock = threading.Lock()
+
+
+def _threading_patched():
+    """gevent 已替换 threading 时，普通线程池的线程实际上是协程，无法利用多核"""
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('threading')
+
+
+def run_blocking(fn, *args):
+    """执行会阻塞当前线程的调用（例如等待子进程的管道）
+
+    gevent 环境下放到 gevent 的原生线程池中执行，等待期间不阻塞事件循环。
+    """
+    if _threading_patched():
+        import gevent
+        return gevent.get_hub().threadpool.apply(fn, args)
+    return fn(*args)
+
+
+def get_executor():
+    """获取加解密共用的线程池，CRYPTO_WORKERS <= 1 时返回 None（在当前线程执行）
+
+    gevent 环境下使用 gevent 的原生线程池，等待结果时让出事件循环，不阻塞其他连接。
+    """
+    global _executor, _executor_key
+    workers = Config.CRYPTO_WORKERS
+    if workers <= 1:
+        return None
+    # fork 出的子进程不会继承线程，需要重新创建；修改线程数后也重新创建
+    key = (os.getpid(), workers)
+    if _executor is None or _executor_key != key:
+        with _lock:
+            if _executor is None or _executor_key != key:
+                if _executor is not None and _executor_key[0] == key[0]:
+                    _executor.shutdown(wait=False)
+                if _threading_patched():
+                    from gevent.threadpool import ThreadPoolExecutor as GeventThreadPoolExecutor
+                    _executor = GeventThreadPoolExecutor(workers)
+                else:
+                    _executor = ThreadPoolExecutor(workers, thread_name_prefix='crypto')
+                _executor_key = key
+    return _executor
+
+
+class _Done:
+    """在当前线程直接执行的任务结果，接口与 Future 一致"""
+
+    def __init__(self, value):
+        self.value = value
+
+    def done(self):
+        return True
+
+    def result(self):
+        return self.value
+
+
+class OrderedPipeline:
+    """把任务提交到线程池并按提交顺序取回结果，最多同时有 window 个任务未取回
+
+    window 限制了预读和预加密的数据量，内存占用与文件大小无关。
+    """
+
+    def __init__(self, window=None):
+        self.executor = get_executor()
+        self.window = window or Config.CRYPTO_WINDOW
+        self.pending = deque()
+
+    def submit(self, fn, *args):
+        """提交任务，返回已经按顺序完成的结果；窗口已满时等待最早的任务"""
+        if self.executor is None:
+            self.pending.append(_Done(fn(*args)))
+        else:
+            self.pending.append(self.executor.submit(fn, *args))
+        done = []
+        while self.pending and (len(self.pending) > self.window or self.pending[0].done()):
+            done.append(self.pending.popleft().result())
+        return done
+
+    def drain(self):
+        """等待并按顺序返回所有剩余结果"""
+        done = []
+        while self.pending:
+            done.append(self.pending.popleft().result())
+        return done
+
+    def cancel(self):
+        for future in self.pending:
+            if hasattr(future, 'cancel'):
+                future.cancel()
+        self.pending.clear()
+
+
+def imap_ordered(fn, iterable, window=None):
+    """并行执行 fn(*args)，按输入顺序逐个产出结果"""
+    pipeline = OrderedPipeline(window)
+    try:
+        for args in iterable:
+            yield from pipeline.submit(fn, *args)
+        yield from pipeline.drain()
+    finally:
+        pipeline.cancel()
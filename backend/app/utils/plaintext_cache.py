@@ -0,0 +1,69 @@
+import hashlib
+import os
+import re
+import threading
+from app.utils.disk_cache import DiskCache
+from config import Config
+
+_EXTENSION_PATTERN = re.compile(r'^\.[a-z0-9]{1,10}$')
+
+# 未配置 PLAINTEXT_CACHE_DIR 时使用的 tmpfs 目录
+SHM_DIRECTORY = '/dev/shm'
+
+
+def blob_cache_prefix(content_hash):
+    return f'blob-{content_hash}'
+
+
+def path_cache_prefix(path):
+    return f'path-{hashlib.sha256(path.encode("utf-8")).hexdigest()[:32]}'
+
+
+def cache_key(prefix, version=None, filename=None):
+    """组合缓存键：前缀 + 版本 + 原文件扩展名（部分解析库依赖扩展名识别格式）"""
+    key = prefix if version is None else f'{prefix}-{version}'
+    extension = os.path.splitext(filename.lower())[1] if filename else ''
+    if _EXTENSION_PATTERN.match(extension):
+        key += extension
+    return key
+
+
+class PlaintextCache(DiskCache):
+    """解密后明文的文件缓存
+
+    默认放在 tmpfs（/dev/shm）上，明文不会写入持久磁盘，重启后自动清空。
+    """
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def cache_directory():
+    """明文缓存目录：PLAINTEXT_CACHE_DIR，未配置时为 /dev/shm 下的目录；都不可用时返回 None"""
+    if Config.PLAINTEXT_CACHE_DIR:
+        return Config.PLAINTEXT_CACHE_DIR
+    if os.path.isdir(SHM_DIRECTORY):
+        return os.path.join(SHM_DIRECTORY, 'cloud_storage_plaintext')
+    # 没有 tmpfs 时不在持久磁盘上缓存明文
+    return None
+
+
+def get_plaintext_cache():
+    """获取按配置创建的明文缓存，未启用或没有可用目录时返回 None"""
+    global _cache
+    if not Config.PLAINTEXT_CACHE_ENABLED:
+        return None
+    directory = cache_directory()
+    if not directory:
+        return None
+    if _cache is None or _cache.directory != directory:
+        with _cache_lock:
+            if _cache is None or _cache.directory != directory:
+                _cache = PlaintextCache(
+                    directory,
+                    Config.PLAINTEXT_CACHE_MAX_SIZE,
+                    ttl=Config.PLAINTEXT_CACHE_TTL,
+                    max_entry_ratio=Config.PLAINTEXT_CACHE_MAX_ENTRY_RATIO
+                )
+    return _cache
@@ -0,0 +1,138 @@
+import hashlib
+import hmac
+import os
+import threading
+from Crypto.Cipher import AES
+from Crypto.Random import get_random_bytes
+from flask import json
+from app.utils.disk_cache import DiskCache
+from app.utils.locks import file_lock
+from config import Config
+
+NONCE_SIZE = 12
+TAG_SIZE = 16
+
+
+def preview_prefix(file_id):
+    return f'file-{file_id}-'
+
+
+def preview_key(file_id, version, handler, params=None):
+    """渲染结果缓存键：文件 ID + 处理器名 + (文件版本, 参数) 的摘要
+
+    文件内容更新后版本随之变化，旧条目不会再被命中。
+    """
+    digest = hashlib.sha256(json.dumps([version, params], sort_keys=True).encode('utf-8')).hexdigest()
+    return f'{preview_prefix(file_id)}{handler}-{digest[:32]}'
+
+
+class PreviewCache(DiskCache):
+    """预览渲染结果（PDF 页面图片、Excel / Word 解析结果等）的磁盘缓存
+
+    缓存目录在持久磁盘上，条目用 AES-GCM 加密，缓存键作为附加认证数据，
+    条目被替换到其他键下或被篡改时视为未命中。
+    """
+
+    def __init__(self, directory, max_size, key, ttl=7 * 24 * 3600, min_age=60):
+        super().__init__(directory, max_size, ttl=ttl, min_age=min_age)
+        self._key = key
+
+    def _seal(self, name, data):
+        nonce = get_random_bytes(NONCE_SIZE)
+        cipher = AES.new(self._key, AES.MODE_GCM, nonce=nonce)
+        cipher.update(name.encode('utf-8'))
+        encrypted, tag = cipher.encrypt_and_digest(data)
+        return nonce + encrypted + tag
+
+    def _unseal(self, name, raw):
+        nonce, encrypted, tag = raw[:NONCE_SIZE], raw[NONCE_SIZE:-TAG_SIZE], raw[-TAG_SIZE:]
+        cipher = AES.new(self._key, AES.MODE_GCM, nonce=nonce)
+        cipher.update(name.encode('utf-8'))
+        return cipher.decrypt_and_verify(encrypted, tag)
+
+    def load(self, key):
+        """命中时返回解密后的数据，未命中或条目无法解密（例如主密钥已轮换）时返回 None"""
+        path = self.get(key)
+        if not path:
+            return None
+        try:
+            with open(path, 'rb') as f:
+                return self._unseal(key, f.read())
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            self._remove(path)
+            return None
+
+    def store(self, key, data, evict=True):
+        sealed = self._seal(key, data)
+        self.put(key, [sealed], evict=evict, size=len(sealed))
+
+    def get_or_render(self, key, render):
+        """命中时返回缓存的数据，否则调用 render() 生成 bytes 并写入缓存
+
+        同一个键的并发渲染只执行一次：进程内由 SingleFlight 合并，进程之间用锁文件互斥。
+        """
+        data = self.load(key)
+        if data is not None:
+            return data
+        return self._fills.do(key, lambda: self._render(key, render))
+
+    def _render(self, key, render):
+        lock_path = self.lock_path(key)
+        os.makedirs(os.path.dirname(lock_path), mode=0o700, exist_ok=True)
+        try:
+            with file_lock(lock_path):
+                if os.path.exists(self.path(key)):
+                    # 其他进程已经渲染完成
+                    data = self.load(key)
+                    if data is not None:
+                        return data
+                data = render()
+                self.store(key, data)
+                return data
+        finally:
+            try:
+                os.remove(lock_path)
+            except FileNotFoundError:
+                pass
+
+    def get_or_render_json(self, key, render):
+        """与 get_or_render 相同，缓存的是 render() 返回值的 JSON"""
+        result = {}
+
+        def render_json():
+            result['value'] = render()
+            return json.dumps(result['value']).encode('utf-8')
+
+        data = self.get_or_render(key, render_json)
+        if 'value' in result:
+            return result['value']
+        return json.loads(data)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_preview_cache():
+    """获取按配置创建的预览缓存，未启用时返回 None"""
+    global _cache
+    if not Config.PREVIEW_CACHE_ENABLED:
+        return None
+    directory = Config.PREVIEW_CACHE_DIR or os.path.join(Config.UPLOAD_FOLDER, 'previews')
+    if _cache is None or _cache.directory != directory:
+        with _cache_lock:
+            if _cache is None or _cache.directory != directory:
+                master_key = Config.MASTER_KEYS[Config.ACTIVE_MASTER_KEY_ID]
+                if isinstance(master_key, str):
+                    master_key = master_key.encode('utf-8')
+                # 从当前主密钥派生专用的缓存密钥
+                key = hmac.new(master_key, b'preview-cache', hashlib.sha256).digest()
+                _cache = PreviewCache(
+                    directory,
+                    Config.PREVIEW_CACHE_MAX_SIZE,
+                    key,
+                    ttl=Config.PREVIEW_CACHE_TTL
+                )
+    return _cache
@@ -0,0 +1,141 @@
+import multiprocessing
+import resource
+import threading
+from app.utils.parallel import run_blocking
+
+
+class SandboxTimeout(TimeoutError):
+    """任务超过时限（执行任务的进程已被终止），或等待空闲进程超时"""
+
+
+class SandboxCrashed(RuntimeError):
+    """执行任务的进程异常退出，例如原生库崩溃或被系统终止"""
+
+
+def _worker_main(conn, memory_limit):
+    """沙箱进程：循环接收 (函数, 参数)，返回 ('ok', 结果) 或 ('error', 异常)"""
+    if memory_limit:
+        # Linux 不限制 RLIMIT_RSS，用地址空间上限代替；超出时分配内存失败，Python 抛出 MemoryError
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+    while True:
+        try:
+            fn, args = conn.recv()
+            reply = ('ok', fn(*args))
+        except EOFError:
+            # 主进程关闭了管道
+            return
+        except MemoryError:
+            # 内存耗尽后进程状态不可靠，返回错误后退出
+            conn.send(('error', MemoryError('预览处理超出内存限制')))
+            return
+        except Exception as e:
+            reply = ('error', e)
+        try:
+            conn.send(reply)
+        except Exception as e:
+            # 结果或异常无法序列化
+            conn.send(('error', RuntimeError(f'{type(e).__name__}: {e}')))
+
+
+class _Worker:
+    def __init__(self, context, memory_limit):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn, memory_limit), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.tasks = 0
+
+    def call(self, fn, args, timeout):
+        self.conn.send((fn, args))
+        if not self.conn.poll(timeout):
+            raise SandboxTimeout(f'预览处理超时（{timeout} 秒）')
+        return self.conn.recv()
+
+    def alive(self):
+        return self.process.is_alive()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class SandboxPool:
+    """在独立进程中执行任务的进程池
+
+    进程以 spawn 方式按需启动并复用，进程数即并发上限。每个任务有执行时限，
+    超时的进程被强制终止；进程的内存上限由 memory_limit 限制。
+    任务函数和参数、返回值都需要能被 pickle，函数必须是模块级函数。
+    """
+
+    def __init__(self, workers, timeout, memory_limit=0, max_tasks=0):
+        """
+        Args:
+            workers: 进程数
+            timeout: 默认执行时限（秒），同时也是等待空闲进程的时限
+            memory_limit: 每个进程的地址空间上限（字节），0 表示不限制
+            max_tasks: 每个进程执行多少个任务后重启，回收内存碎片；0 表示不重启
+        """
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.max_tasks = max_tasks
+        self._slots = threading.BoundedSemaphore(workers)
+        self._idle = []
+        self._lock = threading.Lock()
+        self._context = multiprocessing.get_context('spawn')
+
+    def run(self, fn, *args, timeout=None):
+        """在沙箱进程中执行 fn(*args) 并返回结果，fn 抛出的异常在当前进程重新抛出
+
+        Raises:
+            SandboxTimeout: 等待空闲进程或执行超时
+            SandboxCrashed: 执行任务的进程异常退出
+        """
+        timeout = self.timeout if timeout is None else timeout
+        if not self._slots.acquire(timeout=timeout):
+            raise SandboxTimeout('预览处理繁忙，请稍后重试')
+        try:
+            worker = self._checkout()
+            try:
+                status, value = run_blocking(worker.call, fn, args, timeout)
+            except SandboxTimeout:
+                worker.kill()
+                raise
+            except (EOFError, OSError):
+                exitcode = worker.process.exitcode
+                worker.kill()
+                raise SandboxCrashed(f'预览进程异常退出（exitcode={exitcode}）')
+            except BaseException:
+                # 超时，或等待期间当前协程被终止：进程可能仍在执行，不能再复用
+                worker.kill()
+                raise
+            # 内存耗尽的进程会自行退出
+            self._checkin(worker, retire=status == 'error' and isinstance(value, MemoryError))
+        finally:
+            self._slots.release()
+        if status == 'error':
+            raise value
+        return value
+
+    def _checkout(self):
+        with self._lock:
+            while self._idle:
+                worker = self._idle.pop()
+                if worker.alive():
+                    return worker
+                worker.kill()
+        return _Worker(self._context, self.memory_limit)
+
+    def _checkin(self, worker, retire=False):
+        worker.tasks += 1
+        if retire or not worker.alive() or (self.max_tasks and worker.tasks >= self.max_tasks):
+            worker.kill()
+            return
+        with self._lock:
+            self._idle.append(worker)
+
+    def shutdown(self):
+        with self._lock:
+            workers, self._idle = self._idle, []
+        for worker in workers:
+            worker.kill()
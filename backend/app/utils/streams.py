@@ -0,0 +1,17 @@
+class IterReader:
+    """把产出字节块的迭代器包装成可 read(n) 的对象，用于流式加密等接口"""
+
+    def __init__(self, iterable):
+        self.chunks = iter(iterable)
+        self.buffer = b''
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                break
+            self.buffer += chunk
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
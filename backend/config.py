@@ -1,6 +1,16 @@
 import os
 from datetime import timedelta
 import secrets
+import base64
+
+def parse_master_keys(value):
+    """解析 MASTER_KEYS 环境变量，格式：主密钥ID:base64密钥,主密钥ID:base64密钥"""
+    keys = {}
+    for item in (value or '').split(','):
+        if item.strip():
+            key_id, key = item.strip().split(':', 1)
+            keys[key_id] = base64.b64decode(key)
+    return keys
 
 class Config:
     # 基础配置
@@ -17,11 +27,119 @@ class Config:
     UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'uploads')
     TEMP_FOLDER = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'temp')
     MAX_CONTENT_LENGTH = 100 * 1024 * 1024  # 100MB
+    STREAM_CHUNK_SIZE = 1024 * 1024  # 流式加解密的分块大小 1MB
+    STORAGE_CHUNK_SIZE = 512 * 1024  # 分块密文格式中每块的明文大小 512KB
+    # 分块加解密线程池：1 表示在请求所在线程中执行；窗口为同时在处理中的块数上限
+    CRYPTO_WORKERS = int(os.environ.get('CRYPTO_WORKERS') or min(os.cpu_count() or 1, 8))
+    CRYPTO_WINDOW = CRYPTO_WORKERS * 2
+    
+    # 解密明文缓存：只放在内存文件系统上，目录为空时使用 /dev/shm/cloud_storage_plaintext，
+    # 没有 /dev/shm 时不启用；配置到持久磁盘上的目录意味着明文会落盘
+    PLAINTEXT_CACHE_ENABLED = True
+    PLAINTEXT_CACHE_DIR = os.environ.get('PLAINTEXT_CACHE_DIR')
+    PLAINTEXT_CACHE_MAX_SIZE = int(os.environ.get('PLAINTEXT_CACHE_MAX_SIZE') or 1024 * 1024 * 1024)  # 1GB
+    PLAINTEXT_CACHE_TTL = 3600  # 最近一次访问后保留 1 小时
+    # 单个文件最多占缓存容量（上限与 /dev/shm 大小中较小者）的比例，更大的文件解密到临时目录
+    PLAINTEXT_CACHE_MAX_ENTRY_RATIO = 0.25
+    # 不超过此大小的文件在下载时也写入缓存，并发下载同一文件时只解密一次
+    PLAINTEXT_CACHE_STREAM_FILL_SIZE = 32 * 1024 * 1024  # 32MB
+    
+    # PDF 单页渲染
+    PDF_RENDER_MIN_SCALE = 0.25
+    PDF_RENDER_MAX_SCALE = 4.0
+    PDF_RENDER_MAX_PIXELS = 4096 * 4096  # 单页输出像素数上限
+    PREVIEW_IMAGE_QUALITY = 85  # JPEG / WebP 压缩质量
+    
+    # 图片预览：请求的宽度向上取整到标准宽度，每张图片只生成这几种尺寸并缓存
+    IMAGE_PREVIEW_WIDTHS = (128, 256, 512, 1024, 2048)
+    IMAGE_PREVIEW_DEFAULT_WIDTH = 1024
+    IMAGE_MAX_PIXELS = 16384 * 16384  # 可以处理的图片像素数上限
+    
+    # 表格按行窗口读取：首次访问时按 EXCEL_PAGE_ROWS 行分页缓存
+    EXCEL_PAGE_ROWS = 1000
+    EXCEL_WINDOW_DEFAULT = 100
+    EXCEL_WINDOW_MAX = 1000
+    # 单次按单元格修改表格时允许的最大修改数
+    EXCEL_PATCH_MAX_CHANGES = 10000
+
+    # 文本文件按行窗口读取：按 TEXT_SAMPLE_SIZE 字节的样本识别编码，
+    # 每隔约 TEXT_INDEX_BLOCK 字节记录一个行首偏移，读取任意窗口最多多解密一个块
+    TEXT_SAMPLE_SIZE = 64 * 1024
+    TEXT_INDEX_BLOCK = 64 * 1024
+    TEXT_WINDOW_DEFAULT = 200
+    TEXT_WINDOW_MAX = 5000
+    TEXT_MAX_LINE_LENGTH = 10000  # 超长的行截断返回
+
+    # Word 文档按块（段落或表格）分页缓存
+    DOCX_PAGE_BLOCKS = 100
+    DOCX_WINDOW_DEFAULT = 50
+    DOCX_WINDOW_MAX = 500
+    
+    # 大图 DeepZoom 瓦片金字塔：生成一次后所有瓦片保存在预览缓存中
+    DEEPZOOM_TILE_SIZE = 254
+    DEEPZOOM_OVERLAP = 1
+    DEEPZOOM_FORMAT = 'jpeg'  # jpeg / webp
+    DEEPZOOM_REBUILD_BLOCK = 8  # 瓦片被淘汰后按 8x8 瓦片块重新生成，不重建整个金字塔
+    DEEPZOOM_PREGENERATE_MIN_SIZE = 4096  # 宽或高不小于此值的图片在后台预先生成金字塔
+    
+    # 预览沙箱：文件解析和渲染在独立进程中执行，每类文件一个进程池，池大小即并发上限；
+    # 超过执行时限的进程被终止，内存上限为每个进程的地址空间（0 表示不限制）
+    PREVIEW_SANDBOX_ENABLED = True
+    PREVIEW_WORKERS = {'pdf': 2, 'image': 2, 'office': 1, 'text': 1}
+    PREVIEW_TIMEOUTS = {'pdf': 60, 'image': 60, 'office': 120, 'text': 60}  # 秒
+    PREVIEW_MEMORY_LIMIT = 2 * 1024 * 1024 * 1024
+    PREVIEW_SANDBOX_MAX_TASKS = 200  # 每个进程处理多少个任务后重启
+    
+    # 后台预览预生成：上传和编辑后在后台生成常用预览，PREVIEW_PREGENERATE_WORKERS 为同时处理的文件数
+    PREVIEW_PREGENERATE_ENABLED = True
+    PREVIEW_PREGENERATE_WORKERS = 2
+    PREVIEW_PREGENERATE_PDF_PAGES = 3  # 预先渲染的 PDF 页数
+    PREVIEW_PREGENERATE_IMAGE_WIDTHS = (256, 1024)  # 预先生成的缩略图宽度（WebP）
+    
+    # 预览渲染结果缓存（加密保存）：目录为空时使用 UPLOAD_FOLDER/previews，多个 worker 进程共享
+    PREVIEW_CACHE_ENABLED = True
+    PREVIEW_CACHE_DIR = os.environ.get('PREVIEW_CACHE_DIR')
+    PREVIEW_CACHE_MAX_SIZE = int(os.environ.get('PREVIEW_CACHE_MAX_SIZE') or 2 * 1024 * 1024 * 1024)  # 2GB
+    PREVIEW_CACHE_TTL = 7 * 24 * 3600  # 最近一次访问后保留 7 天
+    
+    # 密文存储后端：local 保存在 UPLOAD_FOLDER/blobs，s3 使用 S3 兼容对象存储（AWS S3、MinIO 等）
+    STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND') or 'local'
+    S3_BUCKET = os.environ.get('S3_BUCKET')
+    S3_PREFIX = os.environ.get('S3_PREFIX') or 'blobs/'
+    S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL')
+    S3_REGION = os.environ.get('S3_REGION')
+    S3_ACCESS_KEY_ID = os.environ.get('S3_ACCESS_KEY_ID')
+    S3_SECRET_ACCESS_KEY = os.environ.get('S3_SECRET_ACCESS_KEY')
+    S3_MULTIPART_PART_SIZE = 8 * 1024 * 1024  # 分段上传每段 8MB
+    
+    # 加密前压缩：每块独立压缩，未安装 zstandard 时 zstd 退回 zlib；已压缩的格式不再压缩
+    COMPRESSION_ENABLED = True
+    COMPRESSION_CODEC = os.environ.get('COMPRESSION_CODEC') or 'zstd'
+    COMPRESSION_SKIP_EXTENSIONS = {
+        '.jpg', '.jpeg', '.png', '.gif', '.webp', '.heic',
+        '.mp4', '.mov', '.avi', '.mkv', '.webm', '.mp3', '.aac', '.m4a', '.flac', '.ogg',
+        '.zip', '.rar', '.7z', '.gz', '.bz2', '.xz', '.zst',
+        '.docx', '.xlsx', '.pptx'
+    }
+    
+    # 秒传配置：要求客户端对随机区间做哈希证明确实持有文件，防止只凭哈希获取他人文件
+    INSTANT_UPLOAD_REQUIRE_PROOF = True
+    INSTANT_UPLOAD_PROOF_SIZE = 64 * 1024  # 证明区间长度 64KB
+    INSTANT_UPLOAD_CHALLENGE_TTL = 300  # 挑战有效期（秒）
+    
+    # 分片上传配置：单个请求仍受 MAX_CONTENT_LENGTH 限制，整个文件受 UPLOAD_SESSION_MAX_SIZE 限制
+    UPLOAD_SESSION_CHUNK_SIZE = 8 * 1024 * 1024  # 8MB
+    UPLOAD_SESSION_MAX_SIZE = 20 * 1024 * 1024 * 1024  # 20GB
+    UPLOAD_SESSION_TTL = timedelta(days=1)
     
     # AES加密配置 - 确保密钥长度正确
     AES_KEY = os.environ.get('AES_KEY') or b'0123456789abcdef0123456789abcdef'  # 32字节
     AES_IV = os.environ.get('AES_IV') or b'0123456789abcdef'  # 16字节
     
+    # 信封加密的主密钥：新数据密钥用 ACTIVE_MASTER_KEY_ID 包装，其余为待轮换的旧主密钥
+    MASTER_KEYS = parse_master_keys(os.environ.get('MASTER_KEYS')) or {'default': AES_KEY}
+    ACTIVE_MASTER_KEY_ID = os.environ.get('ACTIVE_MASTER_KEY_ID') or 'default'
+    
     # CORS配置
     CORS_HEADERS = 'Content-Type'
     
@@ -41,6 +159,7 @@ class DevelopmentConfig(Config):
 class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    PREVIEW_PREGENERATE_ENABLED = False  # 内存数据库无法与后台进程共享
     
 class ProductionConfig(Config):
     DEBUG = False
@@ -0,0 +1,27 @@
+"""Add compression codec to blobs
+
+Revision ID: 1b6e9d3c7a52
+Revises: f27d3b8a6e14
+Create Date: 2026-10-18 17:35:12.408119
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1b6e9d3c7a52'
+down_revision = 'f27d3b8a6e14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 已有的 blob 都没有压缩
+    with op.batch_alter_table('blobs', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('compression', sa.String(length=20), nullable=False, server_default='none'))
+
+
+def downgrade():
+    with op.batch_alter_table('blobs', schema=None) as batch_op:
+        batch_op.drop_column('compression')
@@ -0,0 +1,31 @@
+"""Add wrapped data keys to blobs
+
+Revision ID: 3d8f2a6c9e71
+Revises: 1b6e9d3c7a52
+Create Date: 2026-10-18 18:12:47.903561
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3d8f2a6c9e71'
+down_revision = '1b6e9d3c7a52'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 已有的 blob 仍使用全局 AES_KEY，执行 flask rotate-master-key 后改为包装的数据密钥
+    with op.batch_alter_table('blobs', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('wrapped_key', sa.String(length=128), nullable=True))
+        batch_op.add_column(sa.Column('key_id', sa.String(length=64), nullable=True))
+        batch_op.create_index(batch_op.f('ix_blobs_key_id'), ['key_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('blobs', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_blobs_key_id'))
+        batch_op.drop_column('key_id')
+        batch_op.drop_column('wrapped_key')
@@ -0,0 +1,26 @@
+"""Add preview generation status to files
+
+Revision ID: 6c2e8f1a4b97
+Revises: 3d8f2a6c9e71
+Create Date: 2026-10-18 21:04:37.516208
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6c2e8f1a4b97'
+down_revision = '3d8f2a6c9e71'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('files', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('preview_status', sa.String(length=20), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('files', schema=None) as batch_op:
+        batch_op.drop_column('preview_status')
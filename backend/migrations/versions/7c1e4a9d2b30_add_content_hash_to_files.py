@@ -0,0 +1,28 @@
+"""Add content_hash to files
+
+Revision ID: 7c1e4a9d2b30
+Revises: 52b23579fe1e
+Create Date: 2026-10-18 10:12:44.316205
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c1e4a9d2b30'
+down_revision = '52b23579fe1e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('files', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('content_hash', sa.String(length=64), nullable=True))
+        batch_op.create_index(batch_op.f('ix_files_content_hash'), ['content_hash'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('files', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_files_content_hash'))
+        batch_op.drop_column('content_hash')
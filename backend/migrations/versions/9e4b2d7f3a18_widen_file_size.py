@@ -0,0 +1,32 @@
+"""Widen files.file_size to BigInteger for files over 2GB
+
+Revision ID: 9e4b2d7f3a18
+Revises: 6c2e8f1a4b97
+Create Date: 2026-10-18 23:12:05.384215
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9e4b2d7f3a18'
+down_revision = '6c2e8f1a4b97'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('files', schema=None) as batch_op:
+        batch_op.alter_column('file_size',
+               existing_type=sa.Integer(),
+               type_=sa.BigInteger(),
+               existing_nullable=True)
+
+
+def downgrade():
+    with op.batch_alter_table('files', schema=None) as batch_op:
+        batch_op.alter_column('file_size',
+               existing_type=sa.BigInteger(),
+               type_=sa.Integer(),
+               existing_nullable=True)
@@ -0,0 +1,26 @@
+"""Add storage_format to files
+
+Revision ID: a3f08c61d5e2
+Revises: 7c1e4a9d2b30
+Create Date: 2026-10-18 11:02:17.540913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3f08c61d5e2'
+down_revision = '7c1e4a9d2b30'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('files', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('storage_format', sa.String(length=20), server_default='cbc', nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('files', schema=None) as batch_op:
+        batch_op.drop_column('storage_format')
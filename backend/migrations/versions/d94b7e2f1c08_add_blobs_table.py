@@ -0,0 +1,43 @@
+"""Add content-addressed blobs table
+
+Revision ID: d94b7e2f1c08
+Revises: a3f08c61d5e2
+Create Date: 2026-10-18 13:40:05.118722
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd94b7e2f1c08'
+down_revision = 'a3f08c61d5e2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('blobs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('content_hash', sa.String(length=64), nullable=False),
+    sa.Column('size', sa.BigInteger(), nullable=False),
+    sa.Column('storage_path', sa.String(length=255), nullable=False),
+    sa.Column('storage_format', sa.String(length=20), nullable=True),
+    sa.Column('ref_count', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('content_hash')
+    )
+    with op.batch_alter_table('files', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('blob_id', sa.Integer(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_files_blob_id'), ['blob_id'], unique=False)
+        batch_op.create_foreign_key('fk_files_blob_id_blobs', 'blobs', ['blob_id'], ['id'])
+
+
+def downgrade():
+    with op.batch_alter_table('files', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_files_blob_id_blobs', type_='foreignkey')
+        batch_op.drop_index(batch_op.f('ix_files_blob_id'))
+        batch_op.drop_column('blob_id')
+
+    op.drop_table('blobs')
@@ -0,0 +1,31 @@
+"""Add hash-sharded storage_key to blobs
+
+Revision ID: f27d3b8a6e14
+Revises: e5a1c7b94f36
+Create Date: 2026-10-18 16:48:31.650277
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f27d3b8a6e14'
+down_revision = 'e5a1c7b94f36'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 已有 blob 的 storage_key 由 flask migrate-layout 命令在移动文件时填写
+    with op.batch_alter_table('blobs', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('storage_key', sa.String(length=64), nullable=True))
+        batch_op.create_unique_constraint('uq_blobs_storage_key', ['storage_key'])
+        batch_op.alter_column('storage_path', existing_type=sa.String(length=255), nullable=True)
+
+
+def downgrade():
+    with op.batch_alter_table('blobs', schema=None) as batch_op:
+        batch_op.alter_column('storage_path', existing_type=sa.String(length=255), nullable=False)
+        batch_op.drop_constraint('uq_blobs_storage_key', type_='unique')
+        batch_op.drop_column('storage_key')
@@ -0,0 +1,75 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from config import Config
+
+
+class AppTestCase(unittest.TestCase):
+    """使用内存数据库和临时上传目录的应用级测试基类
+
+    每个测试类创建一个应用和一个测试用户，子类可通过 config 覆盖 Config 中的配置。
+    """
+
+    config = {}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        cls.patcher = mock.patch.multiple(
+            Config,
+            UPLOAD_FOLDER=os.path.join(cls.directory, 'uploads'),
+            TEMP_FOLDER=os.path.join(cls.directory, 'temp'),
+            **{'PLAINTEXT_CACHE_ENABLED': False, **cls.config}
+        )
+        cls.patcher.start()
+
+        from flask_jwt_extended import create_access_token
+        from app import create_app, db
+        cls.app = create_app('testing')
+        cls.app.config['UPLOAD_FOLDER'] = Config.UPLOAD_FOLDER
+        cls.app.config['TEMP_FOLDER'] = Config.TEMP_FOLDER
+        cls.context = cls.app.app_context()
+        cls.context.push()
+        db.create_all()
+        cls.user = cls.create_user(cls.__name__.lower())
+        cls.user_id = cls.user.id
+        cls.headers = {'Authorization': f'Bearer {create_access_token(identity=str(cls.user_id))}'}
+        cls.client = cls.app.test_client()
+
+    @classmethod
+    def tearDownClass(cls):
+        from app import db
+        db.session.remove()
+        db.drop_all()
+        cls.context.pop()
+        cls.patcher.stop()
+        shutil.rmtree(cls.directory, ignore_errors=True)
+
+    @classmethod
+    def create_user(cls, username):
+        from app import db
+        from app.models.user import User
+        user = User(username=username, email=f'{username}@example.com')
+        user.set_password('password123')
+        db.session.add(user)
+        db.session.commit()
+        return user
+
+    @classmethod
+    def upload(cls, name, data, headers=None):
+        """通过上传接口保存文件，返回文件记录（也可以在 setUpClass 中调用）"""
+        from app import db
+        from app.models.file import File
+        response = cls.client.post('/api/files/upload', data={'file': (io.BytesIO(data), name)},
+                                   headers=headers or cls.headers, content_type='multipart/form-data')
+        if response.status_code != 200:
+            raise AssertionError(f'上传失败: {response.json}')
+        return db.session.get(File, response.json['file']['id'])
+
+    def read(self, file):
+        """解密读取文件的全部明文"""
+        from app.services.file_service import FileService
+        return b''.join(FileService().iter_decrypted(file))
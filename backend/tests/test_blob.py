@@ -0,0 +1,108 @@
+import io
+import os
+import unittest
+from unittest import mock
+from tests.app_case import AppTestCase
+from config import Config
+from app import db
+from app.models.blob import Blob
+from app.models.file import File
+from app.services.blob_service import BlobService
+from app.services.file_service import FileService
+
+
+class TestBlobRefCount(AppTestCase):
+    """测试去重存储的引用计数：保存、删除、替换内容时增减引用，最后一个引用释放时删除密文"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        from flask_jwt_extended import create_access_token
+        other = cls.create_user('other')
+        cls.other_headers = {'Authorization': f'Bearer {create_access_token(identity=str(other.id))}'}
+
+    def tearDown(self):
+        db.session.rollback()
+        for file in File.query.all():
+            self.client.delete(f'/api/files/{file.id}', headers=self.headers if file.owner_id == self.user_id
+                               else self.other_headers)
+        db.session.expire_all()
+
+    def stored_objects(self):
+        root = os.path.join(Config.UPLOAD_FOLDER, 'blobs')
+        return sorted(os.path.relpath(os.path.join(path, name), root)
+                      for path, _, names in os.walk(root) for name in names)
+
+    def test_shared_between_users(self):
+        """测试不同用户上传相同内容时共享一个 blob，逐个删除后才删除密文"""
+        data = os.urandom(5000)
+        first = self.upload('shared.bin', data)
+        second = self.upload('copy.bin', data, headers=self.other_headers)
+        self.assertEqual(first.blob_id, second.blob_id)
+        blob = first.blob
+        self.assertEqual(blob.ref_count, 2)
+        self.assertEqual(Blob.query.count(), 1)
+        self.assertEqual(self.stored_objects(), [blob.storage_key])
+
+        response = self.client.delete(f'/api/files/{first.id}', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        db.session.expire_all()
+        self.assertEqual(blob.ref_count, 1)
+        self.assertEqual(self.read(second), data)
+
+        blob_id = blob.id
+        self.client.delete(f'/api/files/{second.id}', headers=self.other_headers)
+        db.session.expire_all()
+        self.assertIsNone(db.session.get(Blob, blob_id))
+        self.assertEqual(self.stored_objects(), [])
+
+    def test_replace_content(self):
+        """测试替换内容时引用新的 blob，并释放旧 blob 的引用"""
+        file = self.upload('doc.txt', b'version 1')
+        kept = self.upload('kept.txt', b'version 1')
+        old = file.blob
+        self.assertEqual(old.ref_count, 2)
+
+        FileService().replace_content(file, io.BytesIO(b'version 2'))
+        db.session.expire_all()
+        self.assertNotEqual(file.blob_id, old.id)
+        self.assertEqual((old.ref_count, file.blob.ref_count), (1, 1))
+        self.assertEqual(self.read(file), b'version 2')
+
+        # 替换为已有内容时复用该 blob，旧 blob 失去最后一个引用后被删除
+        new_id = file.blob_id
+        FileService().replace_content(file, io.BytesIO(b'version 1'))
+        db.session.expire_all()
+        self.assertEqual((file.blob_id, old.ref_count), (kept.blob_id, 2))
+        self.assertIsNone(db.session.get(Blob, new_id))
+        self.assertEqual(self.stored_objects(), [old.storage_key])
+
+    def test_store_retry_on_conflict(self):
+        """测试并发保存相同内容导致唯一约束冲突时重新引用已有 blob，并删除多写入的对象"""
+        service = BlobService()
+        existing = service.store(io.BytesIO(b'racing content'))
+        acquire = BlobService.acquire
+        calls = []
+
+        def racing_acquire(self, content_hash):
+            # 第一次查找时另一个请求尚未提交，随后插入时触发唯一约束冲突
+            calls.append(content_hash)
+            if len(calls) == 1:
+                return None
+            return acquire(self, content_hash)
+
+        with mock.patch.object(BlobService, 'acquire', racing_acquire), mock.patch('time.sleep'):
+            blob = service.store(io.BytesIO(b'racing content'))
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(blob.id, existing.id)
+        self.assertEqual(blob.ref_count, 2)
+        self.assertEqual(self.stored_objects(), [existing.storage_key])
+
+        service.release(blob.id)
+        service.release(blob.id)
+        self.assertIsNone(db.session.get(Blob, existing.id))
+        self.assertEqual(self.stored_objects(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
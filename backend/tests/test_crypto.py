@@ -0,0 +1,147 @@
+import unittest
+import io
+import hashlib
+import os
+from unittest import mock
+from config import Config
+from app.utils.crypto import AESCipher
+from app.utils.chunked_cipher import ChunkedCipher, is_chunked
+from app.utils.compression import zstandard
+from app.utils.keyring import KeyRing
+
+KEY = b'0123456789abcdef0123456789abcdef'
+IV = b'0123456789abcdef'
+
+class TestAESCipher(unittest.TestCase):
+    def setUp(self):
+        self.aes = AESCipher(KEY, IV)
+
+    def test_encrypt_stream_matches_encrypt_file(self):
+        """测试流式加密与整块加密结果一致"""
+        for size in (0, 1, 15, 16, 17, 4096, 100003):
+            data = os.urandom(size)
+            out = io.BytesIO()
+            plain_size, digest = self.aes.encrypt_stream(io.BytesIO(data), out, chunk_size=1000)
+            self.assertEqual(out.getvalue(), self.aes.encrypt_file(data))
+            self.assertEqual(plain_size, size)
+            self.assertEqual(digest, hashlib.sha256(data).hexdigest())
+
+    def test_encrypt_stream_roundtrip(self):
+        """测试流式加密后可以正常解密"""
+        data = b'hello world' * 1000
+        out = io.BytesIO()
+        self.aes.encrypt_stream(io.BytesIO(data), out, chunk_size=7)
+        self.assertEqual(self.aes.decrypt_file(out.getvalue()), data)
+
+    def test_decrypt_stream_matches_decrypt_file(self):
+        """测试流式解密与整块解密结果一致"""
+        for size in (0, 1, 15, 16, 17, 4096, 100003):
+            data = os.urandom(size)
+            encrypted = self.aes.encrypt_file(data)
+            chunks = list(self.aes.decrypt_stream(io.BytesIO(encrypted), chunk_size=999))
+            self.assertEqual(b''.join(chunks), data)
+
+    def test_decrypt_range(self):
+        """测试 CBC 密文的随机范围解密"""
+        data = os.urandom(10007)
+        src = io.BytesIO(self.aes.encrypt_file(data))
+        self.assertEqual(self.aes.plaintext_size(src), len(data))
+        for start, end in ((0, 10007), (0, 1), (15, 17), (16, 32), (5000, 10007), (10006, 10007)):
+            chunks = self.aes.decrypt_range(src, start, end, chunk_size=100)
+            self.assertEqual(b''.join(chunks), data[start:end])
+
+class TestChunkedCipher(unittest.TestCase):
+    def setUp(self):
+        self.cipher = ChunkedCipher(KEY)
+
+    def encrypt(self, data, chunk_size=1000):
+        out = io.BytesIO()
+        result = self.cipher.encrypt_stream(io.BytesIO(data), out, chunk_size)
+        return out, result
+
+    def test_roundtrip(self):
+        """测试分块加密后完整解密"""
+        for size in (0, 1, 999, 1000, 1001, 25000):
+            data = os.urandom(size)
+            out, (plain_size, digest) = self.encrypt(data)
+            self.assertTrue(is_chunked(out))
+            self.assertEqual(plain_size, size)
+            self.assertEqual(digest, hashlib.sha256(data).hexdigest())
+            self.assertEqual(b''.join(self.cipher.decrypt_stream(out)), data)
+
+    def test_range(self):
+        """测试只解密请求范围"""
+        data = os.urandom(25000)
+        out, _ = self.encrypt(data)
+        reader = self.cipher.reader(out)
+        self.assertEqual(reader.size, len(data))
+        for start, end in ((0, 1), (999, 1001), (3000, 3000), (24000, 30000)):
+            self.assertEqual(b''.join(reader.iter_range(start, end)), data[start:end])
+
+    def test_tampering_detected(self):
+        """测试密文被篡改或截断时解密失败"""
+        data = os.urandom(5000)
+        out, _ = self.encrypt(data)
+        raw = bytearray(out.getvalue())
+        raw[100] ^= 1
+        with self.assertRaises(ValueError):
+            b''.join(self.cipher.decrypt_stream(io.BytesIO(bytes(raw))))
+        with self.assertRaises(ValueError):
+            self.cipher.reader(io.BytesIO(out.getvalue()[:-40]))
+
+    def test_compressed_roundtrip(self):
+        """测试加密前压缩：可压缩内容变小，随机读取结果不变"""
+        data = b''.join(b'line %d of a fairly repetitive log file\n' % i for i in range(2000))
+        for codec in ('zlib', 'zstd'):
+            if codec == 'zstd' and zstandard is None:
+                continue
+            out = io.BytesIO()
+            self.cipher.encrypt_stream(io.BytesIO(data), out, 4096, codec)
+            self.assertLess(len(out.getvalue()), len(data) // 2)
+            reader = self.cipher.reader(out)
+            self.assertEqual(b''.join(reader.iter_range()), data)
+            self.assertEqual(b''.join(reader.iter_range(5000, 30000)), data[5000:30000])
+
+    def test_incompressible_chunks_stored_raw(self):
+        """测试压缩后不变小的块按原样保存"""
+        data = os.urandom(3000) + b'a' * 3000
+        out = io.BytesIO()
+        self.cipher.encrypt_stream(io.BytesIO(data), out, 3000, 'zlib')
+        reader = self.cipher.reader(out)
+        self.assertEqual(reader.raw, [True, False])
+        self.assertEqual(b''.join(reader.iter_range()), data)
+
+    def test_parallel_matches_serial(self):
+        """测试线程池并行加解密与单线程结果一致"""
+        data = os.urandom(50000) + b'x' * 50000
+        with mock.patch.object(Config, 'CRYPTO_WORKERS', 4), mock.patch.object(Config, 'CRYPTO_WINDOW', 3):
+            out = io.BytesIO()
+            self.cipher.encrypt_stream(io.BytesIO(data), out, 1000, 'zlib')
+            self.assertEqual(b''.join(self.cipher.decrypt_stream(out, 12345, 87654)), data[12345:87654])
+        # 单线程也能读取并行写入的密文
+        self.assertEqual(b''.join(self.cipher.decrypt_stream(out)), data)
+
+class TestKeyRing(unittest.TestCase):
+    def test_wrap_and_rotate(self):
+        """测试数据密钥包装后可以解开，轮换主密钥后旧包装仍可用旧主密钥解开"""
+        old = KeyRing({'k1': os.urandom(32)}, 'k1')
+        data_key, wrapped, key_id = old.generate_data_key()
+        self.assertEqual(key_id, 'k1')
+        self.assertEqual(old.unwrap(wrapped, key_id), data_key)
+
+        new = KeyRing(dict(old.master_keys, k2=os.urandom(32)), 'k2')
+        rewrapped, new_id = new.wrap(new.unwrap(wrapped, key_id))
+        self.assertEqual(new_id, 'k2')
+        self.assertEqual(KeyRing({'k2': new.master_keys['k2']}, 'k2').unwrap(rewrapped, 'k2'), data_key)
+
+    def test_wrong_key_rejected(self):
+        """测试主密钥 ID 不匹配或缺失时无法解开"""
+        ring = KeyRing({'k1': os.urandom(32), 'k2': os.urandom(32)}, 'k1')
+        _, wrapped, _ = ring.generate_data_key()
+        with self.assertRaises(ValueError):
+            ring.unwrap(wrapped, 'k2')
+        with self.assertRaises(ValueError):
+            ring.unwrap(wrapped, 'k3')
+
+if __name__ == '__main__':
+    unittest.main()
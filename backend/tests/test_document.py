@@ -0,0 +1,24 @@
+import unittest
+import docx
+from app.utils.docx_blocks import iter_blocks
+
+
+class TestDocumentBlocks(unittest.TestCase):
+    def test_block_order(self):
+        """测试段落和表格按正文顺序排列，跳过空段落和空表格"""
+        document = docx.Document()
+        document.add_paragraph('前言')
+        table = document.add_table(rows=1, cols=2)
+        table.cell(0, 1).text = '单元格'
+        document.add_paragraph('  ')
+        document.add_table(rows=1, cols=1)
+        document.add_paragraph('结论')
+
+        blocks = list(iter_blocks(document))
+        self.assertEqual([block['type'] for block in blocks], ['paragraph', 'table', 'paragraph'])
+        self.assertEqual(blocks[1]['data'], [['', '单元格']])
+        self.assertEqual(blocks[2]['text'], '结论')
+
+
+if __name__ == '__main__':
+    unittest.main()
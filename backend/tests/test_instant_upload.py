@@ -0,0 +1,103 @@
+import hashlib
+import os
+import unittest
+from unittest import mock
+from tests.app_case import AppTestCase
+from config import Config
+from app import db
+from app.models.file import File
+
+
+class TestInstantUpload(AppTestCase):
+    """测试秒传的持有性证明：只有答对挑战区间哈希的请求才能引用已有内容"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        from flask_jwt_extended import create_access_token
+        other = cls.create_user('other')
+        cls.other_id = other.id
+        cls.other_headers = {'Authorization': f'Bearer {create_access_token(identity=str(other.id))}'}
+
+    def setUp(self):
+        self.data = os.urandom(Config.INSTANT_UPLOAD_PROOF_SIZE * 3)
+        self.original = self.upload('original.bin', self.data)
+        self.content_hash = hashlib.sha256(self.data).hexdigest()
+
+    def tearDown(self):
+        db.session.rollback()
+        for file in File.query.all():
+            headers = self.headers if file.owner_id == self.user_id else self.other_headers
+            self.client.delete(f'/api/files/{file.id}', headers=headers)
+        db.session.expire_all()
+
+    def instant(self, **extra):
+        body = {'filename': 'instant.bin', 'hash': self.content_hash, 'size': len(self.data), **extra}
+        return self.client.post('/api/files/upload/instant', json=body, headers=self.other_headers)
+
+    def challenge(self):
+        response = self.instant()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json['exists'])
+        self.assertNotIn('file', response.json)
+        return response.json['challenge']
+
+    def proof(self, challenge):
+        start = challenge['offset']
+        return hashlib.sha256(self.data[start:start + challenge['length']]).hexdigest()
+
+    def assert_not_attached(self):
+        db.session.expire_all()
+        self.assertEqual(File.query.filter_by(owner_id=self.other_id).count(), 0)
+        self.assertEqual(self.original.blob.ref_count, 1)
+
+    def test_correct_proof(self):
+        """测试答对挑战后创建文件记录并增加 blob 的引用计数"""
+        challenge = self.challenge()
+        self.assertEqual(challenge['length'], Config.INSTANT_UPLOAD_PROOF_SIZE)
+        response = self.instant(token=challenge['token'], proof=self.proof(challenge))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['file']['file_size'], len(self.data))
+
+        db.session.expire_all()
+        file = db.session.get(File, response.json['file']['id'])
+        self.assertEqual((file.owner_id, file.blob_id), (self.other_id, self.original.blob_id))
+        self.assertEqual(self.original.blob.ref_count, 2)
+        self.assertEqual(self.read(file), self.data)
+
+    def test_wrong_proof(self):
+        """测试错误的应答、伪造的令牌和其他用户的挑战都被拒绝，不引用已有内容"""
+        challenge = self.challenge()
+        wrong = hashlib.sha256(b'guess').hexdigest()
+        self.assertEqual(self.instant(token=challenge['token'], proof=wrong).status_code, 403)
+        self.assertEqual(self.instant(token='forged', proof=self.proof(challenge)).status_code, 403)
+
+        # 挑战与用户绑定，不能转交给其他用户使用
+        owner_challenge = self.client.post('/api/files/upload/instant', headers=self.headers, json={
+            'filename': 'again.bin', 'hash': self.content_hash, 'size': len(self.data)
+        }).json['challenge']
+        response = self.instant(token=owner_challenge['token'], proof=self.proof(owner_challenge))
+        self.assertEqual(response.status_code, 403)
+        self.assert_not_attached()
+
+    def test_missing_proof(self):
+        """测试没有应答时只返回挑战；未知内容要求正常上传"""
+        response = self.instant(token=self.challenge()['token'])
+        self.assertIn('challenge', response.json)
+        self.assert_not_attached()
+
+        response = self.instant(hash=hashlib.sha256(b'unknown').hexdigest())
+        self.assertEqual(response.json, {'exists': False})
+        self.assertEqual(self.instant(hash='xyz').status_code, 400)
+
+    def test_expired_challenge(self):
+        """测试过期的挑战即使应答正确也被拒绝"""
+        challenge = self.challenge()
+        with mock.patch.object(Config, 'INSTANT_UPLOAD_CHALLENGE_TTL', -1):
+            response = self.instant(token=challenge['token'], proof=self.proof(challenge))
+        self.assertEqual(response.status_code, 403)
+        self.assert_not_attached()
+
+
+if __name__ == '__main__':
+    unittest.main()
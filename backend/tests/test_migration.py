@@ -0,0 +1,159 @@
+import hashlib
+import io
+import json
+import os
+import re
+import unittest
+from tests.app_case import AppTestCase
+from config import Config
+from app import db
+from app.commands import migrate_storage_command, migrate_layout_command
+from app.models.blob import Blob
+from app.models.file import File, STORAGE_CBC, STORAGE_CHUNKED
+from app.services.file_service import FileService
+from app.utils.chunked_cipher import ChunkedCipher
+
+
+class MigrationTestCase(AppTestCase):
+    def setUp(self):
+        self.checkpoint = os.path.join(self.directory, f'{self._testMethodName}.json')
+        self.user_folder = os.path.join(Config.UPLOAD_FOLDER, str(self.user_id))
+        os.makedirs(self.user_folder, exist_ok=True)
+
+    def tearDown(self):
+        db.session.rollback()
+        for model in (File, Blob):
+            for record in model.query.all():
+                db.session.delete(record)
+        db.session.commit()
+
+    def create_legacy_file(self, name, data):
+        """按早期方式保存文件：用户目录下整文件 AES-CBC 加密"""
+        path = os.path.join(self.user_folder, name)
+        with open(path, 'wb') as f:
+            f.write(FileService().aes.encrypt_file(data))
+        file = File(filename=name, file_path=path, file_type='文本文件', file_size=len(data),
+                    storage_format=STORAGE_CBC, owner_id=self.user_id)
+        db.session.add(file)
+        db.session.commit()
+        return file
+
+    def invoke(self, command, *args):
+        result = self.app.test_cli_runner().invoke(command, ['--rate', '0', '--checkpoint', self.checkpoint, *args])
+        self.assertIsNone(result.exception, result.output)
+        db.session.expire_all()
+        return result
+
+    def load_checkpoint(self):
+        with open(self.checkpoint, encoding='utf-8') as f:
+            return json.load(f)
+
+
+class TestMigrateStorage(MigrationTestCase):
+    def test_convert_and_resume(self):
+        """测试 CBC 文件转换为分块格式，中断后从检查点继续，转换后内容不变"""
+        contents = {f'legacy-{i}.txt': os.urandom(1000 + i * 50000) for i in range(3)}
+        files = [self.create_legacy_file(name, data) for name, data in contents.items()]
+
+        self.invoke(migrate_storage_command, '--limit', '1')
+        self.assertEqual([file.storage_format for file in files], [STORAGE_CHUNKED, STORAGE_CBC, STORAGE_CBC])
+        state = self.load_checkpoint()
+        self.assertEqual((state['last_id'], state['done']), (files[0].id, 1))
+
+        self.invoke(migrate_storage_command)
+        self.assertEqual([file.storage_format for file in files], [STORAGE_CHUNKED] * 3)
+        state = self.load_checkpoint()
+        self.assertEqual((state['last_id'], state['done'], state['failed']), (files[-1].id, 3, []))
+        self.assertEqual(state['bytes'], sum(len(data) for data in contents.values()))
+
+        for file in files:
+            data = contents[file.filename]
+            self.assertEqual(self.read(file), data)
+            self.assertEqual(file.file_size, len(data))
+            self.assertIsNotNone(file.content_hash)
+            self.assertFalse([name for name in os.listdir(self.user_folder) if name.endswith('.tmp')])
+
+    def test_missing_file_recorded(self):
+        """测试密文丢失的文件记为失败，不影响其他文件，--restart 重新处理"""
+        missing = self.create_legacy_file('missing.txt', b'gone')
+        os.remove(missing.file_path)
+        kept = self.create_legacy_file('kept.txt', b'kept')
+
+        self.invoke(migrate_storage_command)
+        self.assertEqual(self.load_checkpoint()['failed'], [missing.id])
+        self.assertEqual((missing.storage_format, kept.storage_format), (STORAGE_CBC, STORAGE_CHUNKED))
+        self.assertEqual(self.read(kept), b'kept')
+
+        result = self.invoke(migrate_storage_command, '--restart')
+        self.assertIn(str(missing.id), result.output)
+        self.assertEqual(self.load_checkpoint()['failed'], [missing.id])
+
+
+class TestMigrateLayout(MigrationTestCase):
+    def create_flat_blob(self, name, data):
+        """按早期方式保存去重文件：blobs/ 下以明文哈希平铺，直接用全局 AES_KEY 加密"""
+        content_hash = hashlib.sha256(data).hexdigest()
+        path = os.path.join(Config.UPLOAD_FOLDER, 'blobs', content_hash)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            ChunkedCipher(Config.AES_KEY).encrypt_stream(io.BytesIO(data), f, Config.STORAGE_CHUNK_SIZE)
+        blob = Blob(content_hash=content_hash, size=len(data), legacy_path=path,
+                    storage_format=STORAGE_CHUNKED, ref_count=1)
+        db.session.add(blob)
+        db.session.flush()
+        file = File(filename=name, file_path=path, file_size=len(data), content_hash=content_hash,
+                    storage_format=STORAGE_CHUNKED, blob_id=blob.id, owner_id=self.user_id)
+        db.session.add(file)
+        db.session.commit()
+        return file
+
+    def assert_migrated(self, file, data, legacy_path):
+        self.assertFalse(os.path.exists(legacy_path))
+        self.assertIsNotNone(file.blob)
+        self.assertIsNone(file.blob.legacy_path)
+        self.assertRegex(file.blob.storage_key, r'^[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{32}$')
+        self.assertEqual(file.file_path, file.blob.storage_key)
+        self.assertTrue(os.path.exists(os.path.join(Config.UPLOAD_FOLDER, 'blobs', file.blob.storage_key)))
+        self.assertEqual(self.read(file), data)
+
+    def test_relocate_and_resume(self):
+        """测试平铺的 blob 和用户目录下的旧文件迁入分级目录，中断后从检查点继续"""
+        flat_data = os.urandom(70000)
+        flat = self.create_flat_blob('flat.bin', flat_data)
+        flat_path = flat.file_path
+        contents = {f'legacy-{i}.txt': f'旧文件 {i}\n'.encode() * (i + 1) * 1000 for i in range(2)}
+        files = [self.create_legacy_file(name, data) for name, data in contents.items()]
+        paths = [file.file_path for file in files]
+
+        # 平铺的 blob 只改名，不受 --limit 限制；用户目录下的文件按批次迁移
+        self.invoke(migrate_layout_command, '--limit', '1')
+        self.assert_migrated(flat, flat_data, flat_path)
+        self.assert_migrated(files[0], contents[files[0].filename], paths[0])
+        self.assertIsNone(files[1].blob_id)
+        self.assertTrue(os.path.exists(paths[1]))
+        self.assertEqual(self.load_checkpoint()['last_id'], files[0].id)
+
+        self.invoke(migrate_layout_command)
+        for file, path in zip(files, paths):
+            self.assert_migrated(file, contents[file.filename], path)
+        state = self.load_checkpoint()
+        self.assertEqual((state['done'], state['failed']), (2, []))
+        self.assertEqual(os.listdir(self.user_folder), [])
+        self.assertFalse([name for name in os.listdir(os.path.join(Config.UPLOAD_FOLDER, 'blobs'))
+                          if re.fullmatch('[0-9a-f]{64}', name)])
+
+    def test_duplicate_content(self):
+        """测试内容相同的旧文件迁移后共享一个 blob"""
+        data = b'same content' * 100
+        files = [self.create_legacy_file(f'copy-{i}.txt', data) for i in range(2)]
+        paths = [file.file_path for file in files]
+
+        self.invoke(migrate_layout_command)
+        for file, path in zip(files, paths):
+            self.assert_migrated(file, data, path)
+        self.assertEqual(files[0].blob_id, files[1].blob_id)
+        self.assertEqual(files[0].blob.ref_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,222 @@
+import unittest
+import errno
+import os
+import shutil
+import stat
+import tempfile
+import time
+from collections import namedtuple
+from unittest import mock
+from app.utils import plaintext_cache
+from app.utils.plaintext_cache import PlaintextCache, cache_key
+from app.services.file_service import FileService
+from app.utils.disk_cache import DiskCache
+from config import Config
+from tests.app_case import AppTestCase
+
+DiskUsage = namedtuple('DiskUsage', 'total used free')
+
+
+class TestPlaintextCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = PlaintextCache(self.directory, max_size=250, min_age=0)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def keys(self):
+        return sorted(name for _, _, names in os.walk(self.directory) for name in names if not name.startswith('.'))
+
+    def put(self, key, size, age):
+        path = self.cache.put(key, [b'x' * size])
+        when = time.time() - age
+        os.utime(path, (when, when))
+        return path
+
+    def test_hit_and_miss(self):
+        """测试命中、未命中统计和文件权限"""
+        self.assertIsNone(self.cache.get('a'))
+        path = self.cache.get_or_create('a', lambda: [b'hello ', b'world'])
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), b'hello world')
+        self.assertEqual(self.cache.get_or_create('a', lambda: [b'unused']), path)
+        self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o600)
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['entries']), (1, 2, 1))
+
+    def test_lru_eviction(self):
+        """测试超过上限时淘汰最久未使用的条目"""
+        self.put('old', 100, 30)
+        self.put('mid', 100, 20)
+        self.cache.get('old')  # 访问后变为最近使用
+        self.put('new', 100, 0)
+        self.assertIsNotNone(self.cache.get('old'))
+        self.assertIsNone(self.cache.get('mid'))
+        self.assertIsNotNone(self.cache.get('new'))
+
+    def test_recent_entries_not_evicted(self):
+        """测试最近访问过的条目即使超过上限也暂不淘汰"""
+        self.cache.min_age = 60
+        self.put('a', 200, 0)
+        self.put('b', 200, 0)
+        self.assertEqual(self.cache.stats()['entries'], 2)
+
+    def test_discard_by_prefix(self):
+        """测试按前缀删除同一内容的所有条目"""
+        self.put(cache_key('blob-abc', filename='a.xlsx'), 10, 0)
+        self.put(cache_key('blob-abc', filename='b.txt'), 10, 0)
+        self.put(cache_key('blob-def'), 10, 0)
+        self.cache.discard('blob-abc')
+        self.assertEqual(self.keys(), ['blob-def'])
+
+    def test_reserve_before_write(self):
+        """测试已知大小时先淘汰旧条目腾出空间再写入"""
+        self.put('old', 100, 30)
+        self.put('mid', 100, 20)
+        present = []
+
+        def produce():
+            present.extend(self.keys())
+            yield b'x' * 100
+
+        self.cache.put('new', produce(), size=100)
+        self.assertEqual(present, ['mid'])
+        self.assertEqual(self.keys(), ['mid', 'new'])
+
+        # 文件系统剩余空间不足时淘汰到能容纳这次写入为止，即使总大小没有超过上限
+        with mock.patch('shutil.disk_usage', return_value=DiskUsage(1000, 950, 50)):
+            self.cache.put('last', [b'x' * 100], size=100)
+        self.assertEqual(self.keys(), ['last', 'new'])
+
+    def test_accepts(self):
+        """测试单个条目不超过上限与文件系统大小中较小者的一定比例"""
+        self.cache.max_entry_ratio = 0.5
+        self.assertTrue(self.cache.accepts(125))
+        self.assertFalse(self.cache.accepts(126))
+        self.assertFalse(self.cache.accepts(None))
+        with mock.patch('shutil.disk_usage', return_value=DiskUsage(100, 0, 100)):
+            self.assertEqual(self.cache.capacity(), 100)
+            self.assertFalse(self.cache.accepts(60))
+
+    def test_sharded_layout(self):
+        """测试条目分散在两位十六进制的子目录中，分片之前放在根目录的旧条目过期后仍会被删除"""
+        path = self.cache.put('a', [b'x'])
+        shard = os.path.basename(os.path.dirname(path))
+        self.assertRegex(shard, '^[0-9a-f]{2}$')
+        self.assertEqual(os.path.dirname(os.path.dirname(path)), self.directory)
+        self.assertTrue(self.cache.contains_path(path))
+        self.assertFalse(self.cache.contains_path(os.path.join(self.directory, 'a')))
+
+        legacy = os.path.join(self.directory, 'legacy')
+        with open(legacy, 'wb') as f:
+            f.write(b'x' * 200)
+        os.utime(legacy, (time.time() - self.cache.ttl - 1,) * 2)
+        self.cache.evict()
+        self.assertFalse(os.path.exists(legacy))
+        self.assertEqual(self.keys(), ['a'])
+
+    def test_scan_only_when_needed(self):
+        """测试写入时按估计的总大小决定是否扫描目录，不超过上限时不扫描"""
+        scans = []
+        entries = self.cache._entries
+
+        def counted():
+            scans.append(1)
+            return entries()
+
+        with mock.patch.object(self.cache, '_entries', counted):
+            for key in 'abcd':
+                self.put(key, 50, 10)
+            self.assertEqual(len(scans), 1)  # 第一次写入时扫描一次，得到初始大小
+            self.assertEqual(self.cache.stats()['estimated_size'], 200)
+
+            self.put('e', 100, 0)  # 估计值超过上限
+            self.assertEqual(self.keys(), ['b', 'c', 'd', 'e'])
+            self.assertEqual(self.cache.stats()['estimated_size'], 250)
+
+            scans.clear()
+            self.cache.discard('b')
+            self.cache.put('f', [b'x' * 50], size=50)
+            self.assertEqual(len(scans), 1)  # 只有 discard 扫描
+
+            # 超过定期扫描间隔后写入时重新扫描，计入其他进程写入的条目
+            self.cache.evict_interval = 0
+            self.cache.put('g', [b'x'])
+            self.assertEqual(len(scans), 2)
+
+    def test_cache_key(self):
+        """测试缓存键只保留安全的扩展名"""
+        self.assertEqual(cache_key('blob-abc', filename='报表.XLSX'), 'blob-abc.xlsx')
+        self.assertEqual(cache_key('path-1', 5, '文件.数据'), 'path-1-5')
+        with self.assertRaises(ValueError):
+            self.cache.get('../etc/passwd')
+
+    def test_cache_directory(self):
+        """测试未配置目录时只使用 tmpfs，没有 tmpfs 时不启用缓存"""
+        with mock.patch.object(Config, 'PLAINTEXT_CACHE_DIR', None):
+            with mock.patch.object(plaintext_cache, 'SHM_DIRECTORY', self.directory):
+                self.assertEqual(plaintext_cache.cache_directory(),
+                                 os.path.join(self.directory, 'cloud_storage_plaintext'))
+            with mock.patch.object(plaintext_cache, 'SHM_DIRECTORY', os.path.join(self.directory, 'missing')):
+                self.assertIsNone(plaintext_cache.cache_directory())
+                self.assertIsNone(plaintext_cache.get_plaintext_cache())
+        with mock.patch.object(Config, 'PLAINTEXT_CACHE_DIR', self.directory):
+            self.assertEqual(plaintext_cache.cache_directory(), self.directory)
+
+
+class TestPlaintextFallback(AppTestCase):
+    """测试明文缓存不可用时解密到临时目录"""
+
+    config = {'PLAINTEXT_CACHE_ENABLED': True, 'PLAINTEXT_CACHE_MAX_SIZE': 1000}
+
+    def setUp(self):
+        self.cache_dir = os.path.join(self.directory, 'plaintext')
+        self.patcher = mock.patch.object(Config, 'PLAINTEXT_CACHE_DIR', self.cache_dir)
+        self.patcher.start()
+        self.cache = plaintext_cache.get_plaintext_cache()
+        self.service = FileService()
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def decrypt(self, file):
+        path = self.service.get_decrypted_file_path(file)
+        try:
+            with open(path, 'rb') as f:
+                return path, f.read()
+        finally:
+            self.service.remove_decrypted_file(path)
+
+    def test_small_file_cached(self):
+        """测试小文件解密到缓存中，使用后保留"""
+        file = self.upload('small.txt', b'a' * 100)
+        path, data = self.decrypt(file)
+        self.assertEqual(data, b'a' * 100)
+        self.assertTrue(self.cache.contains_path(path))
+        self.assertTrue(os.path.exists(path))
+
+    def test_large_file_not_cached(self):
+        """测试超过单条目比例的文件不写入缓存"""
+        file = self.upload('large.txt', b'b' * 500)
+        path, data = self.decrypt(file)
+        self.assertEqual(data, b'b' * 500)
+        self.assertFalse(self.cache.contains_path(path))
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(b''.join(self.service.iter_decrypted(file)), b'b' * 500)
+        self.assertEqual(self.cache.stats()['entries'], 0)
+
+    def test_fill_error(self):
+        """测试缓存写入失败（空间不足）时改为解密到临时目录，下载直接解密"""
+        file = self.upload('full.txt', b'c' * 100)
+        no_space = OSError(errno.ENOSPC, 'No space left on device')
+        with mock.patch.object(DiskCache, 'put', side_effect=no_space):
+            path, data = self.decrypt(file)
+            self.assertEqual(b''.join(self.service.iter_decrypted(file)), b'c' * 100)
+        self.assertEqual(data, b'c' * 100)
+        self.assertFalse(self.cache.contains_path(path))
+        self.assertEqual(self.cache.stats()['entries'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
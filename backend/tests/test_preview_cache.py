@@ -0,0 +1,71 @@
+import unittest
+import os
+import shutil
+import tempfile
+from app.utils.preview_cache import PreviewCache, preview_key, preview_prefix
+
+
+class TestPreviewCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = PreviewCache(self.directory, max_size=1024 * 1024, key=b'k' * 32, min_age=0)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def keys(self):
+        return sorted(name for _, _, names in os.walk(self.directory) for name in names)
+
+    def test_render_once(self):
+        """测试未命中时渲染一次，之后直接读取加密保存的结果"""
+        calls = []
+
+        def render():
+            calls.append(1)
+            return b'PNG page data'
+
+        key = preview_key(1, 'hash-v1', 'pdf-page', {'page': 1, 'scale': 1.0})
+        self.assertEqual(self.cache.get_or_render(key, render), b'PNG page data')
+        self.assertEqual(self.cache.get_or_render(key, render), b'PNG page data')
+        self.assertEqual(len(calls), 1)
+        with open(self.cache.path(key), 'rb') as f:
+            self.assertNotIn(b'PNG page data', f.read())
+
+    def test_json(self):
+        """测试 JSON 结果的缓存"""
+        key = preview_key(1, 'hash-v1', 'content')
+        value = {'content': ['第一段', '第二段'], 'file_type': 'Word'}
+        self.assertEqual(self.cache.get_or_render_json(key, lambda: value), value)
+        self.assertEqual(self.cache.get_or_render_json(key, lambda: None), value)
+
+    def test_key_depends_on_version_and_params(self):
+        """测试不同版本或参数使用不同的缓存键"""
+        key = preview_key(1, 'v1', 'pdf-page', {'page': 1})
+        self.assertNotEqual(key, preview_key(1, 'v2', 'pdf-page', {'page': 1}))
+        self.assertNotEqual(key, preview_key(1, 'v1', 'pdf-page', {'page': 2}))
+        self.assertEqual(key, preview_key(1, 'v1', 'pdf-page', {'page': 1}))
+
+    def test_unreadable_entry_is_miss(self):
+        """测试密钥不同（如主密钥已轮换）或条目被换到其他键下时视为未命中"""
+        key = preview_key(1, 'v1', 'content')
+        other = preview_key(2, 'v1', 'content')
+        self.cache.store(key, b'data')
+        os.makedirs(os.path.dirname(self.cache.path(other)), exist_ok=True)
+        shutil.copy(self.cache.path(key), self.cache.path(other))
+        self.assertIsNone(self.cache.load(other))
+        self.assertFalse(os.path.exists(self.cache.path(other)))
+
+        rotated = PreviewCache(self.directory, max_size=1024 * 1024, key=b'n' * 32)
+        self.assertIsNone(rotated.load(key))
+
+    def test_discard_file(self):
+        """测试按文件 ID 删除条目，不影响 ID 前缀相同的其他文件"""
+        self.cache.store(preview_key(1, 'v1', 'content'), b'a')
+        self.cache.store(preview_key(12, 'v1', 'content'), b'b')
+        self.cache.store(preview_key(3, 'v1', 'content'), b'c')
+        self.cache.discard((preview_prefix(1), preview_prefix(3)))
+        self.assertEqual(self.keys(), [preview_key(12, 'v1', 'content')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import io
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+from tests.app_case import AppTestCase
+from app import db
+from app.models.file import File, PREVIEW_PENDING, PREVIEW_PROCESSING, PREVIEW_READY, PREVIEW_FAILED
+from app.services.file_service import FileService
+from app.services.preview_queue import preview_queue, _pregenerate
+from app.services.preview_service import PreviewService
+
+
+class TestPreviewQueue(AppTestCase):
+    """测试预览预生成的状态标记和后台任务的状态变化"""
+
+    config = {'PREVIEW_SANDBOX_ENABLED': False, 'PREVIEW_CACHE_ENABLED': False}
+
+    def setUp(self):
+        self.app.config['PREVIEW_PREGENERATE_ENABLED'] = True
+        # 内存数据库不能在线程间共享，测试中直接执行任务
+        self.submit = mock.patch.object(preview_queue, 'submit').start()
+
+    def tearDown(self):
+        mock.patch.stopall()
+        self.app.config['PREVIEW_PREGENERATE_ENABLED'] = False
+        db.session.rollback()
+        for file in File.query.all():
+            self.client.delete(f'/api/files/{file.id}', headers=self.headers)
+        db.session.expire_all()
+
+    def status(self, file):
+        db.session.expire_all()
+        return db.session.get(File, file.id).preview_status
+
+    def run_job(self, file, content_hash=None):
+        return _pregenerate(self.app, file.id, content_hash or file.content_hash)
+
+    def test_prepare(self):
+        """测试支持的类型标记为等待处理；不支持的类型和未启用时清除旧状态"""
+        file = SimpleNamespace(filename='a.pdf', file_type='PDF', preview_status=PREVIEW_READY)
+        preview_queue.prepare(file)
+        self.assertEqual(file.preview_status, PREVIEW_PENDING)
+
+        file = SimpleNamespace(filename='a.zip', file_type='压缩文件', preview_status=PREVIEW_FAILED)
+        preview_queue.prepare(file)
+        self.assertIsNone(file.preview_status)
+
+        self.app.config['PREVIEW_PREGENERATE_ENABLED'] = False
+        file = SimpleNamespace(filename='a.pdf', file_type='PDF', preview_status=PREVIEW_READY)
+        preview_queue.prepare(file)
+        self.assertIsNone(file.preview_status)
+
+    def test_replace_clears_status(self):
+        """测试未启用预生成时，替换内容清除上一版本的状态"""
+        self.app.config['PREVIEW_PREGENERATE_ENABLED'] = False
+        file = self.upload('notes.txt', b'first')
+        file.preview_status = PREVIEW_READY
+        db.session.commit()
+        FileService().replace_content(file, io.BytesIO(b'second'))
+        self.assertIsNone(self.status(file))
+
+    def test_ready(self):
+        """测试任务执行期间为处理中，完成后为就绪"""
+        file = self.upload('notes.txt', '第一行\n第二行\n'.encode('utf-8'))
+        seen = []
+        pregenerate = PreviewService.pregenerate
+
+        def record(service, target):
+            seen.append(target.preview_status)
+            return pregenerate(service, target)
+
+        with mock.patch.object(PreviewService, 'pregenerate', autospec=True, side_effect=record):
+            self.assertTrue(self.run_job(file))
+        self.assertEqual(seen, [PREVIEW_PROCESSING])
+        self.assertEqual(self.status(file), PREVIEW_READY)
+
+    def test_failed(self):
+        """测试处理器出错时标记为失败"""
+        file = self.upload('broken.pdf', b'not a pdf')
+        self.assertFalse(self.run_job(file))
+        self.assertEqual(self.status(file), PREVIEW_FAILED)
+
+    def test_stale_job(self):
+        """测试内容已更新后，旧版本的任务不执行也不修改新版本的状态"""
+        file = self.upload('notes.txt', b'version 1')
+        old_hash = file.content_hash
+        FileService().replace_content(file, io.BytesIO(b'version 2'))
+        self.assertEqual(self.status(file), PREVIEW_PENDING)
+        self.submit.assert_called_with(file)
+
+        with mock.patch.object(PreviewService, 'pregenerate') as pregenerate:
+            self.assertFalse(self.run_job(file, old_hash))
+        pregenerate.assert_not_called()
+        self.assertEqual(self.status(file), PREVIEW_PENDING)
+
+        self.assertTrue(self.run_job(file))
+        self.assertEqual(self.status(file), PREVIEW_READY)
+
+    def test_replaced_while_running(self):
+        """测试任务执行期间内容被替换时，任务结束后不覆盖新版本的状态"""
+        file = self.upload('notes.txt', b'version 1')
+
+        def replace(service, target):
+            FileService().replace_content(target, io.BytesIO(b'version 2'))
+
+        with mock.patch.object(PreviewService, 'pregenerate', autospec=True, side_effect=replace):
+            self.assertTrue(self.run_job(file))
+        self.assertEqual(self.status(file), PREVIEW_PENDING)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,298 @@
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+import fitz
+from PIL import Image, ImageChops, ImageOps, ImageStat
+from config import Config
+from app.services.file_service import FileService
+from app.services.preview_service import (PreviewService, snap_image_width, _to_output_mode,
+                                          _render_image, _render_pdf_page, _build_pyramid, _tile_path)
+from app.utils.preview_cache import get_preview_cache
+
+
+def _save_pdf(path, width, height):
+    pdf = fitz.open()
+    pdf.new_page(width=width, height=height)
+    pdf.save(path)
+    pdf.close()
+
+
+class TestRender(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_snap_image_width(self):
+        """测试请求宽度向上取整到标准宽度，超出时使用最大标准宽度"""
+        widths = Config.IMAGE_PREVIEW_WIDTHS
+        self.assertEqual(snap_image_width(1), widths[0])
+        self.assertEqual(snap_image_width(widths[0]), widths[0])
+        self.assertEqual(snap_image_width(widths[0] + 1), widths[1])
+        self.assertEqual(snap_image_width(widths[-1] * 10), widths[-1])
+
+    def test_pdf_pixel_clamp(self):
+        """测试超大页面按像素上限降低缩放比例"""
+        path = os.path.join(self.directory, 'big.pdf')
+        _save_pdf(path, 10000, 10000)
+        with Image.open(io.BytesIO(_render_pdf_page(path, 1, 4.0, 'png'))) as img:
+            self.assertLessEqual(img.width * img.height, Config.PDF_RENDER_MAX_PIXELS)
+            self.assertGreater(img.width * img.height, Config.PDF_RENDER_MAX_PIXELS * 0.98)
+        with self.assertRaises(IndexError):
+            _render_pdf_page(path, 2, 1.0, 'png')
+
+    def test_pdf_scale_range(self):
+        """测试缩放比例和格式的校验"""
+        service = PreviewService()
+        for scale, image_format in ((Config.PDF_RENDER_MAX_SCALE * 2, 'png'),
+                                    (Config.PDF_RENDER_MIN_SCALE / 2, 'png'), (1.0, 'gif')):
+            with self.assertRaises(ValueError):
+                service.render_pdf_page(None, 1, scale, image_format)
+
+    def test_jpeg_flattens_alpha(self):
+        """测试 JPEG 输出把透明区域铺为白色，WebP 保留透明通道"""
+        img = Image.new('RGBA', (4, 4), (255, 0, 0, 0))
+        self.assertEqual(_to_output_mode(img, 'jpeg').getpixel((0, 0)), (255, 255, 255))
+        self.assertEqual(_to_output_mode(img, 'webp').mode, 'RGBA')
+        self.assertEqual(_to_output_mode(Image.new('L', (1, 1)), 'jpeg').mode, 'RGB')
+
+        path = os.path.join(self.directory, 'alpha.png')
+        Image.new('RGBA', (400, 200), (0, 0, 0, 0)).save(path)
+        with Image.open(io.BytesIO(_render_image(path, 100, 'jpeg'))) as out:
+            self.assertEqual((out.format, out.mode, out.size), ('JPEG', 'RGB', (100, 50)))
+            self.assertGreater(min(out.getpixel((50, 25))), 250)
+
+
+class TestDeepZoom(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'image.png')
+        Image.new('RGB', (600, 300)).save(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def tile_size(self, level, col, row):
+        with Image.open(_tile_path(self.directory, level, col, row)) as img:
+            return img.size
+
+    def test_pyramid_geometry(self):
+        """测试各层级尺寸、行列数和带重叠的瓦片范围（边缘瓦片只向内重叠）"""
+        info = _build_pyramid(self.path, self.directory, 256, 1, 'png')
+        self.assertEqual(info['max_level'], 10)
+        levels = info['levels']
+        self.assertEqual(len(levels), 11)
+        self.assertEqual({k: levels[10][k] for k in ('width', 'height', 'cols', 'rows')},
+                         {'width': 600, 'height': 300, 'cols': 3, 'rows': 2})
+        self.assertEqual([(l['width'], l['height']) for l in levels[7:10]], [(75, 38), (150, 75), (300, 150)])
+        self.assertEqual((levels[9]['cols'], levels[9]['rows']), (2, 1))
+        self.assertEqual((levels[0]['width'], levels[0]['height'], levels[0]['cols']), (1, 1, 1))
+
+        self.assertEqual(self.tile_size(10, 0, 0), (257, 257))  # 左上角：只向右、向下重叠
+        self.assertEqual(self.tile_size(10, 1, 0), (258, 257))  # 中间：左右都重叠
+        self.assertEqual(self.tile_size(10, 2, 1), (89, 45))    # 右下角：到图片边缘为止
+        self.assertEqual(self.tile_size(9, 1, 0), (45, 150))
+        self.assertEqual(self.tile_size(0, 0, 0), (1, 1))
+
+    def test_selected_tiles(self):
+        """测试只编码指定的瓦片"""
+        _build_pyramid(self.path, self.directory, 256, 1, 'png', tiles=[(10, 2, 1)])
+        self.assertEqual(sorted(name for name in os.listdir(self.directory) if name != 'image.png'), ['10_2_1'])
+
+    def test_selected_tiles_match_full_build(self):
+        """测试只生成部分瓦片时（不逐级缩小）与完整生成的瓦片尺寸相同、内容接近"""
+        path = os.path.join(self.directory, 'gradient.png')
+        Image.linear_gradient('L').resize((600, 300)).convert('RGB').save(path)
+        full_dir = os.path.join(self.directory, 'full')
+        partial_dir = os.path.join(self.directory, 'partial')
+        os.makedirs(full_dir)
+        os.makedirs(partial_dir)
+        tiles = [(10, 1, 0), (10, 2, 1), (9, 1, 0), (8, 0, 0), (3, 0, 0), (0, 0, 0)]
+        info = _build_pyramid(path, full_dir, 256, 1, 'png')
+        self.assertEqual(_build_pyramid(path, partial_dir, 256, 1, 'png', tiles=tiles), info)
+        self.assertEqual(len(os.listdir(partial_dir)), len(tiles))
+        for tile in tiles:
+            with Image.open(_tile_path(full_dir, *tile)) as full, Image.open(_tile_path(partial_dir, *tile)) as partial:
+                self.assertEqual(full.size, partial.size)
+                diff = ImageChops.difference(full.convert('L'), partial.convert('L'))
+                self.assertLess(ImageStat.Stat(diff).mean[0], 3, tile)
+
+    def test_jpeg_draft(self):
+        """测试 JPEG 的低层级瓦片在解码时按比例缩小，不解码原图尺寸"""
+        path = os.path.join(self.directory, 'photo.jpg')
+        Image.new('RGB', (2048, 1024), (200, 100, 50)).save(path)
+        decoded = []
+        transpose = ImageOps.exif_transpose
+
+        def record(img, *args, **kwargs):
+            result = transpose(img, *args, **kwargs)
+            decoded.append(result.size)
+            return result
+
+        with mock.patch.object(ImageOps, 'exif_transpose', record):
+            info = _build_pyramid(path, self.directory, 256, 1, 'jpeg', tiles=[(8, 0, 0)])
+        self.assertEqual(decoded, [(256, 128)])
+        self.assertEqual((info['width'], info['height']), (2048, 1024))
+        self.assertEqual(self.tile_size(8, 0, 0), (256, 128))
+
+    def test_rebuild_block(self):
+        """测试瓦片被淘汰后只重新生成所在的瓦片块"""
+        with mock.patch.multiple(Config, PREVIEW_CACHE_DIR=os.path.join(self.directory, 'previews'),
+                                 TEMP_FOLDER=self.directory, DEEPZOOM_REBUILD_BLOCK=2,
+                                 DEEPZOOM_TILE_SIZE=64, DEEPZOOM_FORMAT='png'):
+            cache = get_preview_cache()
+            service = PreviewService()
+            runs = []
+
+            def run(file, handler, tile_dir, *args):
+                runs.append(args[-1])
+                return _build_pyramid(self.path, tile_dir, *args)
+
+            service.engine = SimpleNamespace(run=run)
+            file = SimpleNamespace(id=1, content_hash='v1', updated_at=None, created_at=None)
+            info = service.get_deepzoom_info(file)
+            self.assertEqual(runs, [None])
+            self.assertEqual((info['levels'][10]['cols'], info['levels'][10]['rows']), (10, 5))
+            data, mimetype = service.get_deepzoom_tile(file, 10, 3, 2)
+            self.assertEqual(mimetype, 'image/png')
+
+            os.remove(cache.path(service._tile_key(file, 10, 3, 2)))
+            self.assertEqual(service.get_deepzoom_tile(file, 10, 3, 2)[0], data)
+            self.assertEqual(runs[1], [(10, 2, 2), (10, 3, 2), (10, 2, 3), (10, 3, 3)])
+            with self.assertRaises(IndexError):
+                service.get_deepzoom_tile(file, 10, 10, 0)
+            self.assertEqual(len(runs), 2)
+
+    def test_rebuild_merged(self):
+        """测试并发的重建只执行一次，等待者从缓存读取各自的分片"""
+        with mock.patch.object(Config, 'PREVIEW_CACHE_DIR', os.path.join(self.directory, 'previews')):
+            cache = get_preview_cache()
+            service = FileService()
+            file = SimpleNamespace(id=1, content_hash='v1', updated_at=None, created_at=None)
+            builds = []
+
+            def build(want):
+                builds.append(want)
+                time.sleep(0.2)
+                for part in range(4):
+                    cache.store(f'part-{part}', f'data-{part}'.encode(), evict=False)
+                return {'parts': 4}, f'data-{want}'.encode()
+
+            results = {}
+
+            def request(part):
+                results[part] = service.rebuild_preview(file, 'parts', lambda: build(part), f'part-{part}')
+
+            threads = [threading.Thread(target=request, args=(part,)) for part in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(len(builds), 1)
+            self.assertEqual(results, {part: ({'parts': 4}, f'data-{part}'.encode()) for part in range(4)})
+
+
+class TestRenderRoutes(unittest.TestCase):
+    """测试单页渲染和缩略图接口的 ETag 协商缓存"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        cls.patcher = mock.patch.multiple(
+            Config,
+            UPLOAD_FOLDER=os.path.join(cls.directory, 'uploads'),
+            TEMP_FOLDER=os.path.join(cls.directory, 'temp'),
+            PLAINTEXT_CACHE_ENABLED=False
+        )
+        cls.patcher.start()
+
+        from flask_jwt_extended import create_access_token
+        from app import create_app, db
+        from app.models.user import User
+        cls.app = create_app('testing')
+        cls.app.config['UPLOAD_FOLDER'] = Config.UPLOAD_FOLDER
+        cls.app.config['TEMP_FOLDER'] = Config.TEMP_FOLDER
+        cls.context = cls.app.app_context()
+        cls.context.push()
+        db.create_all()
+        user = User(username='render', email='render@example.com')
+        user.set_password('password123')
+        db.session.add(user)
+        db.session.commit()
+        cls.user_id = user.id
+        cls.headers = {'Authorization': f'Bearer {create_access_token(identity=str(user.id))}'}
+        cls.client = cls.app.test_client()
+
+    @classmethod
+    def tearDownClass(cls):
+        from app import db
+        db.session.remove()
+        db.drop_all()
+        cls.context.pop()
+        cls.patcher.stop()
+        shutil.rmtree(cls.directory, ignore_errors=True)
+
+    def upload(self, name, data):
+        """上传文件并返回带分享码的访问地址前缀"""
+        from app.services.share_service import ShareService
+        response = self.client.post('/api/files/upload', data={'file': (io.BytesIO(data), name)},
+                                    headers=self.headers, content_type='multipart/form-data')
+        file_id = response.json['file']['id']
+        share_code = ShareService().create_share(file_id, self.user_id).share_code
+        return f'/api/files/{file_id}', f'shareCode={share_code}'
+
+    def assert_not_modified(self, url, etag):
+        response = self.client.get(url, headers={'If-None-Match': f'"{etag}"'})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+        self.assertEqual(response.headers['ETag'], f'"{etag}"')
+
+    def test_image_etag(self):
+        """测试缩略图的 ETag 按标准宽度计算，宽度取整到同一档时命中 304"""
+        buffer = io.BytesIO()
+        Image.new('RGB', (2000, 1000), (10, 20, 30)).save(buffer, 'PNG')
+        url, share = self.upload('photo.png', buffer.getvalue())
+
+        width = Config.IMAGE_PREVIEW_WIDTHS[0]
+        response = self.client.get(f'{url}/image?width={width}&format=jpeg&{share}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'image/jpeg')
+        etag = response.headers['ETag'].strip('"')
+        self.assertTrue(etag.endswith(f'-w{width}-jpeg'))
+
+        self.assert_not_modified(f'{url}/image?width={width - 1}&format=jpeg&{share}', etag)
+        response = self.client.get(f'{url}/image?width={width}&format=webp&{share}',
+                                   headers={'If-None-Match': f'"{etag}"'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_pdf_page_etag(self):
+        """测试 PDF 单页的 ETag 包含页码、缩放比例和格式"""
+        path = os.path.join(self.directory, 'doc.pdf')
+        _save_pdf(path, 200, 100)
+        with open(path, 'rb') as f:
+            url, share = self.upload('doc.pdf', f.read())
+
+        response = self.client.get(f'{url}/pdf/pages/1?scale=2&{share}')
+        self.assertEqual(response.status_code, 200)
+        with Image.open(io.BytesIO(response.data)) as img:
+            self.assertEqual(img.size, (400, 200))
+        etag = response.headers['ETag'].strip('"')
+        self.assertTrue(etag.endswith('-p1-2-png'))
+
+        self.assert_not_modified(f'{url}/pdf/pages/1?scale=2.0&{share}', etag)
+        response = self.client.get(f'{url}/pdf/pages/1?scale=1&{share}',
+                                   headers={'If-None-Match': f'"{etag}"'})
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(f'{url}/pdf/pages/1?scale=100&{share}')
+        self.assertEqual(response.status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
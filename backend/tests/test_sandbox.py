@@ -0,0 +1,57 @@
+import os
+import time
+import unittest
+from flask import Flask
+from app.services.preview_engine import detect_type, get_sandbox, run_sandboxed
+from app.utils.sandbox import SandboxPool, SandboxTimeout
+
+
+class TestSandbox(unittest.TestCase):
+    def setUp(self):
+        self.pool = SandboxPool(1, 10, memory_limit=512 * 1024 * 1024)
+
+    def tearDown(self):
+        self.pool.shutdown()
+
+    def test_result_and_error(self):
+        """测试返回结果和在当前进程重新抛出任务的异常"""
+        self.assertEqual(self.pool.run(divmod, 7, 2), (3, 1))
+        with self.assertRaises(ValueError):
+            self.pool.run(int, 'x')
+
+    def test_timeout(self):
+        """测试超时的进程被终止，之后的任务由新进程执行"""
+        started = time.monotonic()
+        with self.assertRaises(SandboxTimeout):
+            self.pool.run(time.sleep, 30, timeout=1)
+        self.assertLess(time.monotonic() - started, 10)
+        self.assertEqual(self.pool.run(abs, -1), 1)
+
+    def test_memory_limit(self):
+        """测试超出内存上限时抛出 MemoryError"""
+        with self.assertRaises(MemoryError):
+            self.pool.run(bytearray, 1024 * 1024 * 1024)
+        self.assertEqual(self.pool.run(abs, -1), 1)
+
+    def test_detect_type(self):
+        """测试按扩展名和 MIME 类型识别预览类型"""
+        self.assertEqual(detect_type('a.PDF'), 'pdf')
+        self.assertEqual(detect_type('a.log'), 'text')
+        self.assertEqual(detect_type('photo', 'image/heic'), 'image')
+        self.assertEqual(detect_type('notes', 'text/plain'), 'text')
+        self.assertIsNone(detect_type('a.zip', 'application/zip'))
+
+    def test_app_config(self):
+        """测试沙箱开关读取当前应用的配置，应用上下文之外使用 Config"""
+        app = Flask(__name__)
+        app.config['PREVIEW_SANDBOX_ENABLED'] = False
+        with app.app_context():
+            self.assertEqual(run_sandboxed('text', os.getpid), os.getpid())
+        try:
+            self.assertNotEqual(run_sandboxed('text', os.getpid), os.getpid())
+        finally:
+            get_sandbox('text').shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+import threading
+import time
+from app.utils.singleflight import SingleFlight
+
+
+class TestSingleFlight(unittest.TestCase):
+    def run_concurrently(self, flight, key, fn, count=8):
+        results, errors = [], []
+
+        def worker():
+            try:
+                results.append(flight.do(key, fn))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results, errors
+
+    def test_concurrent_calls_share_result(self):
+        """测试并发调用只执行一次并共享结果"""
+        flight = SingleFlight()
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return {'value': 42}
+
+        results, errors = self.run_concurrently(flight, 'k', compute)
+        self.assertEqual(errors, [])
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(results), 8)
+        self.assertTrue(all(result is results[0] for result in results))
+        self.assertEqual(flight.stats(), {'executed': 1, 'shared': 7, 'in_flight': 0})
+
+    def test_error_propagates_and_key_released(self):
+        """测试异常传递给所有等待者，之后的调用重新执行"""
+        flight = SingleFlight()
+
+        def fail():
+            time.sleep(0.1)
+            raise ValueError('boom')
+
+        results, errors = self.run_concurrently(flight, 'k', fail, count=4)
+        self.assertEqual(results, [])
+        self.assertEqual(len(errors), 4)
+        self.assertEqual(flight.do('k', lambda: 'ok'), 'ok')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,266 @@
+import unittest
+import datetime
+import io
+import re
+import zipfile
+from unittest import mock
+import openpyxl
+from tests.app_case import AppTestCase
+from app import db
+from app.models.file import File
+from app.services import spreadsheet_service
+from app.services.file_service import FileService
+from app.services.share_service import ShareService
+from app.services.spreadsheet_service import (SpreadsheetService, _json_value, _trim, _cell_change, _formula_refs,
+                                              _column_chunk, _concat_column, pa, MAX_ROWS, MAX_COLUMNS)
+
+
+def workbook_bytes(sheets):
+    """生成 xlsx 文件：sheets 为 {工作表名: [表头, 数据行...]}"""
+    workbook = openpyxl.Workbook()
+    workbook.remove(workbook.active)
+    for name, rows in sheets.items():
+        worksheet = workbook.create_sheet(name)
+        for row in rows:
+            worksheet.append(row)
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def with_results(content, results):
+    """在 openpyxl 生成的 xlsx 中写入公式的缓存结果（模拟 Excel 保存的文件）
+
+    results 为 {工作表序号: {坐标: 结果}}，序号从 1 开始。
+    """
+    source = zipfile.ZipFile(io.BytesIO(content))
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as target:
+        for item in source.infolist():
+            data = source.read(item)
+            match = re.fullmatch(r'xl/worksheets/sheet(\d+)\.xml', item.filename)
+            for coord, value in results.get(int(match.group(1)) if match else 0, {}).items():
+                data_type = ' t="str"' if isinstance(value, str) else ''
+                data = re.sub(rf'<c r="{coord}">(<f>.*?</f>)<v></v>'.encode(),
+                              rf'<c r="{coord}"{data_type}>\1<v>{value}</v>'.encode(), data)
+            target.writestr(item, data)
+    return buffer.getvalue()
+
+
+class TestSpreadsheetValues(unittest.TestCase):
+    def test_json_value(self):
+        """测试单元格的值转换为 JSON 值"""
+        self.assertEqual(_json_value(datetime.datetime(2024, 1, 2, 3, 4)), '2024-01-02T03:04:00')
+        self.assertEqual(_json_value(1.5), 1.5)
+        self.assertIsNone(_json_value(None))
+        self.assertEqual(_trim((1, None, 2, None, None)), (1, None, 2))
+
+    def test_cell_change(self):
+        """测试单元格修改的校验"""
+        self.assertEqual(_cell_change({'sheet': 'a', 'row': -1, 'col': 0, 'value': 'x'}), ('a', -1, 0, 'x'))
+        self.assertEqual(_cell_change({'row': 0, 'col': 1}), (None, 0, 1, None))
+        self.assertEqual(_cell_change({'row': MAX_ROWS - 2, 'col': MAX_COLUMNS - 1}),
+                         (None, MAX_ROWS - 2, MAX_COLUMNS - 1, None))
+        for change in ({'row': -2, 'col': 0}, {'row': 0, 'col': True}, {'row': 0, 'col': 0, 'value': [1]}, 'a1',
+                       {'row': MAX_ROWS - 1, 'col': 0}, {'row': 0, 'col': MAX_COLUMNS}):
+            with self.assertRaises(ValueError):
+                _cell_change(change)
+
+    def test_formula_refs(self):
+        """测试解析公式引用的区域；易变函数、名称和结构化引用无法确定引用"""
+        self.assertEqual(_formula_refs("=SUM('My Sheet'!$A$1:B2, Data!C3, A:A, 2:2) + d4", 'data'), [
+            ('my sheet', (1, 1, 2, 2)), ('data', (3, 3, 3, 3)), ('data', (1, None, 1, None)),
+            ('data', (None, 2, None, 2)), ('data', (4, 4, 4, 4))
+        ])
+        for formula in ('=INDIRECT("A1")', '=_xlfn.RANDARRAY(2)', '=Rate*2', '=SUM(Table1[Col])',
+                        '=SUM(Sheet1:Sheet3!A1)', '=[1]Sheet1!A1', '=ZZZ1'):
+            self.assertIsNone(_formula_refs(formula, 'data'), formula)
+
+
+@unittest.skipIf(pa is None, '未安装 pyarrow')
+class TestArrowColumns(unittest.TestCase):
+    def test_consistent_type(self):
+        """测试类型一致的列保持原类型，空批次不影响类型"""
+        column = _concat_column([_column_chunk([1, 2]), _column_chunk([None]), _column_chunk([3])])
+        self.assertEqual(column.type, pa.int64())
+        self.assertEqual(column.to_pylist(), [1, 2, None, 3])
+
+    def test_mixed_numbers(self):
+        """测试整数和浮点数混合的列转为浮点数"""
+        column = _concat_column([_column_chunk([1]), _column_chunk([2.5])])
+        self.assertEqual(column.type, pa.float64())
+
+    def test_mixed_types(self):
+        """测试其他混合类型的列转为字符串，日期使用 ISO 格式"""
+        column = _concat_column([
+            _column_chunk([datetime.datetime(2024, 1, 1)]),
+            _column_chunk([1, 'a'])
+        ])
+        self.assertEqual(column.type, pa.string())
+        self.assertEqual(column.to_pylist(), ['2024-01-01T00:00:00', '1', 'a'])
+
+
+class SpreadsheetTestCase(AppTestCase):
+    config = {'PREVIEW_SANDBOX_ENABLED': False, 'EXCEL_PAGE_ROWS': 7}
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.service = SpreadsheetService()
+
+    def each_mode(self, check):
+        """分别使用 Arrow 和 JSON 分页两种方式读取并执行 check"""
+        modes = [('pages', None)]
+        if pa is not None:
+            modes.insert(0, ('arrow', pa))
+        for name, module in modes:
+            with self.subTest(mode=name), mock.patch.object(spreadsheet_service, 'pa', module):
+                check()
+
+
+class TestSpreadsheetRows(SpreadsheetTestCase):
+    """测试按行窗口读取工作表"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.data = [[i, f'name {i}', i * 1.5] for i in range(25)]
+        cls.other = [['a', None, 'c'], [None, None, None], ['b']]
+        content = workbook_bytes({'Data': [['id', 'name', 'score']] + cls.data, 'Other': [['x', 'y', 'z']] + cls.other})
+        cls.file = cls.upload('rows.xlsx', content)
+
+    def test_windows(self):
+        """测试 offset / limit 窗口跨越分页边界、到达末尾和超出末尾"""
+        def check():
+            window = self.service.get_rows(self.file, offset=5, limit=10)
+            self.assertEqual((window['sheet'], window['offset'], window['limit']), ('Data', 5, 10))
+            self.assertEqual(window['columns'], ['id', 'name', 'score'])
+            self.assertEqual(window['total_rows'], 25)
+            self.assertEqual(window['rows'], self.data[5:15])
+
+            self.assertEqual(self.service.get_rows(self.file, offset=20, limit=10)['rows'], self.data[20:])
+            self.assertEqual(self.service.get_rows(self.file, offset=25)['rows'], [])
+            self.assertEqual(self.service.get_rows(self.file, offset=100)['rows'], [])
+            self.assertEqual(self.service.get_rows(self.file)['rows'], self.data)
+        self.each_mode(check)
+
+    def test_sheet_selection(self):
+        """测试按名称选择工作表，空单元格为 None，行尾的空单元格被去掉"""
+        def check():
+            window = self.service.get_rows(self.file, sheet='Other')
+            self.assertEqual((window['sheet'], window['total_rows']), ('Other', 3))
+            self.assertEqual(window['columns'], ['x', 'y', 'z'])
+            self.assertEqual(window['rows'], self.other[:1] + [[], ['b']])
+        self.each_mode(check)
+
+    def test_unknown_sheet(self):
+        """测试工作表不存在时抛出 KeyError，接口返回 404"""
+        with self.assertRaises(KeyError):
+            self.service.get_rows(self.file, sheet='Missing')
+        share_code = ShareService().create_share(self.file.id, self.user_id).share_code
+        response = self.client.get(f'/api/files/{self.file.id}/excel/rows?sheet=Missing&shareCode={share_code}')
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(f'/api/files/{self.file.id}/excel/rows?offset=2&limit=3&shareCode={share_code}')
+        self.assertEqual(response.json['rows'], self.data[2:5])
+
+    def test_invalid_window(self):
+        """测试 offset 为负数、limit 超出范围时抛出 ValueError"""
+        for offset, limit in ((-1, 10), (0, 0), (0, 10 ** 6)):
+            with self.assertRaises(ValueError):
+                self.service.get_rows(self.file, offset=offset, limit=limit)
+
+
+
+class TestPatchCells(SpreadsheetTestCase):
+    """测试按单元格修改表格：版本冲突、工作表不存在、行列越界，以及公式缓存结果的保留"""
+
+    def setUp(self):
+        data = [['a', 'b', 'sum', 'double', 'sign']] + [
+            [i, i + 1, f'=A{i + 1}+B{i + 1}', f'=C{i + 1}*2', f'=IF(A{i + 1}>0,"pos","neg")'] for i in (1, 2, 3)
+        ]
+        content = workbook_bytes({'Data': data, 'Summary': [['total', 'count'], ['=SUM(Data!C2:C4)', '=COUNT(Data!A:A)']]})
+        self.file = self.upload('formulas.xlsx', with_results(content, {
+            1: {'C2': 3, 'D2': 6, 'E2': 'pos', 'C3': 5, 'D3': 10, 'E3': 'pos', 'C4': 7, 'D4': 14, 'E4': 'pos'},
+            2: {'A2': 15, 'B2': 3}
+        }))
+
+    def tearDown(self):
+        db.session.rollback()
+        for file in File.query.all():
+            self.client.delete(f'/api/files/{file.id}', headers=self.headers)
+        db.session.expire_all()
+
+    def patch(self, changes, headers=None):
+        share_code = ShareService().create_share(self.file.id, self.user_id, can_write=True).share_code
+        return self.client.patch(f'/api/files/{self.file.id}/excel/cells?shareCode={share_code}',
+                                 json={'changes': changes}, headers=headers)
+
+    def assert_unchanged(self, version):
+        db.session.expire_all()
+        self.assertEqual(FileService().content_version(db.session.get(File, self.file.id)), version)
+
+    def test_version_conflict(self):
+        """测试 If-Match 与当前版本不一致时返回 412 且不修改文件，一致时修改成功"""
+        version = FileService().content_version(self.file)
+        response = self.patch([{'row': 0, 'col': 0, 'value': 9}], headers={'If-Match': '"outdated"'})
+        self.assertEqual(response.status_code, 412)
+        self.assert_unchanged(version)
+
+        response = self.patch([{'row': 0, 'col': 0, 'value': 9}], headers={'If-Match': f'"{version}"'})
+        self.assertEqual(response.status_code, 200, response.json)
+        self.assertNotEqual(response.json['version'], version)
+        # 旧的 ETag 不能再次使用
+        response = self.patch([{'row': 0, 'col': 0, 'value': 8}], headers={'If-Match': f'"{version}"'})
+        self.assertEqual(response.status_code, 412)
+
+    def test_missing_sheet(self):
+        """测试工作表不存在时返回 404 且不修改文件"""
+        version = FileService().content_version(self.file)
+        response = self.patch([{'row': 0, 'col': 0, 'value': 1}, {'sheet': 'Missing', 'row': 0, 'col': 0, 'value': 1}])
+        self.assertEqual(response.status_code, 404)
+        self.assert_unchanged(version)
+
+    def test_out_of_range(self):
+        """测试行列号超出工作表范围时返回 400 且不修改文件"""
+        version = FileService().content_version(self.file)
+        for change in ({'row': MAX_ROWS - 1, 'col': 0}, {'row': 0, 'col': MAX_COLUMNS}, {'row': -2, 'col': 0}):
+            response = self.patch([{**change, 'value': 1}])
+            self.assertEqual(response.status_code, 400, change)
+        self.assert_unchanged(version)
+
+    def test_formula_results(self):
+        """测试修改后保留不受影响的公式的缓存结果，受影响的公式（包括跨工作表的引用）结果留空"""
+        response = self.patch([{'sheet': 'Data', 'row': 0, 'col': 1, 'value': 10}])
+        self.assertEqual(response.status_code, 200, response.json)
+        # C2、D2 依赖 B2，Summary!A2 依赖 C2
+        self.assertEqual((response.json['updated'], response.json['stale_formulas']), (1, 3))
+
+        db.session.expire_all()
+        file = db.session.get(File, self.file.id)
+
+        def check():
+            self.assertEqual(self.service.get_rows(file, sheet='Data')['rows'], [
+                [1, 10, None, None, 'pos'], [2, 3, 5, 10, 'pos'], [3, 4, 7, 14, 'pos']
+            ])
+            self.assertEqual(self.service.get_rows(file, sheet='Summary')['rows'], [[None, 3]])
+        self.each_mode(check)
+
+        # 公式本身保留
+        workbook = openpyxl.load_workbook(io.BytesIO(self.read(file)))
+        self.assertEqual((workbook['Data']['C2'].value, workbook['Summary']['A2'].value), ('=A2+B2', '=SUM(Data!C2:C4)'))
+
+    def test_new_formula(self):
+        """测试写入的新公式和覆盖掉的公式不保留旧的缓存结果"""
+        result = self.service.patch_cells(self.file, [
+            {'sheet': 'Data', 'row': 2, 'col': 2, 'value': '=A4*B4'},
+            {'sheet': 'Data', 'row': 1, 'col': 3, 'value': 0}
+        ])
+        # C4 为新公式，Summary!A2 依赖 C4；D3 被改为普通值
+        self.assertEqual(result, {'updated': 2, 'stale_formulas': 3})
+        self.assertEqual(self.service.get_rows(self.file, sheet='Data')['rows'], [
+            [1, 2, 3, 6, 'pos'], [2, 3, 5, 0, 'pos'], [3, 4, None, None, 'pos']
+        ])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import unittest
+import io
+import os
+import shutil
+import tempfile
+from app.storage.local import LocalStorage
+from app.utils.chunked_cipher import ChunkedCipher
+
+try:
+    import boto3
+    from moto import mock_aws
+except ImportError:
+    mock_aws = None
+
+KEY = b'0123456789abcdef0123456789abcdef'
+
+
+class StorageTests:
+    """各存储后端共用的测试"""
+
+    def test_write_and_read(self):
+        """测试写入后可以完整读取和随机读取"""
+        data = os.urandom(100000)
+        with self.storage.open_write('ab/cd/obj') as f:
+            f.write(data[:40000])
+            f.write(data[40000:])
+        self.assertTrue(self.storage.exists('ab/cd/obj'))
+        self.assertEqual(self.storage.size('ab/cd/obj'), len(data))
+
+        with self.storage.open_read('ab/cd/obj') as f:
+            self.assertEqual(f.read(), data)
+            f.seek(1000)
+            self.assertEqual(f.read(10), data[1000:1010])
+            f.seek(-5, 2)
+            self.assertEqual(f.read(), data[-5:])
+
+    def test_abort_discards_object(self):
+        """测试写入出错时对象不可见"""
+        with self.assertRaises(RuntimeError):
+            with self.storage.open_write('ab/cd/broken') as f:
+                f.write(b'partial')
+                raise RuntimeError('boom')
+        self.assertFalse(self.storage.exists('ab/cd/broken'))
+
+    def test_missing_and_delete(self):
+        """测试读取不存在的对象，以及删除可以重复执行"""
+        with self.assertRaises(FileNotFoundError):
+            self.storage.open_read('ab/cd/missing')
+        with self.storage.open_write('ab/cd/obj') as f:
+            f.write(b'x')
+        self.storage.delete('ab/cd/obj')
+        self.storage.delete('ab/cd/obj')
+        self.assertFalse(self.storage.exists('ab/cd/obj'))
+
+    def test_chunked_cipher_range(self):
+        """测试分块密文可以直接在存储后端上随机解密"""
+        cipher = ChunkedCipher(KEY)
+        data = os.urandom(300000)
+        with self.storage.open_write('ab/cd/cipher') as f:
+            cipher.encrypt_stream(io.BytesIO(data), f, chunk_size=65536)
+        with self.storage.open_read('ab/cd/cipher') as f:
+            self.assertEqual(b''.join(cipher.decrypt_stream(f, 70000, 200000)), data[70000:200000])
+
+
+class TestLocalStorage(StorageTests, unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.storage = LocalStorage(self.root)
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def test_rejects_path_traversal(self):
+        """测试存储键不能跳出根目录"""
+        with self.assertRaises(ValueError):
+            self.storage.open_read('../outside')
+
+
+@unittest.skipIf(mock_aws is None, '需要安装 boto3 和 moto')
+class TestS3Storage(StorageTests, unittest.TestCase):
+    def setUp(self):
+        from app.storage.s3 import S3Storage
+        self.mock = mock_aws()
+        self.mock.start()
+        client = boto3.client('s3', region_name='us-east-1')
+        client.create_bucket(Bucket='test-bucket')
+        self.client = client
+        self.storage = S3Storage('test-bucket', prefix='blobs/', part_size=5 * 1024 * 1024, client=client)
+
+    def tearDown(self):
+        self.mock.stop()
+
+    def test_multipart_upload(self):
+        """测试超过分段大小的对象使用分段上传"""
+        data = os.urandom(11 * 1024 * 1024)
+        with self.storage.open_write('ab/cd/large') as f:
+            for i in range(0, len(data), 1024 * 1024):
+                f.write(data[i:i + 1024 * 1024])
+        with self.storage.open_read('ab/cd/large') as f:
+            f.seek(6 * 1024 * 1024 - 3)
+            self.assertEqual(f.read(6), data[6 * 1024 * 1024 - 3:6 * 1024 * 1024 + 3])
+        head = self.client.head_object(Bucket='test-bucket', Key='blobs/ab/cd/large')
+        self.assertTrue(head['ETag'].strip('"').endswith('-3'))
+
+    def test_abort_multipart_upload(self):
+        """测试分段上传出错时放弃未完成的上传"""
+        with self.assertRaises(RuntimeError):
+            with self.storage.open_write('ab/cd/broken') as f:
+                f.write(os.urandom(6 * 1024 * 1024))
+                raise RuntimeError('boom')
+        uploads = self.client.list_multipart_uploads(Bucket='test-bucket')
+        self.assertEqual(uploads.get('Uploads', []), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import unittest
+from app.services.text_service import _iter_lines, _count
+from app.utils.encoding import detect_encoding
+
+
+class TestTextLines(unittest.TestCase):
+    def test_detect_encoding(self):
+        """测试按 BOM 和样本内容识别编码"""
+        self.assertEqual(detect_encoding('中文'.encode('utf-8')), ('utf-8', 0))
+        self.assertEqual(detect_encoding(b'\xef\xbb\xbfabc'), ('utf-8', 3))
+        self.assertEqual(detect_encoding('﻿ab'.encode('utf-16-le')), ('utf-16-le', 2))
+        # 样本末尾截断的多字节字符不影响识别
+        self.assertEqual(detect_encoding('中文'.encode('utf-8')[:-1]), ('utf-8', 0))
+        self.assertEqual(detect_encoding('这是一段中文文本，用于测试编码识别。'.encode('gb18030'))[1], 0)
+
+    def test_detect_short_gbk(self):
+        """测试短的 GBK 文本识别为 GB18030，而不是 cp949 等编码"""
+        for text in ('你好，世界\n', '日志 2024-01-01 错误 连接超时\n'):
+            sample = text.encode('gbk')
+            encoding, bom = detect_encoding(sample)
+            self.assertEqual((encoding, bom), ('gb18030', 0))
+            self.assertEqual(sample.decode(encoding), text)
+        # 不能按 GB18030 解码的样本仍交给 charset_normalizer
+        self.assertEqual(detect_encoding('Привет мир, это тест\n'.encode('cp1251'))[0], 'cp1251')
+
+    def test_iter_lines(self):
+        """测试跨块分行、去掉 \\r、截断超长行和没有换行符的最后一行"""
+        chunks = [b'ab\r', b'\ncd', b'efgh\n\n', b'\xe4\xb8', b'\xad']
+        self.assertEqual(list(_iter_lines(chunks, 'utf-8', 3)), [
+            ('ab', False), ('cde', True), ('', False), ('中', False)
+        ])
+
+    def test_count_aligned(self):
+        """测试 UTF-16 只统计与字符边界对齐的换行符"""
+        data = '\u0100\u0a01\n'.encode('utf-16-be')  # 01 00 0a 01 00 0a，偏移 1 处的 00 0a 不是换行符
+        self.assertEqual(_count(data, '\n'.encode('utf-16-be'), 0, len(data), 0), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
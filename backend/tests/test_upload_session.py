@@ -0,0 +1,124 @@
+import hashlib
+import os
+import unittest
+from tests.app_case import AppTestCase
+from config import Config
+from app import db
+from app.models.blob import Blob
+from app.models.file import File
+from app.models.upload_session import UploadSession
+
+CHUNK_SIZE = 1024
+
+
+class TestUploadSession(AppTestCase):
+    """测试分片上传会话：乱序上传、缺失分片、分片大小和提交时的哈希校验"""
+
+    config = {'UPLOAD_SESSION_CHUNK_SIZE': CHUNK_SIZE}
+
+    def tearDown(self):
+        db.session.rollback()
+        for file in File.query.all():
+            self.client.delete(f'/api/files/{file.id}', headers=self.headers)
+        db.session.expire_all()
+
+    def create(self, filename, size, content_hash=None):
+        body = {'filename': filename, 'size': size}
+        if content_hash:
+            body['hash'] = content_hash
+        response = self.client.post('/api/files/uploads', json=body, headers=self.headers)
+        self.assertEqual(response.status_code, 201, response.json)
+        return response.json
+
+    def put(self, session_id, index, data):
+        return self.client.put(f'/api/files/uploads/{session_id}/chunks/{index}', data=data, headers=self.headers)
+
+    def commit(self, session_id):
+        return self.client.post(f'/api/files/uploads/{session_id}/commit', headers=self.headers)
+
+    def chunks(self, data):
+        return [data[i:i + CHUNK_SIZE] for i in range(0, len(data), CHUNK_SIZE)]
+
+    def test_out_of_order(self):
+        """测试分片乱序、重复上传后提交，内容与原文件一致"""
+        data = os.urandom(CHUNK_SIZE * 3 + 100)
+        session = self.create('parts.bin', len(data), hashlib.sha256(data).hexdigest())
+        self.assertEqual((session['total_chunks'], session['missing']), (4, [0, 1, 2, 3]))
+
+        chunks = self.chunks(data)
+        for index in (3, 1, 0, 1, 2):
+            self.assertEqual(self.put(session['session_id'], index, chunks[index]).status_code, 200)
+        response = self.client.get(f"/api/files/uploads/{session['session_id']}", headers=self.headers)
+        self.assertEqual((response.json['received'], response.json['missing']), ([0, 1, 2, 3], []))
+
+        response = self.commit(session['session_id'])
+        self.assertEqual(response.status_code, 200, response.json)
+        self.assertEqual(response.json['file']['file_size'], len(data))
+        file = db.session.get(File, response.json['file']['id'])
+        self.assertEqual(self.read(file), data)
+        self.assertIsNone(db.session.get(UploadSession, session['session_id']))
+        self.assertFalse(os.path.exists(os.path.join(Config.TEMP_FOLDER, 'upload_sessions', session['session_id'])))
+
+    def test_missing_part(self):
+        """测试缺少分片时拒绝提交，补齐后可以提交"""
+        data = os.urandom(CHUNK_SIZE * 2)
+        session = self.create('missing.bin', len(data))
+        chunks = self.chunks(data)
+        self.put(session['session_id'], 1, chunks[1])
+
+        response = self.commit(session['session_id'])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(File.query.count(), 0)
+
+        self.put(session['session_id'], 0, chunks[0])
+        self.assertEqual(self.commit(session['session_id']).status_code, 200)
+
+    def test_part_size(self):
+        """测试分片超出或不足预期大小、序号越界时返回 400，且不留下分片"""
+        session = self.create('size.bin', CHUNK_SIZE + 10)
+        session_id = session['session_id']
+        self.assertEqual(self.put(session_id, 0, b'x' * (CHUNK_SIZE + 1)).status_code, 400)
+        self.assertEqual(self.put(session_id, 1, b'x' * 11).status_code, 400)
+        self.assertEqual(self.put(session_id, 1, b'x' * 9).status_code, 400)
+        self.assertEqual(self.put(session_id, 2, b'x').status_code, 400)
+        self.assertEqual(os.listdir(os.path.join(Config.TEMP_FOLDER, 'upload_sessions', session_id)), [])
+
+        response = self.client.post('/api/files/uploads', headers=self.headers,
+                                    json={'filename': 'huge.bin', 'size': Config.UPLOAD_SESSION_MAX_SIZE + 1})
+        self.assertEqual(response.status_code, 400)
+
+    def test_hash_mismatch(self):
+        """测试提交时明文哈希不符返回 409，不创建文件、不留下 blob，会话可以重新上传后提交"""
+        data = os.urandom(CHUNK_SIZE + 1)
+        session = self.create('hash.bin', len(data), hashlib.sha256(data).hexdigest())
+        chunks = self.chunks(data)
+        self.put(session['session_id'], 0, chunks[0])
+        self.put(session['session_id'], 1, b'y')
+
+        response = self.commit(session['session_id'])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual((File.query.count(), Blob.query.count()), (0, 0))
+        db.session.expire_all()
+        self.assertEqual(db.session.get(UploadSession, session['session_id']).status, 'active')
+
+        self.put(session['session_id'], 1, chunks[1])
+        self.assertEqual(self.commit(session['session_id']).status_code, 200)
+
+    def test_zero_bytes(self):
+        """测试空文件：一个长度为 0 的分片"""
+        session = self.create('empty.txt', 0, hashlib.sha256(b'').hexdigest())
+        self.assertEqual(session['total_chunks'], 1)
+        self.assertEqual(self.put(session['session_id'], 0, b'').status_code, 200)
+
+        response = self.commit(session['session_id'])
+        self.assertEqual(response.status_code, 200, response.json)
+        self.assertEqual(response.json['file']['file_size'], 0)
+        self.assertEqual(self.read(db.session.get(File, response.json['file']['id'])), b'')
+
+    def test_large_file_size(self):
+        """测试文件大小列可以保存超过 2GB 的值"""
+        self.assertIsInstance(File.__table__.c.file_size.type, db.BigInteger)
+
+
+if __name__ == '__main__':
+    unittest.main()